@@ -29,6 +29,7 @@ async def get_portfolios(
     limit: int = Query(50, ge=1, le=1000, description="Number of portfolios to return"),
     user_id: Optional[int] = Query(None, description="Filter by user ID"),
     portfolio_type: Optional[str] = Query(None, description="Filter by portfolio type"),
+    after_id: Optional[int] = Query(None, ge=0, description="Return portfolios after this ID (keyset cursor; overrides skip)"),
     db: Session = Depends(get_db)
 ):
     """Get all portfolios with optional filtering."""
@@ -38,14 +39,16 @@ async def get_portfolios(
             skip=skip,
             limit=limit,
             user_id=user_id,
-            portfolio_type=portfolio_type
+            portfolio_type=portfolio_type,
+            after_id=after_id
         )
         
         return PortfolioListResponse(
             data=portfolios,
             total=total,
-            page=skip // limit + 1,
-            per_page=limit
+            page=skip // limit + 1 if after_id is None else 1,
+            per_page=limit,
+            next_cursor=portfolios[-1].id if len(portfolios) == limit else None
         )
     except Exception as e:
         logger.error("Error fetching portfolios", error=str(e))
@@ -35,6 +35,18 @@ class Settings(BaseSettings):
         default="sqlite:///./portfolio_manager.db",
         description="Database connection URL"
     )
+    DB_QUERY_CACHE_SIZE: int = Field(
+        default=1200,
+        description="Number of compiled SQL statements SQLAlchemy keeps per engine"
+    )
+    DB_POOL_SIZE: int = Field(
+        default=20,
+        description="Persistent connections kept in the engine pool (server databases)"
+    )
+    DB_MAX_OVERFLOW: int = Field(
+        default=10,
+        description="Extra connections the pool may open under load (server databases)"
+    )
     
     # Security settings
     SECRET_KEY: str = Field(
@@ -57,6 +69,10 @@ class Settings(BaseSettings):
     # Application settings
     DEBUG: bool = Field(default=False, description="Debug mode")
     TESTING: bool = Field(default=False, description="Testing mode")
+    DEBUG_RAISELOAD: bool = Field(
+        default=False,
+        description="Raise on unplanned relationship lazy loads in portfolio reads (staging/tests)"
+    )
     
     # Pagination settings
     DEFAULT_PAGE_SIZE: int = 50
@@ -6,11 +6,21 @@ import os
 
 from app.core.config import settings
 
+if settings.DATABASE_URL.startswith("sqlite"):
+    # Sessions are handed to worker threads (see PortfolioService), so SQLite connections
+    # must not be pinned to the thread that opened them
+    engine_options = {"connect_args": {"check_same_thread": False}}
+else:
+    # Sized so request handlers and the background task fan-out share warm connections
+    engine_options = {"pool_size": settings.DB_POOL_SIZE, "max_overflow": settings.DB_MAX_OVERFLOW}
+
 # Create database engine
 engine = create_engine(
     settings.DATABASE_URL,
+    **engine_options,
     pool_pre_ping=True,
     pool_recycle=300,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE,
     echo=settings.DEBUG,
 )
 
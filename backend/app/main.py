@@ -7,6 +7,7 @@ from pydantic import ValidationError
 
 from app.core.config import settings
 from app.core.database import init_db
+from app.services.market_data_service import init_redis_pool, close_market_data_resources
 from app.api.v1.api import api_router
 from app.utils.exceptions import (
     APIException,
@@ -50,10 +51,14 @@ async def lifespan(app: FastAPI):
         logger.error("Failed to initialize database", error=str(e))
         raise
     
+    # Shared Redis pool for market data caching
+    init_redis_pool()
+    
     yield
     
     # Shutdown logic here
     logger.info("Portfolio Manager API shutting down...")
+    await close_market_data_resources()
 
 
 def create_application() -> FastAPI:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, Enum as SQLEnum, DECIMAL, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, Enum as SQLEnum, DECIMAL, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from enum import Enum
 
@@ -36,6 +36,19 @@ class Portfolio(BaseModel):
     transactions = relationship("Transaction", back_populates="portfolio", cascade="all, delete-orphan")
     holdings = relationship("PortfolioHolding", back_populates="portfolio", cascade="all, delete-orphan")
     
+    # Indexes
+    __table_args__ = (
+        # Filtered listings seek by id within (user_id, portfolio_type)
+        Index('ix_portfolio_user_type_id', user_id, portfolio_type, 'id'),
+        # Background tasks only scan active portfolios
+        Index(
+            'ix_portfolio_active_id',
+            'id',
+            postgresql_where=is_active.is_(True),
+            sqlite_where=is_active.is_(True)
+        ),
+    )
+    
     def __repr__(self):
         return f"<Portfolio(name={self.name}, user_id={self.user_id})>"
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DECIMAL, Date, ForeignKey
+from sqlalchemy import Column, Integer, DECIMAL, Date, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from .base import BaseModel
@@ -20,5 +20,11 @@ class PortfolioHistory(BaseModel):
     # Relationships
     portfolio = relationship("Portfolio")
     
+    # Constraints
+    __table_args__ = (
+        # One snapshot per portfolio per day; also serves (portfolio_id, date) lookups
+        UniqueConstraint('portfolio_id', 'date', name='uix_portfolio_history_date'),
+    )
+    
     def __repr__(self):
         return f"<PortfolioHistory(portfolio_id={self.portfolio_id}, date={self.date}, value={self.value})>"
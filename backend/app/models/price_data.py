@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, DECIMAL, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, DateTime, DECIMAL, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 
 from .base import BaseModel
@@ -24,6 +24,13 @@ class PriceData(BaseModel):
     # Constraints
     __table_args__ = (
         UniqueConstraint('asset_id', 'date', name='uix_asset_date'),
+        # Latest-price lookups read this index only (INCLUDE is applied on PostgreSQL)
+        Index(
+            'ix_price_data_asset_date_desc',
+            asset_id,
+            date.desc(),
+            postgresql_include=['close_price']
+        ),
     )
     
     def __repr__(self):
@@ -92,4 +92,5 @@ class PortfolioListResponse(BaseSchema):
     total: int
     page: int = 1
     per_page: int = 50
+    next_cursor: Optional[int] = None
     message: Optional[str] = None
@@ -5,6 +5,7 @@ Provides enhanced chart data and visualization capabilities using Plotly and adv
 
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
@@ -477,6 +478,26 @@ class AdvancedVisualizationService:
         rolling_sharpe = (rolling_mean / rolling_std) * np.sqrt(252)
         return rolling_sharpe.dropna().tolist()
     
+    @staticmethod
+    def _rolling_window_stats(
+        portfolio_returns: List[float],
+        benchmark_returns: List[float],
+        window: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per-window beta and means for every full window, over strided views"""
+        p_windows = sliding_window_view(np.asarray(portfolio_returns, dtype=np.float64), window)
+        b_windows = sliding_window_view(np.asarray(benchmark_returns, dtype=np.float64), window)
+        p_means = p_windows.mean(axis=1)
+        b_means = b_windows.mean(axis=1)
+        p_dev = p_windows - p_means[:, None]
+        b_dev = b_windows - b_means[:, None]
+        
+        # Sample covariance over population variance, as np.cov / np.var per window
+        covariance = np.einsum('ij,ij->i', p_dev, b_dev) / (window - 1)
+        variance = np.einsum('ij,ij->i', b_dev, b_dev) / window
+        beta = np.divide(covariance, variance, out=np.zeros_like(covariance), where=variance != 0)
+        return beta, p_means, b_means
+    
     def _calculate_rolling_beta(
         self, 
         portfolio_returns: List[float], 
@@ -484,22 +505,11 @@ class AdvancedVisualizationService:
         window: int
     ) -> List[float]:
         """Calculate rolling beta"""
-        df = pd.DataFrame({
-            'portfolio': portfolio_returns,
-            'benchmark': benchmark_returns
-        })
-        
-        rolling_beta = []
-        for i in range(window - 1, len(df)):
-            p_slice = df['portfolio'].iloc[i-window+1:i+1]
-            b_slice = df['benchmark'].iloc[i-window+1:i+1]
-            
-            covariance = np.cov(p_slice, b_slice)[0][1]
-            variance = np.var(b_slice)
-            beta = covariance / variance if variance != 0 else 0
-            rolling_beta.append(beta)
+        if len(portfolio_returns) < window:
+            return []
         
-        return rolling_beta
+        beta, _, _ = self._rolling_window_stats(portfolio_returns, benchmark_returns, window)
+        return beta.tolist()
     
     def _calculate_rolling_alpha(
         self,
@@ -509,30 +519,15 @@ class AdvancedVisualizationService:
         risk_free_rate: float = 0.02
     ) -> List[float]:
         """Calculate rolling alpha"""
-        df = pd.DataFrame({
-            'portfolio': portfolio_returns,
-            'benchmark': benchmark_returns
-        })
+        if len(portfolio_returns) < window:
+            return []
         
-        rolling_alpha = []
         daily_rf = risk_free_rate / 252
+        beta, p_means, b_means = self._rolling_window_stats(portfolio_returns, benchmark_returns, window)
         
-        for i in range(window - 1, len(df)):
-            p_slice = df['portfolio'].iloc[i-window+1:i+1]
-            b_slice = df['benchmark'].iloc[i-window+1:i+1]
-            
-            # Calculate beta for this window
-            covariance = np.cov(p_slice, b_slice)[0][1]
-            variance = np.var(b_slice)
-            beta = covariance / variance if variance != 0 else 0
-            
-            # Calculate alpha
-            portfolio_excess = np.mean(p_slice) - daily_rf
-            benchmark_excess = np.mean(b_slice) - daily_rf
-            alpha = portfolio_excess - beta * benchmark_excess
-            rolling_alpha.append(alpha * 252)  # Annualize
-        
-        return rolling_alpha
+        # Calculate alpha
+        alpha = (p_means - daily_rf) - beta * (b_means - daily_rf)
+        return (alpha * 252).tolist()  # Annualize
     
     def _calculate_rolling_correlation(
         self,
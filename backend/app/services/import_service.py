@@ -4,11 +4,19 @@ Import service for handling portfolio and asset data imports.
 
 from typing import Dict, List, Optional, Any
 from sqlalchemy.orm import Session
+from sqlalchemy import update
 from decimal import Decimal
 from datetime import datetime
 import csv
 import io
+import re
 import structlog
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+    pacsv = None
 
 from app.models import Portfolio as PortfolioModel, Asset as AssetModel, PortfolioHolding
 from app.schemas import PortfolioCreate, Portfolio
@@ -17,6 +25,11 @@ from app.services.asset_service import AssetService
 
 logger = structlog.get_logger()
 
+_VALID_TX_TYPES = frozenset({'buy', 'sell', 'dividend', 'split'})
+# Only rules out shapes strptime('%Y-%m-%d') would reject too; it still does the real parse
+_DATE_RE = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}$')
+_ARROW_PARSE_THRESHOLD = 1024 * 1024
+
 
 class ImportService:
     """Service for importing portfolio and asset data."""
@@ -62,47 +75,52 @@ class ImportService:
             
             # Process holdings
             total_initial_value = Decimal('0')
-            created_holdings = []
+            current_value = Decimal('0')
             
             for holding_data in holdings_data:
                 # Create or get asset
                 asset = await self._create_or_get_asset(holding_data)
                 
+                quantity = Decimal(str(holding_data['quantity']))
+                average_cost = Decimal(str(holding_data['average_cost']))
+                current_price = Decimal(str(holding_data.get('current_price', holding_data['average_cost'])))
+                market_value = quantity * current_price
+                
                 # Create holding
                 holding = PortfolioHolding(
                     portfolio_id=portfolio.id,
                     asset_id=asset.id,
-                    quantity=Decimal(str(holding_data['quantity'])),
-                    average_cost=Decimal(str(holding_data['average_cost'])),
-                    current_price=Decimal(str(holding_data.get('current_price', holding_data['average_cost']))),
-                    market_value=Decimal(str(holding_data['quantity'])) * Decimal(str(holding_data.get('current_price', holding_data['average_cost']))),
+                    quantity=quantity,
+                    average_cost=average_cost,
+                    current_price=current_price,
+                    market_value=market_value,
                     unrealized_gain_loss=Decimal('0'),  # Will be calculated
                     unrealized_gain_loss_percentage=Decimal('0')  # Will be calculated
                 )
                 
                 self.db.add(holding)
-                created_holdings.append(holding)
                 
-                # Add to initial value
-                cost_basis = holding.quantity * holding.average_cost
-                total_initial_value += cost_basis
+                # Accumulate portfolio totals
+                total_initial_value += quantity * average_cost
+                current_value += market_value
             
             # Update portfolio initial value
-            portfolio_model = self.db.query(PortfolioModel).filter(
-                PortfolioModel.id == portfolio.id
-            ).first()
-            
-            if portfolio_model:
-                portfolio_model.initial_value = total_initial_value
-                portfolio_model.current_value = sum(h.market_value for h in created_holdings)
-                portfolio_model.total_return = portfolio_model.current_value - portfolio_model.initial_value
-                
-                if portfolio_model.initial_value > 0:
-                    portfolio_model.total_return_percentage = (
-                        portfolio_model.total_return / portfolio_model.initial_value
-                    ) * 100
-                else:
-                    portfolio_model.total_return_percentage = Decimal('0')
+            total_return = current_value - total_initial_value
+            total_return_percentage = (
+                (total_return / total_initial_value) * 100
+                if total_initial_value > 0 else Decimal('0')
+            )
+            
+            self.db.execute(
+                update(PortfolioModel)
+                .where(PortfolioModel.id == portfolio.id)
+                .values(
+                    initial_value=total_initial_value,
+                    current_value=current_value,
+                    total_return=total_return,
+                    total_return_percentage=total_return_percentage
+                )
+            )
             
             self.db.commit()
             
@@ -112,7 +130,7 @@ class ImportService:
             logger.info(
                 "Portfolio imported successfully",
                 portfolio_id=portfolio.id,
-                holdings_count=len(created_holdings),
+                holdings_count=len(holdings_data),
                 initial_value=float(total_initial_value)
             )
             
@@ -126,6 +144,13 @@ class ImportService:
     def _parse_csv_data(self, csv_data: str) -> List[Dict[str, Any]]:
         """Parse CSV data into list of dictionaries."""
         try:
+            if pacsv is not None and len(csv_data) > _ARROW_PARSE_THRESHOLD:
+                try:
+                    return self._parse_csv_data_arrow(csv_data)
+                except pa.ArrowInvalid:
+                    # Ragged rows; the stdlib reader keeps them so validation can report each one
+                    pass
+            
             reader = csv.DictReader(io.StringIO(csv_data))
             holdings = []
             
@@ -144,6 +169,27 @@ class ImportService:
             logger.error("Error parsing CSV data", error=str(e))
             raise ValueError(f"Failed to parse CSV data: {str(e)}")
     
+    def _parse_csv_data_arrow(self, csv_data: str) -> List[Dict[str, Any]]:
+        """Parse large CSV payloads with pyarrow's multi-threaded reader."""
+        header = next(csv.reader(io.StringIO(csv_data.split('\n', 1)[0])))
+        clean_keys = [key.strip().lower().replace(' ', '_') for key in header]
+        
+        # Read every column as text so rows match the csv.DictReader path
+        table = pacsv.read_csv(
+            io.BytesIO(csv_data.encode()),
+            read_options=pacsv.ReadOptions(column_names=clean_keys, skip_rows=1),
+            convert_options=pacsv.ConvertOptions(
+                column_types={key: pa.string() for key in clean_keys},
+                strings_can_be_null=False
+            )
+        )
+        
+        columns = [
+            [value.strip() for value in table.column(i).to_pylist()]
+            for i in range(table.num_columns)
+        ]
+        return [dict(zip(clean_keys, row)) for row in zip(*columns)]
+    
     def _validate_holdings_data(self, holdings_data: List[Dict[str, Any]]) -> List[str]:
         """Validate holdings data and return list of errors."""
         errors = []
@@ -224,22 +270,23 @@ class ImportService:
                 'asset_type', 'sector'
             ]
             
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for holding in holdings:
-                writer.writerow({
-                    'symbol': holding['asset_symbol'],
-                    'name': holding['asset_name'],
-                    'quantity': holding['quantity'],
-                    'average_cost': holding['average_cost'],
-                    'current_price': holding['current_price'],
-                    'market_value': holding['market_value'],
-                    'unrealized_gain_loss': holding['unrealized_gain_loss'],
-                    'unrealized_gain_loss_percentage': holding['unrealized_gain_loss_percentage'],
-                    'asset_type': holding['asset_type'],
-                    'sector': holding['sector']
-                })
+            writer = csv.writer(output)
+            writer.writerow(fieldnames)
+            writer.writerows(
+                (
+                    holding['asset_symbol'],
+                    holding['asset_name'],
+                    holding['quantity'],
+                    holding['average_cost'],
+                    holding['current_price'],
+                    holding['market_value'],
+                    holding['unrealized_gain_loss'],
+                    holding['unrealized_gain_loss_percentage'],
+                    holding['asset_type'],
+                    holding['sector']
+                )
+                for holding in holdings
+            )
             
             return output.getvalue()
             
@@ -293,7 +340,6 @@ class ImportService:
         """Validate transaction data and return list of errors."""
         errors = []
         required_fields = ['symbol', 'type', 'quantity', 'price', 'date']
-        valid_types = ['buy', 'sell', 'dividend', 'split']
         
         for i, transaction in enumerate(transactions_data):
             row_num = i + 1
@@ -304,9 +350,9 @@ class ImportService:
                     errors.append(f"Row {row_num}: Missing {field}")
             
             # Validate transaction type
-            if 'type' in transaction and transaction['type']:
-                if transaction['type'].lower() not in valid_types:
-                    errors.append(f"Row {row_num}: Invalid transaction type")
+            tx_type = transaction.get('type')
+            if tx_type and tx_type.lower() not in _VALID_TX_TYPES:
+                errors.append(f"Row {row_num}: Invalid transaction type")
             
             # Validate numeric fields
             for field in ['quantity', 'price']:
@@ -319,10 +365,15 @@ class ImportService:
                         errors.append(f"Row {row_num}: Invalid {field} value")
             
             # Validate date
-            if 'date' in transaction and transaction['date']:
-                try:
-                    datetime.strptime(transaction['date'], '%Y-%m-%d')
-                except ValueError:
+            tx_date = transaction.get('date')
+            if tx_date:
+                # Cheap shape check before the full strptime parse
+                if not _DATE_RE.match(tx_date):
                     errors.append(f"Row {row_num}: Invalid date format (use YYYY-MM-DD)")
+                else:
+                    try:
+                        datetime.strptime(tx_date, '%Y-%m-%d')
+                    except ValueError:
+                        errors.append(f"Row {row_num}: Invalid date format (use YYYY-MM-DD)")
         
         return errors
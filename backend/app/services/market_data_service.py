@@ -1,12 +1,13 @@
-import yfinance as yf
-import pandas as pd
+import aiohttp
+import numpy as np
 import asyncio
 import redis.asyncio as redis
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from decimal import Decimal
-import json
+import orjson
 import structlog
+import zstandard
 from asyncio_throttle import Throttler
 from contextlib import asynccontextmanager
 
@@ -31,76 +32,133 @@ class MarketDataProvider:
     async def get_multiple_price_data(self, symbols: List[str], period: str = "1d") -> Dict[str, Dict[str, Any]]:
         """Get price data for multiple symbols."""
         raise NotImplementedError
+    
+    async def close(self):
+        """Release any resources held by the provider."""
+        pass
 
 
 class YahooFinanceProvider(MarketDataProvider):
-    """Yahoo Finance data provider using yfinance."""
+    """Yahoo Finance data provider using the v8 chart API over aiohttp."""
+    
+    CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
     
     def __init__(self):
         super().__init__()
         self.valid_periods = ["1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "ytd", "max"]
         self.valid_intervals = ["1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h", "1d", "5d", "1wk", "1mo", "3mo"]
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get the pooled HTTP session, creating it on first use inside the event loop."""
+        loop = asyncio.get_running_loop()
+        # Worker tasks run on short-lived loops; a session bound to another loop is unusable
+        if self._session_loop is not loop:
+            await self._close_stale_session()
+        if self._session is None or self._session.closed:
+            self._session_loop = loop
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20),
+                timeout=aiohttp.ClientTimeout(total=settings.MARKET_DATA_TIMEOUT),
+                headers={"User-Agent": "Mozilla/5.0"}
+            )
+        return self._session
+    
+    async def _close_stale_session(self):
+        """Close a session left behind by another event loop before replacing it."""
+        session, loop = self._session, self._session_loop
+        self._session = None
+        self._session_loop = None
+        if session is None or session.closed:
+            return
+        if loop is None or loop.is_closed():
+            # The loop took its transports down with it; this just marks the session closed
+            await session.close()
+        elif loop.is_running():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop))
+        else:
+            # Idle loop: drive it once on a helper thread so its connections close cleanly
+            await asyncio.to_thread(loop.run_until_complete, session.close())
+    
+    async def close(self):
+        """Close the pooled HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
     
     async def get_price_data(self, symbol: str, period: str = "1d", interval: str = "1d") -> Dict[str, Any]:
         """Get price data for a single symbol."""
         async with self.throttler:
             try:
-                # Run yfinance in thread pool to avoid blocking
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(
-                    None, 
-                    self._fetch_yahoo_data, 
-                    symbol, 
-                    period, 
-                    interval
-                )
-                return result
+                payload = await self._fetch(symbol, period, interval)
+                return self._parse_chart(symbol, period, interval, payload)
             except Exception as e:
                 logger.error("Error fetching Yahoo Finance data", symbol=symbol, error=str(e))
                 raise
     
-    def _fetch_yahoo_data(self, symbol: str, period: str, interval: str) -> Dict[str, Any]:
-        """Fetch data from Yahoo Finance (blocking operation)."""
-        try:
-            ticker = yf.Ticker(symbol)
-            
-            # Get historical data
-            hist = ticker.history(period=period, interval=interval)
-            
-            if hist.empty:
+    async def _fetch(self, symbol: str, period: str, interval: str) -> Dict[str, Any]:
+        """Fetch the raw chart payload for a symbol."""
+        session = await self._get_session()
+        async with session.get(
+            self.CHART_URL.format(symbol=symbol),
+            params={"range": period, "interval": interval}
+        ) as response:
+            if response.status == 404:
                 raise ValueError(f"No data found for symbol {symbol}")
-            
-            # Get latest info
-            info = {}
-            try:
-                info = ticker.info
-            except Exception as e:
-                logger.warning("Could not fetch ticker info", symbol=symbol, error=str(e))
-            
-            # Convert to our format
-            price_data = []
-            for date, row in hist.iterrows():
-                price_data.append({
-                    "date": date.isoformat(),
-                    "open": float(row["Open"]) if not pd.isna(row["Open"]) else None,
-                    "high": float(row["High"]) if not pd.isna(row["High"]) else None,
-                    "low": float(row["Low"]) if not pd.isna(row["Low"]) else None,
-                    "close": float(row["Close"]) if not pd.isna(row["Close"]) else None,
-                    "volume": int(row["Volume"]) if not pd.isna(row["Volume"]) else None,
-                })
-            
-            return {
-                "symbol": symbol,
-                "period": period,
-                "interval": interval,
-                "data": price_data,
-                "info": info,
-                "fetched_at": datetime.utcnow().isoformat()
-            }
-            
-        except Exception as e:
-            logger.error("Yahoo Finance fetch error", symbol=symbol, error=str(e))
-            raise
+            response.raise_for_status()
+            return await response.json()
+    
+    def _parse_chart(self, symbol: str, period: str, interval: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a v8 chart payload to our price data format."""
+        chart = payload.get("chart") or {}
+        if chart.get("error"):
+            raise ValueError(f"Yahoo Finance error for {symbol}: {chart['error'].get('description')}")
+        
+        results = chart.get("result") or []
+        if not results or not results[0].get("timestamp"):
+            raise ValueError(f"No data found for symbol {symbol}")
+        
+        result = results[0]
+        meta = result.get("meta") or {}
+        quote = (result.get("indicators", {}).get("quote") or [{}])[0]
+        
+        # Timestamps are epoch seconds; shift to exchange-local time in one pass
+        timestamps = np.asarray(result["timestamp"], dtype=np.int64) + int(meta.get("gmtoffset") or 0)
+        dates = np.datetime_as_string(timestamps.astype("datetime64[s]"), unit="s").tolist()
+        n = len(dates)
+        
+        opens = self._column(quote.get("open"), n)
+        highs = self._column(quote.get("high"), n)
+        lows = self._column(quote.get("low"), n)
+        closes = self._column(quote.get("close"), n)
+        volumes = self._column(quote.get("volume"), n, as_int=True)
+        
+        price_data = [
+            {"date": d, "open": o, "high": h, "low": l, "close": c, "volume": v}
+            for d, o, h, l, c, v in zip(dates, opens, highs, lows, closes, volumes)
+        ]
+        
+        return {
+            "symbol": symbol,
+            "period": period,
+            "interval": interval,
+            "data": price_data,
+            "info": meta,
+            "fetched_at": datetime.utcnow().isoformat()
+        }
+    
+    @staticmethod
+    def _column(values: Optional[List[Any]], n: int, as_int: bool = False) -> List[Any]:
+        """Convert a chart quote column to a list with None for missing values."""
+        arr = np.asarray(values if values is not None else [None] * n, dtype=np.float64)
+        missing = np.isnan(arr)
+        column = arr.astype(object)
+        column[missing] = None
+        if as_int:
+            column[~missing] = arr[~missing].astype(np.int64)
+        return column.tolist()
     
     async def get_multiple_price_data(self, symbols: List[str], period: str = "1d") -> Dict[str, Dict[str, Any]]:
         """Get price data for multiple symbols."""
@@ -120,18 +178,55 @@ class YahooFinanceProvider(MarketDataProvider):
         return results
 
 
+# Shared across the process so the rate limit is global and HTTP connections are reused
+_YAHOO_PROVIDER = YahooFinanceProvider()
+
+_redis_pool: Optional[redis.ConnectionPool] = None
+
+
+def init_redis_pool(redis_url: Optional[str] = None) -> redis.ConnectionPool:
+    """Create the process-wide Redis connection pool used by CacheManager."""
+    global _redis_pool
+    if _redis_pool is None:
+        _redis_pool = redis.ConnectionPool.from_url(
+            redis_url or settings.REDIS_URL or "redis://localhost:6379"
+        )
+    return _redis_pool
+
+
+async def close_market_data_resources():
+    """Release the shared HTTP session and Redis pool on application shutdown."""
+    global _redis_pool
+    await _YAHOO_PROVIDER.close()
+    if _redis_pool is not None:
+        await _redis_pool.disconnect()
+        _redis_pool = None
+
+
 class CacheManager:
     """Redis-based cache manager for market data."""
     
-    def __init__(self, redis_url: Optional[str] = None):
+    KEY_VERSION = "v2"  # Bump when the stored payload format changes
+    
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        connection_pool: Optional[redis.ConnectionPool] = None
+    ):
         self.redis_url = redis_url or settings.REDIS_URL or "redis://localhost:6379"
+        self.connection_pool = connection_pool or (_redis_pool if redis_url is None else None)
         self.redis_client = None
         self.default_ttl = settings.CACHE_TTL  # Default TTL in seconds
+        self._zctx = zstandard.ZstdCompressor(level=3)
+        self._zdctx = zstandard.ZstdDecompressor()
     
     async def connect(self):
         """Connect to Redis."""
         try:
-            self.redis_client = redis.from_url(self.redis_url)
+            if self.connection_pool is not None:
+                self.redis_client = redis.Redis(connection_pool=self.connection_pool)
+            else:
+                self.redis_client = redis.from_url(self.redis_url)
             await self.redis_client.ping()
             logger.info("Connected to Redis cache")
         except Exception as e:
@@ -141,7 +236,9 @@ class CacheManager:
     async def disconnect(self):
         """Disconnect from Redis."""
         if self.redis_client:
+            # Clients on the shared pool leave its connections open for reuse
             await self.redis_client.close()
+            self.redis_client = None
     
     async def get(self, key: str) -> Optional[Dict[str, Any]]:
         """Get cached data."""
@@ -151,7 +248,7 @@ class CacheManager:
         try:
             data = await self.redis_client.get(key)
             if data:
-                return json.loads(data)
+                return orjson.loads(self._zdctx.decompress(data))
         except Exception as e:
             logger.error("Cache get error", key=key, error=str(e))
         
@@ -164,7 +261,8 @@ class CacheManager:
         
         try:
             ttl = ttl or self.default_ttl
-            await self.redis_client.setex(key, ttl, json.dumps(value, default=str))
+            payload = self._zctx.compress(orjson.dumps(value, default=str))
+            await self.redis_client.setex(key, ttl, payload)
             return True
         except Exception as e:
             logger.error("Cache set error", key=key, error=str(e))
@@ -184,7 +282,7 @@ class CacheManager:
     
     def make_key(self, symbol: str, period: str, data_type: str = "price") -> str:
         """Generate cache key."""
-        return f"market_data:{data_type}:{symbol}:{period}"
+        return f"market_data:{self.KEY_VERSION}:{data_type}:{symbol}:{period}"
 
 
 class MarketDataService:
@@ -194,7 +292,7 @@ class MarketDataService:
         self.db = db
         self.cache_manager = cache_manager or CacheManager()
         self.providers = {
-            "yahoo": YahooFinanceProvider(),
+            "yahoo": _YAHOO_PROVIDER,
         }
         self.default_provider = "yahoo"
     
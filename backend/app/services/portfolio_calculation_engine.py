@@ -1,8 +1,11 @@
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Mapping, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, select, update, bindparam
 from datetime import datetime, date, timedelta
-from decimal import Decimal
+from decimal import Decimal, Context, ROUND_HALF_EVEN, localcontext
+import itertools
+import numpy as np
+from operator import itemgetter
 import structlog
 
 from app.models import (
@@ -10,12 +13,59 @@ from app.models import (
     PortfolioHolding,
     Transaction as TransactionModel,
     Asset as AssetModel,
-    PriceData as PriceDataModel
+    PriceData as PriceDataModel,
+    PortfolioHistory
 )
 from app.schemas import Portfolio, PortfolioSummary
+from app.utils.price_cache import price_cache
 
 logger = structlog.get_logger()
 
+_ZERO = Decimal(0)
+_HUNDRED = Decimal(100)
+_DECIMAL_CTX = Context(prec=18, rounding=ROUND_HALF_EVEN)
+
+# Hot-path statements are built once at import; their compiled form is then
+# reused from the engine's query cache, with IDs bound per call
+_HOLDING_COLUMNS = (
+    PortfolioHolding.id,
+    PortfolioHolding.asset_id,
+    PortfolioHolding.quantity,
+    PortfolioHolding.average_cost,
+    PortfolioHolding.current_price,
+    AssetModel.symbol,
+    AssetModel.name
+)
+
+_HOLDINGS_STMT = select(*_HOLDING_COLUMNS).join(
+    AssetModel, PortfolioHolding.asset_id == AssetModel.id
+).where(
+    PortfolioHolding.portfolio_id == bindparam('portfolio_id')
+)
+
+_HOLDINGS_MANY_STMT = select(PortfolioHolding.portfolio_id, *_HOLDING_COLUMNS).join(
+    AssetModel, PortfolioHolding.asset_id == AssetModel.id
+).where(
+    PortfolioHolding.portfolio_id.in_(bindparam('portfolio_ids', expanding=True))
+).order_by(
+    PortfolioHolding.portfolio_id, PortfolioHolding.id
+)
+
+_ranked_prices = select(
+    PriceDataModel.asset_id,
+    PriceDataModel.close_price,
+    func.row_number().over(
+        partition_by=PriceDataModel.asset_id,
+        order_by=PriceDataModel.date.desc()
+    ).label('rn')
+).where(
+    PriceDataModel.asset_id.in_(bindparam('asset_ids', expanding=True))
+).subquery()
+
+_LATEST_PRICES_STMT = select(_ranked_prices.c.asset_id, _ranked_prices.c.close_price).where(
+    _ranked_prices.c.rn == 1
+)
+
 
 class PortfolioCalculationEngine:
     """Engine for portfolio calculations and performance metrics."""
@@ -23,8 +73,13 @@ class PortfolioCalculationEngine:
     def __init__(self, db: Session):
         self.db = db
     
-    async def calculate_portfolio_values(self, portfolio_id: int) -> Dict:
-        """Calculate current portfolio values and performance metrics."""
+    async def calculate_portfolio_values(self, portfolio_id: int, persist: bool = True) -> Dict:
+        """
+        Calculate current portfolio values and performance metrics.
+        
+        With persist=False the holdings and portfolio rows are left untouched,
+        which suits read-only callers such as the performance endpoint.
+        """
         try:
             # Get portfolio
             portfolio = self.db.query(PortfolioModel).filter(
@@ -34,94 +89,191 @@ class PortfolioCalculationEngine:
             if not portfolio:
                 raise ValueError(f"Portfolio with ID {portfolio_id} not found")
             
-            # Get all holdings
-            holdings = self.db.query(PortfolioHolding).filter(
-                PortfolioHolding.portfolio_id == portfolio_id
+            # Plain rows for holdings and their assets; no ORM instances to track
+            holdings = self.db.execute(
+                _HOLDINGS_STMT, {'portfolio_id': portfolio_id}
+            ).mappings().all()
+            
+            # Fetch latest prices for all held assets at once
+            latest_prices = await self.get_latest_prices(
+                [holding['asset_id'] for holding in holdings]
+            )
+            
+            result = self._build_portfolio_result(portfolio, holdings, latest_prices)
+            
+            if persist:
+                self._persist_results([(portfolio, holdings, result)])
+                self.db.commit()
+            
+            return result
+            
+        except Exception as e:
+            logger.error("Error calculating portfolio values", portfolio_id=portfolio_id, error=str(e))
+            raise
+    
+    async def compute_many(
+        self,
+        portfolio_ids: List[int],
+        persist: bool = True
+    ) -> Tuple[Dict[int, Dict], List[Dict]]:
+        """
+        Calculate values for several portfolios with one holdings query and one prices query.
+        
+        Returns (results keyed by portfolio ID, errors). Unknown IDs are omitted;
+        a portfolio that fails to value is logged and reported in errors without
+        affecting the others. With persist=True the successful results go out in
+        a single commit.
+        """
+        if not portfolio_ids:
+            return {}, []
+        
+        try:
+            portfolios = self.db.query(PortfolioModel).filter(
+                PortfolioModel.id.in_(portfolio_ids)
             ).all()
             
-            # Calculate current values
-            current_value = Decimal('0')
-            total_cost = Decimal('0')
-            total_unrealized_gain_loss = Decimal('0')
+            rows = self.db.execute(
+                _HOLDINGS_MANY_STMT, {'portfolio_ids': [p.id for p in portfolios]}
+            ).mappings().all()
+            
+            latest_prices = await self.get_latest_prices(list({row['asset_id'] for row in rows}))
+            
+            holdings_by_portfolio = {
+                portfolio_id: list(group)
+                for portfolio_id, group in itertools.groupby(rows, key=itemgetter('portfolio_id'))
+            }
+            
+            batch = []
+            errors = []
+            for portfolio in portfolios:
+                holdings = holdings_by_portfolio.get(portfolio.id, [])
+                try:
+                    result = self._build_portfolio_result(portfolio, holdings, latest_prices)
+                except Exception as e:
+                    logger.error("Error calculating portfolio values", portfolio_id=portfolio.id, error=str(e))
+                    errors.append({'portfolio_id': portfolio.id, 'error': str(e)})
+                    continue
+                batch.append((portfolio, holdings, result))
+            
+            if persist and batch:
+                self._persist_results(batch)
+                self.db.commit()
             
-            holding_details = []
+            return {portfolio.id: result for portfolio, _, result in batch}, errors
             
+        except Exception as e:
+            self.db.rollback()
+            logger.error("Error calculating portfolio batch", portfolio_ids=portfolio_ids, error=str(e))
+            raise
+    
+    def _build_portfolio_result(
+        self,
+        portfolio: PortfolioModel,
+        holdings: List[Mapping],
+        price_map: Dict[int, Decimal]
+    ) -> Dict:
+        """Value one portfolio's holding rows against prefetched prices."""
+        values = self._compute_values_from_holdings(holdings, price_map)
+        current_value = values['current_value']
+        initial_value = portfolio.initial_value
+        
+        # Calculate portfolio-level metrics
+        total_return = current_value - initial_value
+        total_return_percentage = (
+            (total_return / initial_value) * _HUNDRED
+            if initial_value > 0 else _ZERO
+        )
+        
+        return {
+            'portfolio_id': portfolio.id,
+            'current_value': current_value,
+            'initial_value': initial_value,
+            'total_return': total_return,
+            'total_return_percentage': total_return_percentage,
+            'total_unrealized_gain_loss': values['total_unrealized_gain_loss'],
+            'total_cost_basis': values['total_cost_basis'],
+            'holdings_count': len(holdings),
+            'holdings': values['holdings'],
+            'last_updated': datetime.now()
+        }
+    
+    def _persist_results(self, batch: List[Tuple[PortfolioModel, List[Mapping], Dict]]):
+        """Write computed values back; the caller commits."""
+        # Bulk UPDATE by primary key, sent as a single executemany
+        holding_updates = [
+            {
+                'id': holding['id'],
+                'current_price': detail['current_price'],
+                'market_value': detail['market_value'],
+                'unrealized_gain_loss': detail['unrealized_gain_loss'],
+                'unrealized_gain_loss_percentage': detail['unrealized_gain_loss_percentage']
+            }
+            for _, holdings, result in batch
+            for holding, detail in zip(holdings, result['holdings'])
+        ]
+        if holding_updates:
+            self.db.execute(update(PortfolioHolding), holding_updates)
+        
+        for portfolio, _, result in batch:
+            portfolio.current_value = result['current_value']
+            portfolio.total_return = result['total_return']
+            portfolio.total_return_percentage = result['total_return_percentage']
+    
+    @staticmethod
+    def _compute_values_from_holdings(
+        holdings: List[Mapping],
+        price_map: Dict[int, Decimal]
+    ) -> Dict:
+        """Compute holding and aggregate values from prefetched holding rows and prices without side effects."""
+        current_value = _ZERO
+        total_cost = _ZERO
+        total_unrealized_gain_loss = _ZERO
+        
+        holding_details = []
+        
+        with localcontext(_DECIMAL_CTX):
             for holding in holdings:
-                # Get latest price for the asset
-                latest_price = await self._get_latest_price(holding.asset_id)
-                
+                latest_price = price_map.get(holding['asset_id'])
+            
                 if latest_price:
-                    holding.current_price = latest_price
-                    holding.market_value = holding.quantity * latest_price
+                    current_price = latest_price
+                    market_value = holding['quantity'] * latest_price
                 else:
-                    holding.market_value = holding.quantity * holding.average_cost
-                
+                    current_price = holding['current_price']
+                    market_value = holding['quantity'] * holding['average_cost']
+            
                 # Calculate unrealized gain/loss
-                cost_basis = holding.quantity * holding.average_cost
-                holding.unrealized_gain_loss = holding.market_value - cost_basis
-                
+                cost_basis = holding['quantity'] * holding['average_cost']
+                unrealized_gain_loss = market_value - cost_basis
+            
                 if cost_basis > 0:
-                    holding.unrealized_gain_loss_percentage = (
-                        holding.unrealized_gain_loss / cost_basis
-                    ) * 100
+                    unrealized_gain_loss_percentage = (unrealized_gain_loss / cost_basis) * _HUNDRED
                 else:
-                    holding.unrealized_gain_loss_percentage = Decimal('0')
-                
-                # Update holding in database
-                self.db.merge(holding)
-                
+                    unrealized_gain_loss_percentage = _ZERO
+            
                 # Add to totals
-                current_value += holding.market_value
+                current_value += market_value
                 total_cost += cost_basis
-                total_unrealized_gain_loss += holding.unrealized_gain_loss
-                
-                # Add to holding details
-                asset = self.db.query(AssetModel).filter(
-                    AssetModel.id == holding.asset_id
-                ).first()
-                
+                total_unrealized_gain_loss += unrealized_gain_loss
+            
                 holding_details.append({
-                    'asset_id': holding.asset_id,
-                    'asset_symbol': asset.symbol if asset else '',
-                    'asset_name': asset.name if asset else '',
-                    'quantity': holding.quantity,
-                    'average_cost': holding.average_cost,
-                    'current_price': holding.current_price,
-                    'market_value': holding.market_value,
-                    'unrealized_gain_loss': holding.unrealized_gain_loss,
-                    'unrealized_gain_loss_percentage': holding.unrealized_gain_loss_percentage
+                    'asset_id': holding['asset_id'],
+                    'asset_symbol': holding['symbol'],
+                    'asset_name': holding['name'],
+                    'quantity': holding['quantity'],
+                    'average_cost': holding['average_cost'],
+                    'current_price': current_price,
+                    'market_value': market_value,
+                    'unrealized_gain_loss': unrealized_gain_loss,
+                    'unrealized_gain_loss_percentage': unrealized_gain_loss_percentage
                 })
-            
-            # Calculate portfolio-level metrics
-            total_return = current_value - portfolio.initial_value
-            total_return_percentage = (
-                (total_return / portfolio.initial_value) * 100 
-                if portfolio.initial_value > 0 else Decimal('0')
-            )
-            
-            # Update portfolio values
-            portfolio.current_value = current_value
-            portfolio.total_return = total_return
-            portfolio.total_return_percentage = total_return_percentage
-            
-            self.db.commit()
-            
-            return {
-                'portfolio_id': portfolio_id,
-                'current_value': current_value,
-                'initial_value': portfolio.initial_value,
-                'total_return': total_return,
-                'total_return_percentage': total_return_percentage,
-                'total_unrealized_gain_loss': total_unrealized_gain_loss,
-                'total_cost_basis': total_cost,
-                'holdings_count': len(holdings),
-                'holdings': holding_details,
-                'last_updated': datetime.now()
-            }
-            
-        except Exception as e:
-            logger.error("Error calculating portfolio values", portfolio_id=portfolio_id, error=str(e))
-            raise
+        
+        return {
+            'current_value': current_value,
+            'total_cost_basis': total_cost,
+            'total_unrealized_gain_loss': total_unrealized_gain_loss,
+            'holdings': holding_details
+        }
     
     async def calculate_portfolio_performance(
         self, 
@@ -174,8 +326,14 @@ class PortfolioCalculationEngine:
                         'type': 'outflow'
                     })
             
-            # Calculate current values
-            current_values = await self.calculate_portfolio_values(portfolio_id)
+            # Value current holdings without writing them back; the portfolio row is already loaded
+            holdings = self.db.execute(
+                _HOLDINGS_STMT, {'portfolio_id': portfolio_id}
+            ).mappings().all()
+            latest_prices = await self.get_latest_prices(
+                [holding['asset_id'] for holding in holdings]
+            )
+            current_values = self._compute_values_from_holdings(holdings, latest_prices)
             
             # Calculate basic performance metrics
             net_cash_flow = total_inflows - total_outflows
@@ -210,21 +368,23 @@ class PortfolioCalculationEngine:
     async def get_portfolio_allocation(self, portfolio_id: int) -> Dict:
         """Get portfolio allocation by asset, sector, and asset type."""
         try:
-            # Get all holdings with asset information
-            holdings_query = self.db.query(
-                PortfolioHolding,
-                AssetModel.symbol,
-                AssetModel.name,
-                AssetModel.asset_type,
-                AssetModel.sector
-            ).join(
-                AssetModel, PortfolioHolding.asset_id == AssetModel.id
-            ).filter(
-                PortfolioHolding.portfolio_id == portfolio_id,
-                PortfolioHolding.quantity > 0
-            )
-            
-            holdings = holdings_query.all()
+            # Get all holdings with asset information as plain rows
+            holdings = self.db.execute(
+                select(
+                    PortfolioHolding.asset_id,
+                    PortfolioHolding.quantity,
+                    PortfolioHolding.market_value,
+                    AssetModel.symbol,
+                    AssetModel.name,
+                    AssetModel.asset_type,
+                    AssetModel.sector
+                ).join(
+                    AssetModel, PortfolioHolding.asset_id == AssetModel.id
+                ).where(
+                    PortfolioHolding.portfolio_id == portfolio_id,
+                    PortfolioHolding.quantity > 0
+                )
+            ).mappings().all()
             
             if not holdings:
                 return {
@@ -235,49 +395,65 @@ class PortfolioCalculationEngine:
                     'total_value': Decimal('0')
                 }
             
+            # Totals and group sums are aggregated by the database
+            holdings_filter = (
+                PortfolioHolding.portfolio_id == portfolio_id,
+                PortfolioHolding.quantity > 0
+            )
+            
             # Calculate total portfolio value
-            total_value = sum(holding.market_value for holding, _, _, _, _ in holdings)
+            total_value = self.db.execute(
+                select(func.coalesce(func.sum(PortfolioHolding.market_value), 0))
+                .where(*holdings_filter)
+            ).scalar_one()
+            
+            # One division up front; every percentage below is a multiply
+            scale = _HUNDRED / total_value if total_value > 0 else _ZERO
             
             # Allocation by asset
             by_asset = []
-            for holding, symbol, name, asset_type, sector in holdings:
-                percentage = (holding.market_value / total_value) * 100 if total_value > 0 else 0
+            for holding in holdings:
+                percentage = holding['market_value'] * scale
                 by_asset.append({
-                    'asset_id': holding.asset_id,
-                    'symbol': symbol,
-                    'name': name,
-                    'asset_type': asset_type,
-                    'sector': sector,
-                    'quantity': holding.quantity,
-                    'market_value': holding.market_value,
+                    'asset_id': holding['asset_id'],
+                    'symbol': holding['symbol'],
+                    'name': holding['name'],
+                    'asset_type': holding['asset_type'],
+                    'sector': holding['sector'],
+                    'quantity': holding['quantity'],
+                    'market_value': holding['market_value'],
                     'percentage': percentage
                 })
             
-            # Allocation by sector
-            by_sector = {}
-            for holding, _, _, _, sector in holdings:
-                if sector:
-                    if sector not in by_sector:
-                        by_sector[sector] = {'value': Decimal('0'), 'percentage': Decimal('0')}
-                    by_sector[sector]['value'] += holding.market_value
-            
-            for sector in by_sector:
-                by_sector[sector]['percentage'] = (
-                    by_sector[sector]['value'] / total_value
-                ) * 100 if total_value > 0 else 0
-            
-            # Allocation by asset type
-            by_asset_type = {}
-            for holding, _, _, asset_type, _ in holdings:
-                if asset_type:
-                    if asset_type not in by_asset_type:
-                        by_asset_type[asset_type] = {'value': Decimal('0'), 'percentage': Decimal('0')}
-                    by_asset_type[asset_type]['value'] += holding.market_value
-            
-            for asset_type in by_asset_type:
-                by_asset_type[asset_type]['percentage'] = (
-                    by_asset_type[asset_type]['value'] / total_value
-                ) * 100 if total_value > 0 else 0
+            sector_rows = self.db.execute(
+                select(AssetModel.sector, func.sum(PortfolioHolding.market_value))
+                .join(PortfolioHolding, PortfolioHolding.asset_id == AssetModel.id)
+                .where(*holdings_filter, AssetModel.sector.isnot(None))
+                .group_by(AssetModel.sector)
+            ).all()
+            
+            type_rows = self.db.execute(
+                select(AssetModel.asset_type, func.sum(PortfolioHolding.market_value))
+                .join(PortfolioHolding, PortfolioHolding.asset_id == AssetModel.id)
+                .where(*holdings_filter, AssetModel.asset_type.isnot(None))
+                .group_by(AssetModel.asset_type)
+            ).all()
+            
+            by_sector = {
+                sector: {
+                    'value': value,
+                    'percentage': value * scale
+                }
+                for sector, value in sector_rows if sector
+            }
+            
+            by_asset_type = {
+                asset_type: {
+                    'value': value,
+                    'percentage': value * scale
+                }
+                for asset_type, value in type_rows
+            }
             
             return {
                 'portfolio_id': portfolio_id,
@@ -294,72 +470,134 @@ class PortfolioCalculationEngine:
     async def calculate_all_portfolios(self) -> List[Dict]:
         """Calculate values for all active portfolios."""
         try:
-            portfolios = self.db.query(PortfolioModel).filter(
-                PortfolioModel.is_active == True
-            ).all()
-            
-            results = []
-            for portfolio in portfolios:
-                try:
-                    values = await self.calculate_portfolio_values(portfolio.id)
-                    results.append(values)
-                except Exception as e:
-                    logger.error("Error calculating portfolio", portfolio_id=portfolio.id, error=str(e))
-                    continue
+            portfolio_ids = [
+                portfolio_id for (portfolio_id,) in self.db.query(PortfolioModel.id).filter(
+                    PortfolioModel.is_active == True
+                )
+            ]
             
-            return results
+            # Portfolios that fail to value are logged by compute_many and skipped
+            computed, _ = await self.compute_many(portfolio_ids)
+            return list(computed.values())
             
         except Exception as e:
             logger.error("Error calculating all portfolios", error=str(e))
             raise
     
-    async def _get_latest_price(self, asset_id: int) -> Optional[Decimal]:
-        """Get the latest price for an asset."""
-        try:
-            latest_price = self.db.query(PriceDataModel.close_price).filter(
-                PriceDataModel.asset_id == asset_id
-            ).order_by(PriceDataModel.date.desc()).first()
-            
-            if latest_price:
-                return latest_price[0]
-            
-            return None
-            
-        except Exception as e:
-            logger.error("Error getting latest price", asset_id=asset_id, error=str(e))
-            return None
+    async def get_latest_prices(self, asset_ids: List[int]) -> Dict[int, Decimal]:
+        """Get the latest price for each of several assets in a single query."""
+        if not asset_ids:
+            return {}
+        
+        cached, missing = price_cache.get_many(set(asset_ids))
+        
+        if missing:
+            try:
+                rows = self.db.execute(_LATEST_PRICES_STMT, {'asset_ids': missing}).all()
+                
+                loaded = dict.fromkeys(missing)
+                loaded.update((asset_id, close_price) for asset_id, close_price in rows)
+                price_cache.set_many(loaded)
+                cached.update(loaded)
+                
+            except Exception as e:
+                logger.error("Error getting latest prices", asset_ids=missing, error=str(e))
+        
+        return {asset_id: price for asset_id, price in cached.items() if price is not None}
     
     async def get_portfolio_history(
         self, 
         portfolio_id: int, 
         days: int = 30
     ) -> List[Dict]:
-        """Get portfolio value history over the last N days."""
+        """
+        Get portfolio value history over the last N days.
+        
+        Days in [today - N, today) come from the daily snapshots in
+        portfolio_history; only days without a snapshot are rebuilt from prices.
+        """
         try:
-            # This is a simplified version - in a real implementation,
-            # you would store daily portfolio values or calculate them
-            # based on historical prices and holdings
-            
             end_date = date.today()
             start_date = end_date - timedelta(days=days)
             
-            # Get current values as baseline
-            current_values = await self.calculate_portfolio_values(portfolio_id)
-            
-            # Generate sample history (in real implementation, use actual historical data)
-            history = []
-            for i in range(days):
-                day = start_date + timedelta(days=i)
-                # Simplified: use current value as baseline
-                # In real implementation, calculate based on historical prices
-                history.append({
-                    'date': day,
-                    'value': current_values['current_value'],
-                    'return': current_values['total_return_percentage']
-                })
+            history = {
+                day: {'date': day, 'value': value, 'return': return_percentage}
+                for day, value, return_percentage in self.db.query(
+                    PortfolioHistory.date,
+                    PortfolioHistory.value,
+                    PortfolioHistory.return_percentage
+                ).filter(
+                    PortfolioHistory.portfolio_id == portfolio_id,
+                    PortfolioHistory.date >= start_date,
+                    PortfolioHistory.date < end_date
+                )
+            }
+            
+            missing_days = [i for i in range(days) if start_date + timedelta(days=i) not in history]
+            if missing_days:
+                history.update(await self._rebuild_history(portfolio_id, start_date, missing_days))
             
-            return history
+            return [history[day] for day in sorted(history)]
             
         except Exception as e:
             logger.error("Error getting portfolio history", portfolio_id=portfolio_id, error=str(e))
             raise
+    
+    async def _rebuild_history(self, portfolio_id: int, start_date: date, day_indexes: List[int]) -> Dict[date, Dict]:
+        """Rebuild history points from prices for the given day offsets from start_date."""
+        # Current values supply the baseline for days before an asset's first close
+        current_values = await self.calculate_portfolio_values(portfolio_id, persist=False)
+        initial_value = float(current_values['initial_value'])
+        
+        holdings = current_values['holdings']
+        asset_ids = [h['asset_id'] for h in holdings]
+        quantities = np.array([float(h['quantity']) for h in holdings], dtype=np.float64)
+        fallback_prices = np.array(
+            [float(h['market_value']) / float(h['quantity']) if h['quantity'] else 0.0 for h in holdings],
+            dtype=np.float64
+        )
+        
+        # Forward-filling needs every day up to the last one requested, but none after it
+        days = day_indexes[-1] + 1
+        
+        # One query for every asset's closes in the range, pivoted to (days x assets)
+        prices = np.full((days, len(asset_ids)), np.nan)
+        if asset_ids:
+            column_of = {asset_id: i for i, asset_id in enumerate(asset_ids)}
+            rows = self.db.query(
+                PriceDataModel.asset_id,
+                PriceDataModel.date,
+                PriceDataModel.close_price
+            ).filter(
+                PriceDataModel.asset_id.in_(asset_ids),
+                PriceDataModel.date >= start_date,
+                PriceDataModel.date < start_date + timedelta(days=days)
+            ).all()
+            
+            for asset_id, price_date, close_price in rows:
+                day_index = (price_date.date() - start_date).days
+                if 0 <= day_index < days:
+                    prices[day_index, column_of[asset_id]] = float(close_price)
+        
+        # Forward-fill gaps, then fall back to the current price before the first close
+        observed = ~np.isnan(prices)
+        last_seen = np.maximum.accumulate(
+            np.where(observed, np.arange(days)[:, None], -1), axis=0
+        )
+        filled = prices[np.maximum(last_seen, 0), np.arange(len(asset_ids))]
+        filled = np.where(last_seen >= 0, filled, fallback_prices)[day_indexes]
+        
+        values = filled @ quantities
+        returns = (
+            (values - initial_value) / initial_value * 100
+            if initial_value > 0 else np.zeros(len(day_indexes))
+        )
+        
+        return {
+            start_date + timedelta(days=i): {
+                'date': start_date + timedelta(days=i),
+                'value': Decimal(str(round(value, 2))),
+                'return': Decimal(str(round(ret, 4)))
+            }
+            for i, value, ret in zip(day_indexes, values.tolist(), returns.tolist())
+        }
@@ -5,13 +5,97 @@ Portfolio calculation engine for computing portfolio metrics and analytics.
 from typing import Dict, List, Optional, Tuple
 from decimal import Decimal
 from datetime import datetime
+import numpy as np
 import structlog
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 from app.models import Portfolio, PortfolioHolding, Asset, PriceData
 from app.schemas import PortfolioCalculationResult
 
 logger = structlog.get_logger()
 
+_ZERO = Decimal(0)
+_HUNDRED = Decimal(100)
+
+
+def _factorize(labels: List) -> Tuple[np.ndarray, List]:
+    """Map labels to dense integer codes, preserving first-seen order."""
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(label, len(index)) for label in labels),
+        dtype=np.intp,
+        count=len(labels)
+    )
+    return codes, list(index)
+
+
+def _hhi_loop(mv: np.ndarray, codes: np.ndarray, n_groups: int, total: float) -> float:
+    """Herfindahl-Hirschman index of group shares, as a single pass over holdings."""
+    groups = np.zeros(n_groups)
+    for i in range(mv.shape[0]):
+        groups[codes[i]] += mv[i]
+    inv_total = 1.0 / total
+    hhi = 0.0
+    for g in range(n_groups):
+        share = groups[g] * inv_total
+        hhi += share * share
+    return hhi
+
+
+def _hhi_numpy(mv: np.ndarray, codes: np.ndarray, n_groups: int, total: float) -> float:
+    """NumPy fallback for _hhi when numba is not installed."""
+    return float(np.square(np.bincount(codes, weights=mv, minlength=n_groups) * (1.0 / total)).sum())
+
+
+_hhi = njit(cache=True, fastmath=True)(_hhi_loop) if njit is not None else _hhi_numpy
+
+
+def _hhi_from_percentages(percentages) -> float:
+    """HHI from allocation percentages (0-100) that are already computed."""
+    shares = np.fromiter(percentages, dtype=np.float64) * 0.01
+    return float(np.dot(shares, shares))
+
+
+def _holdings_metrics_loop(qty: np.ndarray, avg: np.ndarray, px: np.ndarray, out: np.ndarray) -> None:
+    """Fill out[i] with (market_value, cost_basis, unrealized_gl, unrealized_gl_pct) per holding."""
+    for i in range(qty.shape[0]):
+        market_value = qty[i] * px[i]
+        cost_basis = qty[i] * avg[i]
+        gain_loss = market_value - cost_basis
+        # Select-then-multiply instead of branching around the divide, so the loop vectorizes
+        positive = cost_basis > 0.0
+        inv = 1.0 / (cost_basis if positive else 1.0)
+        out[i, 0] = market_value
+        out[i, 1] = cost_basis
+        out[i, 2] = gain_loss
+        out[i, 3] = gain_loss * inv * 100.0 * positive
+
+
+def _holdings_metrics_numpy(qty: np.ndarray, avg: np.ndarray, px: np.ndarray, out: np.ndarray) -> None:
+    """NumPy fallback for _holdings_metrics when numba is not installed."""
+    np.multiply(qty, px, out=out[:, 0])
+    np.multiply(qty, avg, out=out[:, 1])
+    np.subtract(out[:, 0], out[:, 1], out=out[:, 2])
+    inv = np.reciprocal(out[:, 1], out=np.zeros(out.shape[0]), where=out[:, 1] > 0)
+    np.multiply(out[:, 2] * 100.0, inv, out=out[:, 3])
+
+
+_holdings_metrics = (
+    njit(cache=True, fastmath=True)(_holdings_metrics_loop) if njit is not None else _holdings_metrics_numpy
+)
+
+
+def _to_arrays(holdings: List[PortfolioHolding]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Quantity, current price and average cost as float64 columns; missing values become 0."""
+    n = len(holdings)
+    qty = np.fromiter((h.quantity or 0 for h in holdings), dtype=np.float64, count=n)
+    px = np.fromiter((h.current_price or 0 for h in holdings), dtype=np.float64, count=n)
+    avg = np.fromiter((h.average_cost or 0 for h in holdings), dtype=np.float64, count=n)
+    return qty, px, avg
+
 
 class PortfolioCalculationEngine:
     """
@@ -29,15 +113,12 @@ class PortfolioCalculationEngine:
     def calculate_portfolio_value(self, holdings: List[PortfolioHolding]) -> Decimal:
         """Calculate the total current value of a portfolio."""
         try:
-            total_value = Decimal('0')
-            for holding in holdings:
-                if holding.current_price and holding.quantity:
-                    market_value = holding.current_price * holding.quantity
-                    total_value += market_value
-            return total_value
+            qty, px, _ = _to_arrays(holdings)
+            # Round away float noise on the monetary total
+            return Decimal(str(round(float(np.dot(qty, px)), 4)))
         except Exception as e:
             self.logger.error("Error calculating portfolio value", error=str(e))
-            return Decimal('0')
+            return _ZERO
 
     def calculate_total_return(self, holdings: List[PortfolioHolding]) -> Tuple[Decimal, Decimal]:
         """
@@ -45,29 +126,55 @@ class PortfolioCalculationEngine:
         Returns: (total_return, return_percentage)
         """
         try:
-            total_cost_basis = Decimal('0')
-            total_market_value = Decimal('0')
-            
-            for holding in holdings:
-                if holding.average_cost and holding.quantity:
-                    cost_basis = holding.average_cost * holding.quantity
-                    total_cost_basis += cost_basis
-                    
-                if holding.current_price and holding.quantity:
-                    market_value = holding.current_price * holding.quantity
-                    total_market_value += market_value
+            qty, px, avg = _to_arrays(holdings)
+            total_market_value = float(np.dot(qty, px))
+            total_cost_basis = float(np.dot(qty, avg))
             
             total_return = total_market_value - total_cost_basis
             return_percentage = (
-                (total_return / total_cost_basis) * 100 
-                if total_cost_basis > 0 else Decimal('0')
+                total_return / total_cost_basis * 100.0
+                if total_cost_basis > 0 else 0.0
             )
             
-            return total_return, return_percentage
+            return Decimal(str(round(total_return, 4))), Decimal(str(round(return_percentage, 4)))
             
         except Exception as e:
             self.logger.error("Error calculating total return", error=str(e))
-            return Decimal('0'), Decimal('0')
+            return _ZERO, _ZERO
+
+    def _allocation_arrays(self, holdings: List[PortfolioHolding]) -> Dict:
+        """
+        Convert priced holdings to NumPy arrays in one pass.
+        Returns market values, the portfolio total, and per-type/per-sector
+        group totals for holdings that carry an asset.
+        """
+        priced = [h for h in holdings if h.current_price and h.quantity]
+        n = len(priced)
+        
+        qty = np.fromiter((h.quantity for h in priced), dtype=np.float64, count=n)
+        px = np.fromiter((h.current_price for h in priced), dtype=np.float64, count=n)
+        mv = qty * px
+        
+        with_asset = [i for i, h in enumerate(priced) if getattr(h, 'asset', None)]
+        grouped_mv = mv[with_asset]
+        type_codes, type_labels = _factorize(
+            [priced[i].asset.asset_type or 'other' for i in with_asset]
+        )
+        sector_codes, sector_labels = _factorize(
+            [priced[i].asset.sector or 'other' for i in with_asset]
+        )
+        
+        return {
+            'market_values': mv,
+            'total': float(mv.sum()),
+            'grouped_market_values': grouped_mv,
+            'type_codes': type_codes,
+            'type_labels': type_labels,
+            'type_totals': np.bincount(type_codes, weights=grouped_mv, minlength=len(type_labels)),
+            'sector_codes': sector_codes,
+            'sector_labels': sector_labels,
+            'sector_totals': np.bincount(sector_codes, weights=grouped_mv, minlength=len(sector_labels)),
+        }
 
     def calculate_asset_allocation(self, holdings: List[PortfolioHolding]) -> Dict[str, Dict[str, Decimal]]:
         """
@@ -78,50 +185,53 @@ class PortfolioCalculationEngine:
         }
         """
         try:
-            allocation_by_type = {}
-            allocation_by_sector = {}
-            total_value = Decimal('0')
-            
-            for holding in holdings:
-                if holding.current_price and holding.quantity:
-                    market_value = holding.current_price * holding.quantity
-                    total_value += market_value
-                    
-                    # Group by asset type
-                    if hasattr(holding, 'asset') and holding.asset:
-                        asset_type = holding.asset.asset_type or 'other'
-                        allocation_by_type[asset_type] = allocation_by_type.get(asset_type, Decimal('0')) + market_value
-                        
-                        # Group by sector
-                        sector = holding.asset.sector or 'other'
-                        allocation_by_sector[sector] = allocation_by_sector.get(sector, Decimal('0')) + market_value
+            arrays = self._allocation_arrays(holdings)
+            total_value = arrays['total']
+            type_totals = arrays['type_totals']
+            sector_totals = arrays['sector_totals']
             
             # Convert to percentages
             if total_value > 0:
-                for asset_type in allocation_by_type:
-                    allocation_by_type[asset_type] = (allocation_by_type[asset_type] / total_value) * 100
-                    
-                for sector in allocation_by_sector:
-                    allocation_by_sector[sector] = (allocation_by_sector[sector] / total_value) * 100
+                scale = 100.0 / total_value
+                type_totals = type_totals * scale
+                sector_totals = sector_totals * scale
             
             return {
-                'by_type': allocation_by_type,
-                'by_sector': allocation_by_sector
+                'by_type': {
+                    label: Decimal(str(value))
+                    for label, value in zip(arrays['type_labels'], type_totals.tolist())
+                },
+                'by_sector': {
+                    label: Decimal(str(value))
+                    for label, value in zip(arrays['sector_labels'], sector_totals.tolist())
+                }
             }
             
         except Exception as e:
             self.logger.error("Error calculating asset allocation", error=str(e))
             return {'by_type': {}, 'by_sector': {}}
 
+    def calculate_holdings_metrics_batch(self, holdings: List[PortfolioHolding]) -> np.ndarray:
+        """
+        Calculate metrics for many holdings at once.
+        Returns an (n, 4) array of market_value, cost_basis,
+        unrealized_gain_loss and unrealized_gain_loss_percentage.
+        """
+        qty, px, avg = _to_arrays(holdings)
+        
+        out = np.empty((qty.shape[0], 4), dtype=np.float64)
+        _holdings_metrics(qty, avg, px, out)
+        return out
+
     def calculate_holding_metrics(self, holding: PortfolioHolding) -> Dict[str, Decimal]:
         """Calculate metrics for a single holding."""
         try:
             metrics = {
-                'market_value': Decimal('0'),
-                'cost_basis': Decimal('0'),
-                'unrealized_gain_loss': Decimal('0'),
-                'unrealized_gain_loss_percentage': Decimal('0'),
-                'weight': Decimal('0')
+                'market_value': _ZERO,
+                'cost_basis': _ZERO,
+                'unrealized_gain_loss': _ZERO,
+                'unrealized_gain_loss_percentage': _ZERO,
+                'weight': _ZERO
             }
             
             if holding.current_price and holding.quantity:
@@ -135,25 +245,33 @@ class PortfolioCalculationEngine:
             if metrics['cost_basis'] > 0:
                 metrics['unrealized_gain_loss_percentage'] = (
                     metrics['unrealized_gain_loss'] / metrics['cost_basis']
-                ) * 100
+                ) * _HUNDRED
             
             return metrics
             
         except Exception as e:
             self.logger.error("Error calculating holding metrics", holding_id=holding.id, error=str(e))
             return {
-                'market_value': Decimal('0'),
-                'cost_basis': Decimal('0'),
-                'unrealized_gain_loss': Decimal('0'),
-                'unrealized_gain_loss_percentage': Decimal('0'),
-                'weight': Decimal('0')
+                'market_value': _ZERO,
+                'cost_basis': _ZERO,
+                'unrealized_gain_loss': _ZERO,
+                'unrealized_gain_loss_percentage': _ZERO,
+                'weight': _ZERO
             }
 
     def calculate_portfolio_metrics(self, portfolio: Portfolio, holdings: List[PortfolioHolding]) -> Dict:
         """Calculate comprehensive portfolio metrics."""
         try:
-            current_value = self.calculate_portfolio_value(holdings)
-            total_return, return_percentage = self.calculate_total_return(holdings)
+            metrics_matrix = self.calculate_holdings_metrics_batch(holdings)
+            market_value_total, cost_basis_total = metrics_matrix[:, :2].sum(axis=0).tolist()
+            
+            # Round away float noise on monetary totals
+            current_value = Decimal(str(round(market_value_total, 4)))
+            total_return = Decimal(str(round(market_value_total - cost_basis_total, 4)))
+            return_percentage = (
+                Decimal(str((market_value_total - cost_basis_total) / cost_basis_total * 100))
+                if cost_basis_total > 0 else _ZERO
+            )
             allocation = self.calculate_asset_allocation(holdings)
             
             metrics = {
@@ -162,6 +280,7 @@ class PortfolioCalculationEngine:
                 'return_percentage': return_percentage,
                 'asset_count': len(holdings),
                 'allocation': allocation,
+                'diversification_score': self.calculate_diversification_score(holdings, allocation),
                 'last_updated': datetime.utcnow()
             }
             
@@ -170,9 +289,9 @@ class PortfolioCalculationEngine:
         except Exception as e:
             self.logger.error("Error calculating portfolio metrics", portfolio_id=portfolio.id, error=str(e))
             return {
-                'current_value': Decimal('0'),
-                'total_return': Decimal('0'),
-                'return_percentage': Decimal('0'),
+                'current_value': _ZERO,
+                'total_return': _ZERO,
+                'return_percentage': _ZERO,
                 'asset_count': 0,
                 'allocation': {'by_type': {}, 'by_sector': {}},
                 'last_updated': datetime.utcnow()
@@ -193,24 +312,32 @@ class PortfolioCalculationEngine:
             self.logger.error("Error updating holding calculations", holding_id=holding.id, error=str(e))
             return holding
 
-    def calculate_diversification_score(self, holdings: List[PortfolioHolding]) -> Decimal:
+    def calculate_diversification_score(
+        self,
+        holdings: List[PortfolioHolding],
+        allocation: Optional[Dict[str, Dict[str, Decimal]]] = None
+    ) -> Decimal:
         """
         Calculate a diversification score based on asset allocation.
+        Pass a precomputed allocation from calculate_asset_allocation to
+        avoid walking the holdings again.
         Returns a score between 0 and 100.
         """
         try:
-            allocation = self.calculate_asset_allocation(holdings)
-            
             # Calculate Herfindahl-Hirschman Index for concentration
-            hhi_type = sum(
-                (percentage / 100) ** 2 
-                for percentage in allocation['by_type'].values()
-            )
-            
-            hhi_sector = sum(
-                (percentage / 100) ** 2 
-                for percentage in allocation['by_sector'].values()
-            )
+            if allocation is not None:
+                hhi_type = _hhi_from_percentages(allocation['by_type'].values())
+                hhi_sector = _hhi_from_percentages(allocation['by_sector'].values())
+            else:
+                arrays = self._allocation_arrays(holdings)
+                total_value = arrays['total']
+                
+                if total_value > 0:
+                    grouped_mv = arrays['grouped_market_values']
+                    hhi_type = _hhi(grouped_mv, arrays['type_codes'], len(arrays['type_labels']), total_value)
+                    hhi_sector = _hhi(grouped_mv, arrays['sector_codes'], len(arrays['sector_labels']), total_value)
+                else:
+                    hhi_type = hhi_sector = 0.0
             
             # Convert to diversification score (inverse of concentration)
             diversification_score = (1 - (hhi_type + hhi_sector) / 2) * 100
@@ -219,7 +346,7 @@ class PortfolioCalculationEngine:
             
         except Exception as e:
             self.logger.error("Error calculating diversification score", error=str(e))
-            return Decimal('0')
+            return _ZERO
 
 
 # Global instance
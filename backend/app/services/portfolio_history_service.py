@@ -1,20 +1,145 @@
-from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import Float, case, delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, sessionmaker
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+import asyncio
+import math
+import numpy as np
 import structlog
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 from app.models import Portfolio as PortfolioModel, PortfolioHistory
+from app.utils.concurrency import fan_out
 
 
 logger = structlog.get_logger()
 
 
+def _metrics_loop(values: np.ndarray) -> Tuple[float, float, float, float, float]:
+    """
+    Single pass over chronological values.
+    Returns (total_return, volatility, sharpe_ratio, max_drawdown, returns_count),
+    with daily return mean/variance accumulated via Welford's method.
+    """
+    n = values.shape[0]
+    first = values[0]
+    total_return = (values[n - 1] - first) / first if first > 0 else 0.0
+    
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    peak = first
+    max_drawdown = 0.0
+    for i in range(1, n):
+        value = values[i]
+        prev = values[i - 1]
+        if prev > 0:
+            daily_return = (value - prev) / prev
+            count += 1
+            delta = daily_return - mean
+            mean += delta / count
+            m2 += delta * (daily_return - mean)
+        if value > peak:
+            peak = value
+        if peak > 0:
+            drawdown = (peak - value) / peak
+            if drawdown > max_drawdown:
+                max_drawdown = drawdown
+    
+    volatility = math.sqrt(m2 / count) if count > 0 else 0.0
+    sharpe_ratio = mean / volatility if volatility > 0 else 0.0
+    return total_return, volatility, sharpe_ratio, max_drawdown, float(count)
+
+
+_SMALL_SERIES = 32
+
+
+def _metrics_numpy(values: np.ndarray) -> Tuple[float, float, float, float, float]:
+    """NumPy fallback for _metrics_kernel when numba is not installed."""
+    if values.shape[0] < _SMALL_SERIES:
+        # Per-call NumPy overhead outweighs the loop on short series
+        return _metrics_loop(values)
+    
+    first = values[0]
+    total_return = (values[-1] - first) / first if first > 0 else 0.0
+    
+    prev = values[:-1]
+    valid = prev > 0
+    daily_returns = np.diff(values)[valid] / prev[valid]
+    count = daily_returns.shape[0]
+    volatility = float(daily_returns.std()) if count else 0.0
+    sharpe_ratio = float(daily_returns.mean()) / volatility if volatility > 0 else 0.0
+    
+    peaks = np.maximum.accumulate(values)
+    drawdowns = np.divide(peaks - values, peaks, out=np.zeros_like(values), where=peaks > 0)
+    
+    return float(total_return), volatility, sharpe_ratio, float(drawdowns.max()), float(count)
+
+
+# An explicit signature compiles eagerly at import (or loads numba's on-disk cache),
+# so no request pays the JIT cost and the kernel is specialized for contiguous float64
+_METRICS_SIGNATURE = 'UniTuple(f8, 5)(f8[::1])'
+
+_metrics_kernel = (
+    njit(_METRICS_SIGNATURE, cache=True, fastmath=True, boundscheck=False)(_metrics_loop)
+    if njit is not None else _metrics_numpy
+)
+
+
+_CLEANUP_BATCH_SIZE = 10_000
+
+_CENTS = Decimal('0.01')
+
+# Dialects whose INSERT supports ON CONFLICT DO NOTHING ... RETURNING
+_CONFLICT_INSERTS = {
+    'postgresql': pg_insert,
+    'sqlite': sqlite_insert
+}
+
+
+def _compare_in_new_session(
+    portfolio_id: int,
+    session_factory: sessionmaker,
+    start_date: date,
+    end_date: date
+) -> Dict:
+    """Build one portfolio's comparison entry on a dedicated session (run on a worker thread)."""
+    db = session_factory()
+    try:
+        service = PortfolioHistoryService(db)
+        return asyncio.run(service._comparison_entry(portfolio_id, start_date, end_date))
+    finally:
+        db.close()
+
+
 class PortfolioHistoryService:
     """Service for tracking portfolio history."""
     
     def __init__(self, db: Session):
         self.db = db
+        # Scoped to this service instance, i.e. to one request or task run
+        self._value_cache: Dict[Tuple[int, date], Dict] = {}
+        self._engine = None
+    
+    def _calculation_engine(self):
+        """Calculation engine shared by every valuation this service performs."""
+        if self._engine is None:
+            from app.services.portfolio_calculation_engine import PortfolioCalculationEngine
+            self._engine = PortfolioCalculationEngine(self.db)
+        return self._engine
+    
+    async def _portfolio_values(self, portfolio_id: int, snapshot_date: date) -> Dict:
+        """Current portfolio values, computed at most once per portfolio and date."""
+        key = (portfolio_id, snapshot_date)
+        if key not in self._value_cache:
+            self._value_cache[key] = await self._calculation_engine().calculate_portfolio_values(portfolio_id)
+        return self._value_cache[key]
     
     async def record_daily_snapshot(self, portfolio_id: int, snapshot_date: date = None) -> Dict:
         """Record a daily portfolio snapshot."""
@@ -23,87 +148,150 @@ class PortfolioHistoryService:
                 snapshot_date = date.today()
             
             # Check if snapshot already exists for this date
-            existing_snapshot = self.db.query(PortfolioHistory).filter(
+            existing_value = self.db.query(PortfolioHistory.value).filter(
                 PortfolioHistory.portfolio_id == portfolio_id,
                 PortfolioHistory.date == snapshot_date
-            ).first()
+            ).scalar()
             
-            if existing_snapshot:
+            if existing_value is not None:
                 logger.info(f"Snapshot already exists for portfolio {portfolio_id} on {snapshot_date}")
                 return {
                     'portfolio_id': portfolio_id,
                     'date': snapshot_date,
-                    'value': existing_snapshot.value,
+                    'value': existing_value,
                     'status': 'already_exists'
                 }
             
             # Get current portfolio values
-            from app.services.portfolio_calculation_engine import PortfolioCalculationEngine
-            engine = PortfolioCalculationEngine(self.db)
-            portfolio_values = await engine.calculate_portfolio_values(portfolio_id)
-            
-            # Create history record
-            history_record = PortfolioHistory(
-                portfolio_id=portfolio_id,
-                date=snapshot_date,
-                value=portfolio_values['current_value'],
-                return_amount=portfolio_values['total_return'],
-                return_percentage=portfolio_values['total_return_percentage'],
-                cash_flows=Decimal('0'),  # TODO: Calculate actual cash flows
-                holdings_count=portfolio_values['holdings_count']
-            )
+            portfolio_values = await self._portfolio_values(portfolio_id, snapshot_date)
             
-            self.db.add(history_record)
+            # Create history record; a concurrent writer may have won the race since the check
+            snapshot = self._build_snapshot(portfolio_id, snapshot_date, portfolio_values)
+            created = self._insert_snapshots([snapshot])
             self.db.commit()
-            self.db.refresh(history_record)
+            
+            if not created:
+                logger.info(f"Snapshot already exists for portfolio {portfolio_id} on {snapshot_date}")
+                return {
+                    'portfolio_id': portfolio_id,
+                    'date': snapshot_date,
+                    'value': self.db.query(PortfolioHistory.value).filter(
+                        PortfolioHistory.portfolio_id == portfolio_id,
+                        PortfolioHistory.date == snapshot_date
+                    ).scalar(),
+                    'status': 'already_exists'
+                }
             
             logger.info(f"Recorded portfolio snapshot for {portfolio_id} on {snapshot_date}")
             
-            return {
-                'portfolio_id': portfolio_id,
-                'date': snapshot_date,
-                'value': history_record.value,
-                'return_amount': history_record.return_amount,
-                'return_percentage': history_record.return_percentage,
-                'status': 'created'
-            }
+            return self._snapshot_result(snapshot)
             
         except Exception as e:
             logger.error("Error recording portfolio snapshot", portfolio_id=portfolio_id, error=str(e))
             raise
     
+    @staticmethod
+    def _build_snapshot(portfolio_id: int, snapshot_date: date, portfolio_values: Dict) -> Dict:
+        """
+        Column values for a new history row from calculated portfolio values.
+        Amounts are rounded to the columns' two decimal places, so the values returned
+        to callers are the ones stored and no refresh is needed after insert.
+        """
+        return {
+            'portfolio_id': portfolio_id,
+            'date': snapshot_date,
+            'value': Decimal(portfolio_values['current_value']).quantize(_CENTS),
+            'return_amount': Decimal(portfolio_values['total_return']).quantize(_CENTS),
+            'return_percentage': Decimal(portfolio_values['total_return_percentage']).quantize(_CENTS),
+            'cash_flows': Decimal('0'),  # TODO: Calculate actual cash flows
+            'holdings_count': portfolio_values['holdings_count']
+        }
+    
+    @staticmethod
+    def _snapshot_result(snapshot: Dict) -> Dict:
+        """Response payload for a newly created snapshot."""
+        return {
+            'portfolio_id': snapshot['portfolio_id'],
+            'date': snapshot['date'],
+            'value': snapshot['value'],
+            'return_amount': snapshot['return_amount'],
+            'return_percentage': snapshot['return_percentage'],
+            'status': 'created'
+        }
+    
+    def _insert_snapshots(self, snapshots: List[Dict]) -> set:
+        """
+        Insert history rows in one statement, skipping any (portfolio_id, date) that already exists.
+        Returns the portfolio IDs that were actually inserted; the caller commits.
+        """
+        dialect_insert = _CONFLICT_INSERTS.get(self.db.get_bind().dialect.name)
+        if dialect_insert is None:
+            # No portable upsert; the unique constraint still rejects duplicates
+            self.db.execute(insert(PortfolioHistory), snapshots)
+            return {snapshot['portfolio_id'] for snapshot in snapshots}
+        
+        stmt = dialect_insert(PortfolioHistory).on_conflict_do_nothing(
+            index_elements=['portfolio_id', 'date']
+        ).returning(PortfolioHistory.portfolio_id)
+        return set(self.db.execute(stmt, snapshots).scalars())
+    
+    def _history_window(
+        self,
+        portfolio_id: int,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        limit: int
+    ):
+        """Column query for the most recent `limit` history rows in a date range, newest first."""
+        if not start_date:
+            start_date = date.today() - timedelta(days=365)
+        if not end_date:
+            end_date = date.today()
+        
+        # Plain column rows; no ORM instances to hydrate and track
+        return self.db.query(
+            PortfolioHistory.date,
+            PortfolioHistory.value,
+            PortfolioHistory.return_amount,
+            PortfolioHistory.return_percentage,
+            PortfolioHistory.cash_flows,
+            PortfolioHistory.holdings_count
+        ).filter(
+            PortfolioHistory.portfolio_id == portfolio_id,
+            PortfolioHistory.date >= start_date,
+            PortfolioHistory.date <= end_date
+        ).order_by(PortfolioHistory.date.desc()).limit(limit)
+    
     async def get_portfolio_history(
         self, 
         portfolio_id: int, 
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
-        limit: int = 100
+        limit: int = 100,
+        order_asc: bool = False
     ) -> List[Dict]:
-        """Get portfolio history for a date range."""
+        """
+        Get portfolio history for a date range.
+        Returns the most recent `limit` days, newest first unless order_asc is set.
+        """
         try:
-            if not start_date:
-                start_date = date.today() - timedelta(days=365)
-            if not end_date:
-                end_date = date.today()
+            query = self._history_window(portfolio_id, start_date, end_date, limit)
             
-            query = self.db.query(PortfolioHistory).filter(
-                PortfolioHistory.portfolio_id == portfolio_id,
-                PortfolioHistory.date >= start_date,
-                PortfolioHistory.date <= end_date
-            ).order_by(PortfolioHistory.date.desc()).limit(limit)
-            
-            history_records = query.all()
+            if order_asc:
+                # Same latest-N window, handed back oldest first by the database
+                latest = query.subquery()
+                query = self.db.query(latest).order_by(latest.c.date.asc())
             
             return [
                 {
-                    'date': record.date.isoformat(),
-                    'value': record.value,
-                    'return_amount': record.return_amount,
-                    'return_percentage': record.return_percentage,
-                    'cash_flows': record.cash_flows,
-                    'holdings_count': record.holdings_count
+                    'date': row.date.isoformat(),
+                    'value': row.value,
+                    'return_amount': row.return_amount,
+                    'return_percentage': row.return_percentage,
+                    'cash_flows': row.cash_flows,
+                    'holdings_count': row.holdings_count
                 }
-                for record in history_records
+                for row in query.yield_per(500)
             ]
             
         except Exception as e:
@@ -114,63 +302,47 @@ class PortfolioHistoryService:
         self, 
         portfolio_id: int, 
         start_date: Optional[date] = None,
-        end_date: Optional[date] = None
+        end_date: Optional[date] = None,
+        history: Optional[List[Dict]] = None
     ) -> Dict:
-        """Calculate performance metrics from historical data."""
+        """
+        Calculate performance metrics from historical data.
+        Pass history (oldest first) when it has already been fetched for the same range.
+        """
         try:
-            history = await self.get_portfolio_history(
-                portfolio_id, start_date, end_date
-            )
-            
-            if len(history) < 2:
-                return {
-                    'portfolio_id': portfolio_id,
-                    'total_return': Decimal('0'),
-                    'volatility': Decimal('0'),
-                    'sharpe_ratio': Decimal('0'),
-                    'max_drawdown': Decimal('0'),
-                    'data_points': len(history)
-                }
-            
-            # Calculate daily returns
-            daily_returns = []
-            values = [Decimal(str(h['value'])) for h in reversed(history)]
-            
-            for i in range(1, len(values)):
-                if values[i-1] > 0:
-                    daily_return = (values[i] - values[i-1]) / values[i-1]
-                    daily_returns.append(daily_return)
-            
-            if not daily_returns:
+            if history is None and self.db.get_bind().dialect.name == 'postgresql':
+                # Aggregate in the database so only one row comes back
+                data_points, metrics = self._sql_performance_metrics(portfolio_id, start_date, end_date)
+            else:
+                if history is None:
+                    history = await self.get_portfolio_history(
+                        portfolio_id, start_date, end_date, order_asc=True
+                    )
+                
+                data_points = len(history)
+                metrics = None
+                if data_points >= 2:
+                    # Statistics run on float64; Decimal only at the response boundary
+                    values = np.fromiter(
+                        (float(h['value']) for h in history),
+                        dtype=np.float64,
+                        count=data_points
+                    )
+                    metrics = _metrics_kernel(values)
+            
+            if data_points < 2 or not metrics[4]:
                 return {
                     'portfolio_id': portfolio_id,
                     'total_return': Decimal('0'),
                     'volatility': Decimal('0'),
                     'sharpe_ratio': Decimal('0'),
                     'max_drawdown': Decimal('0'),
-                    'data_points': len(history)
+                    'data_points': data_points
                 }
             
-            # Calculate metrics
-            total_return = (values[-1] - values[0]) / values[0] if values[0] > 0 else Decimal('0')
-            
-            # Volatility (standard deviation of daily returns)
-            mean_return = sum(daily_returns) / len(daily_returns)
-            variance = sum((r - mean_return) ** 2 for r in daily_returns) / len(daily_returns)
-            volatility = variance ** Decimal('0.5')
-            
-            # Sharpe ratio (assuming risk-free rate of 0 for simplicity)
-            sharpe_ratio = mean_return / volatility if volatility > 0 else Decimal('0')
-            
-            # Maximum drawdown
-            max_drawdown = Decimal('0')
-            peak = values[0]
-            for value in values:
-                if value > peak:
-                    peak = value
-                drawdown = (peak - value) / peak if peak > 0 else Decimal('0')
-                if drawdown > max_drawdown:
-                    max_drawdown = drawdown
+            total_return, volatility, sharpe_ratio, max_drawdown = (
+                Decimal(str(metric)) for metric in metrics[:4]
+            )
             
             return {
                 'portfolio_id': portfolio_id,
@@ -180,14 +352,60 @@ class PortfolioHistoryService:
                 'volatility': volatility,
                 'sharpe_ratio': sharpe_ratio,
                 'max_drawdown': max_drawdown,
-                'data_points': len(history),
-                'daily_returns_count': len(daily_returns)
+                'data_points': data_points,
+                'daily_returns_count': int(metrics[4])
             }
             
         except Exception as e:
             logger.error("Error calculating performance metrics", portfolio_id=portfolio_id, error=str(e))
             raise
     
+    def _sql_performance_metrics(
+        self,
+        portfolio_id: int,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        limit: int = 100
+    ) -> Tuple[int, Tuple[float, float, float, float, float]]:
+        """
+        Same metrics as _metrics_kernel over the same history window, computed by the
+        database (PostgreSQL). Returns (data_points, metrics).
+        """
+        window = self._history_window(portfolio_id, start_date, end_date, limit).subquery()
+        chronological = {'order_by': window.c.date}
+        prev = func.lag(window.c.value).over(**chronological)
+        
+        steps = select(
+            window.c.value,
+            case((prev > 0, (window.c.value - prev) / prev)).label('daily_return'),
+            func.max(window.c.value).over(rows=(None, 0), **chronological).label('peak'),
+            func.first_value(window.c.value).over(rows=(None, None), **chronological).label('first_value'),
+            func.last_value(window.c.value).over(rows=(None, None), **chronological).label('last_value')
+        ).subquery()
+        
+        row = self.db.execute(
+            select(
+                func.count(),
+                func.count(steps.c.daily_return),
+                func.avg(steps.c.daily_return, type_=Float),
+                func.stddev_pop(steps.c.daily_return, type_=Float),
+                func.max(
+                    case((steps.c.peak > 0, (steps.c.peak - steps.c.value) / steps.c.peak), else_=0),
+                    type_=Float
+                ),
+                func.max(steps.c.first_value, type_=Float),
+                func.max(steps.c.last_value, type_=Float)
+            )
+        ).one()
+        
+        data_points, returns_count, mean_return, volatility, max_drawdown, first, last = row
+        if returns_count == 0:
+            return data_points, (0.0, 0.0, 0.0, 0.0, 0.0)
+        
+        total_return = (last - first) / first if first > 0 else 0.0
+        sharpe_ratio = mean_return / volatility if volatility > 0 else 0.0
+        return data_points, (total_return, volatility, sharpe_ratio, max_drawdown, float(returns_count))
+    
     async def record_all_portfolios_snapshot(self, snapshot_date: date = None) -> Dict:
         """Record daily snapshots for all active portfolios."""
         try:
@@ -195,26 +413,93 @@ class PortfolioHistoryService:
                 snapshot_date = date.today()
             
             # Get all active portfolios
-            portfolios = self.db.query(PortfolioModel).filter(
-                PortfolioModel.is_active == True
-            ).all()
+            portfolio_ids = [
+                portfolio_id for (portfolio_id,) in self.db.query(PortfolioModel.id).filter(
+                    PortfolioModel.is_active == True
+                )
+            ]
             
-            results = []
+            # One lookup for every snapshot that already exists on this date
+            existing = dict(
+                self.db.query(PortfolioHistory.portfolio_id, PortfolioHistory.value).filter(
+                    PortfolioHistory.date == snapshot_date,
+                    PortfolioHistory.portfolio_id.in_(portfolio_ids)
+                ).all()
+            )
+            
+            results = [
+                {
+                    'portfolio_id': portfolio_id,
+                    'date': snapshot_date,
+                    'value': existing[portfolio_id],
+                    'status': 'already_exists'
+                }
+                for portfolio_id in portfolio_ids if portfolio_id in existing
+            ]
             errors = []
             
-            for portfolio in portfolios:
+            missing_ids = [portfolio_id for portfolio_id in portfolio_ids if portfolio_id not in existing]
+            uncached_ids = [
+                portfolio_id for portfolio_id in missing_ids
+                if (portfolio_id, snapshot_date) not in self._value_cache
+            ]
+            if missing_ids:
                 try:
-                    result = await self.record_daily_snapshot(portfolio.id, snapshot_date)
-                    results.append(result)
+                    # One batched valuation, then every new snapshot in a single transaction
+                    if uncached_ids:
+                        computed, failed = await self._calculation_engine().compute_many(uncached_ids)
+                        errors.extend(failed)
+                        self._value_cache.update(
+                            ((portfolio_id, snapshot_date), values) for portfolio_id, values in computed.items()
+                        )
+                    portfolio_values = {
+                        portfolio_id: self._value_cache[(portfolio_id, snapshot_date)]
+                        for portfolio_id in missing_ids
+                        if (portfolio_id, snapshot_date) in self._value_cache
+                    }
+                    snapshots = [
+                        self._build_snapshot(portfolio_id, snapshot_date, values)
+                        for portfolio_id, values in portfolio_values.items()
+                    ]
+                    created = self._insert_snapshots(snapshots) if snapshots else set()
+                    self.db.commit()
+                    results.extend(
+                        self._snapshot_result(snapshot) for snapshot in snapshots
+                        if snapshot['portfolio_id'] in created
+                    )
+                    
+                    # Rows written by another job since the lookup above were skipped by the insert
+                    skipped_ids = [
+                        snapshot['portfolio_id'] for snapshot in snapshots
+                        if snapshot['portfolio_id'] not in created
+                    ]
+                    if skipped_ids:
+                        stored = dict(
+                            self.db.query(PortfolioHistory.portfolio_id, PortfolioHistory.value).filter(
+                                PortfolioHistory.date == snapshot_date,
+                                PortfolioHistory.portfolio_id.in_(skipped_ids)
+                            ).all()
+                        )
+                        results.extend(
+                            {
+                                'portfolio_id': portfolio_id,
+                                'date': snapshot_date,
+                                'value': stored.get(portfolio_id),
+                                'status': 'already_exists'
+                            }
+                            for portfolio_id in skipped_ids
+                        )
                 except Exception as e:
-                    errors.append({
-                        'portfolio_id': portfolio.id,
-                        'error': str(e)
-                    })
+                    self.db.rollback()
+                    reported = {error['portfolio_id'] for error in errors}
+                    errors.extend(
+                        {'portfolio_id': portfolio_id, 'error': str(e)}
+                        for portfolio_id in missing_ids if portfolio_id not in reported
+                    )
             
             return {
                 'date': snapshot_date.isoformat(),
-                'total_portfolios': len(portfolios),
+                'total_portfolios': len(portfolio_ids),
                 'successful_snapshots': len(results),
                 'errors': len(errors),
                 'results': results,
@@ -238,21 +523,16 @@ class PortfolioHistoryService:
             if not end_date:
                 end_date = date.today()
             
-            comparison_data = {}
-            
-            for portfolio_id in portfolio_ids:
-                history = await self.get_portfolio_history(
-                    portfolio_id, start_date, end_date
-                )
-                
-                performance = await self.calculate_performance_metrics(
-                    portfolio_id, start_date, end_date
-                )
-                
-                comparison_data[portfolio_id] = {
-                    'history': history,
-                    'performance': performance
-                }
+            # Each portfolio is built on its own session, bound to the same engine as ours
+            session_factory = sessionmaker(bind=self.db.get_bind(), autoflush=False)
+            entries, errors = await fan_out(
+                _compare_in_new_session,
+                [(portfolio_id, session_factory, start_date, end_date) for portfolio_id in portfolio_ids]
+            )
+            if errors:
+                # A comparison is all-or-nothing; surface the first failure
+                raise ValueError(f"Portfolio {errors[0]['portfolio_id']}: {errors[0]['error']}")
+            comparison_data = dict(zip(portfolio_ids, entries))
             
             return {
                 'start_date': start_date.isoformat(),
@@ -264,17 +544,43 @@ class PortfolioHistoryService:
             logger.error("Error getting portfolio comparison", portfolio_ids=portfolio_ids, error=str(e))
             raise
     
+    async def _comparison_entry(self, portfolio_id: int, start_date: date, end_date: date) -> Dict:
+        """History and performance metrics for one portfolio in a comparison."""
+        history = await self.get_portfolio_history(
+            portfolio_id, start_date, end_date
+        )
+        
+        performance = await self.calculate_performance_metrics(
+            portfolio_id, start_date, end_date, history=history[::-1]
+        )
+        
+        return {
+            'history': history,
+            'performance': performance
+        }
+    
     async def cleanup_old_history(self, days_to_keep: int = 1095) -> Dict:
         """Clean up old history records (default: keep 3 years)."""
         try:
             cutoff_date = date.today() - timedelta(days=days_to_keep)
             
-            # Delete old records
-            deleted_count = self.db.query(PortfolioHistory).filter(
-                PortfolioHistory.date < cutoff_date
-            ).delete()
+            # Delete old records in bounded batches so no single transaction holds a long lock
+            batch = delete(PortfolioHistory).where(
+                PortfolioHistory.id.in_(
+                    select(PortfolioHistory.id).where(
+                        PortfolioHistory.date < cutoff_date
+                    ).limit(_CLEANUP_BATCH_SIZE)
+                )
+            )
             
-            self.db.commit()
+            deleted_count = 0
+            while True:
+                deleted = self.db.execute(batch, execution_options={'synchronize_session': False}).rowcount
+                self.db.commit()
+                deleted_count += deleted
+                if deleted < _CLEANUP_BATCH_SIZE:
+                    break
+                await asyncio.sleep(0)
             
             logger.info(f"Cleaned up {deleted_count} old portfolio history records")
             
@@ -3,13 +3,23 @@ Portfolio Optimization Service
 Implementation of Modern Portfolio Theory using PyPortfolioOpt
 """
 
+import asyncio
+import hashlib
+import threading
+import cvxpy as cp
 import numpy as np
 import pandas as pd
 from typing import Dict, List, Optional, Tuple, Any, Union
 from decimal import Decimal
 from datetime import datetime, date, timedelta
 import structlog
+from cachetools import LRUCache, TTLCache
+from scipy.linalg import cho_factor, cho_solve
 from sqlalchemy.orm import Session
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 # PyPortfolioOpt imports
 from pypfopt import EfficientFrontier, DiscreteAllocation, get_latest_prices
@@ -27,6 +37,108 @@ from app.core.database import get_db
 
 logger = structlog.get_logger()
 
+_MAX_CONCURRENT_PRICE_FETCHES = 16
+
+# (returns fingerprint, covariance method) -> (mu, S, asset labels)
+_ESTIMATES_CACHE: LRUCache = LRUCache(maxsize=32)
+
+
+class HistoricalPriceCache:
+    """Process-local TTL cache of historical price responses keyed by (symbol, start day, end day)."""
+    
+    def __init__(self, maxsize: int = 256, ttl: int = 900):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(symbol: str, start_date: datetime, end_date: datetime) -> Tuple[str, date, date]:
+        """Cache key with the range snapped to whole days so keys are stable within a day."""
+        return symbol, start_date.date(), end_date.date()
+    
+    def get(self, key: Tuple[str, date, date]) -> Optional[Any]:
+        """Return the cached response, or None if absent or expired."""
+        with self._lock:
+            return self._cache.get(key)
+    
+    def set(self, key: Tuple[str, date, date], prices: Any):
+        """Store a price response."""
+        with self._lock:
+            self._cache[key] = prices
+    
+    def invalidate(self):
+        """Drop every cached response."""
+        with self._lock:
+            self._cache.clear()
+
+
+historical_price_cache = HistoricalPriceCache()
+
+
+def _greedy_allocation_loop(weights: np.ndarray, prices: np.ndarray, total_value: float):
+    """
+    Long-only greedy share allocation, the same algorithm as
+    DiscreteAllocation.greedy_portfolio. Weights must be sorted in descending order.
+    Returns (shares, leftover_cash).
+    """
+    n = weights.shape[0]
+    shares = np.zeros(n, dtype=np.int64)
+    available = total_value
+    
+    # First round: round each target position down to whole shares
+    for i in range(n):
+        shares[i] = int(weights[i] * total_value / prices[i])
+        available -= shares[i] * prices[i]
+    
+    # Second round: buy one share at a time of the most underweight affordable asset
+    deficit = np.empty(n)
+    while available > 0:
+        held = 0.0
+        for i in range(n):
+            held += prices[i] * shares[i]
+        for i in range(n):
+            deficit[i] = weights[i] - (prices[i] * shares[i] / held if held > 0 else 0.0)
+        
+        idx = np.argmax(deficit)
+        counter = 0
+        while prices[idx] > available:
+            deficit[idx] = 0
+            idx = np.argmax(deficit)
+            if deficit[idx] < 0 or counter == 10:
+                break
+            counter += 1
+        
+        if deficit[idx] <= 0 or counter == 10:
+            break
+        
+        shares[idx] += 1
+        available -= prices[idx]
+    
+    return shares, available
+
+
+_greedy_allocation = njit(cache=True)(_greedy_allocation_loop) if njit is not None else _greedy_allocation_loop
+
+
+def _risk_budget_weights(S: np.ndarray, budget: np.ndarray, tol: float = 1e-12, max_iter: int = 100) -> np.ndarray:
+    """
+    Long-only weights whose risk contributions match budget (which sums to one).
+    
+    Damped Newton on the convex problem min 0.5 x'Sx - sum(budget * log x), whose
+    optimum satisfies x_i (Sx)_i = budget_i. Each step solves with a Cholesky factor of
+    the Hessian instead of forming an inverse.
+    """
+    x = budget / np.sqrt(budget @ S @ budget)
+    for _ in range(max_iter):
+        gradient = S @ x - budget / x
+        hessian = S + np.diag(budget / (x * x))
+        step = cho_solve(cho_factor(hessian, lower=True), gradient)
+        decrement = float(np.sqrt(gradient @ step))
+        # Full steps near the optimum, damped ones before that keep x strictly positive
+        x = x - step / (1.0 + decrement) if decrement > 0.25 else x - step
+        if decrement * decrement < tol:
+            break
+    return x / x.sum()
+
 
 class PortfolioOptimizationService:
     """Advanced portfolio optimization service using Modern Portfolio Theory"""
@@ -34,7 +146,51 @@ class PortfolioOptimizationService:
     def __init__(self, db: Session):
         self.db = db
         self.market_service = MarketDataService()
+    
+    @staticmethod
+    def _returns_key(returns_data: pd.DataFrame) -> bytes:
+        """Content fingerprint of a returns frame (values and column labels)."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(returns_data.to_numpy()).tobytes())
+        digest.update(repr(tuple(returns_data.columns)).encode())
+        return digest.digest()
+    
+    def _estimates(
+        self,
+        returns_data: pd.DataFrame,
+        cov_method: str = "ledoit_wolf"
+    ) -> Tuple[pd.Series, pd.DataFrame]:
+        """
+        Expected returns and annualized covariance of returns_data.
+        
+        Shrinkage estimators (the default) give a better-conditioned matrix than the sample
+        covariance when there are not many more observations than assets, so the solvers
+        converge in fewer iterations. Estimates are kept as plain arrays in a module-level
+        LRU cache so repeated requests over the same data skip both estimation passes.
+        """
+        key = (self._returns_key(returns_data), cov_method)
+        cached = _ESTIMATES_CACHE.get(key)
+        if cached is None:
+            mu = expected_returns.mean_historical_return(returns_data, returns_data=True)
+            if cov_method == "ledoit_wolf":
+                S = CovarianceShrinkage(returns_data, returns_data=True).ledoit_wolf()
+            elif cov_method == "oracle_approximating":
+                S = CovarianceShrinkage(returns_data, returns_data=True).oracle_approximating()
+            elif cov_method == "sample":
+                S = sample_cov(returns_data, returns_data=True)
+            else:
+                raise ValueError(f"Unknown covariance method: {cov_method}")
+            mu_np = mu.to_numpy(dtype=np.float64, copy=True)
+            S_np = S.to_numpy(dtype=np.float64, copy=True)
+            # Shared between callers, so guard against in-place edits
+            mu_np.flags.writeable = False
+            S_np.flags.writeable = False
+            cached = (mu_np, S_np, tuple(returns_data.columns))
+            _ESTIMATES_CACHE[key] = cached
         
+        mu_np, S_np, labels = cached
+        return pd.Series(mu_np, index=labels), pd.DataFrame(S_np, index=labels, columns=labels)
+    
     async def get_asset_data(
         self, 
         asset_symbols: List[str], 
@@ -54,37 +210,65 @@ class PortfolioOptimizationService:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=lookback_days + 30)  # Extra buffer
             
-            price_data = pd.DataFrame()
+            # Fetch every symbol concurrently; the semaphore caps in-flight upstream requests and
+            # responses are reused across requests for the same symbol and day range
+            semaphore = asyncio.Semaphore(_MAX_CONCURRENT_PRICE_FETCHES)
             
-            for symbol in asset_symbols:
-                try:
-                    # Get historical prices
+            async def fetch(symbol: str):
+                key = historical_price_cache.key(symbol, start_date, end_date)
+                prices = historical_price_cache.get(key)
+                if prices is not None:
+                    return prices
+                
+                async with semaphore:
                     prices = await self.market_service.get_historical_prices(
                         symbol, start_date, end_date
                     )
-                    
+                if prices is not None:
+                    historical_price_cache.set(key, prices)
+                return prices
+            
+            responses = await asyncio.gather(
+                *(fetch(symbol) for symbol in asset_symbols), return_exceptions=True
+            )
+            
+            series_list = []
+            
+            for symbol, prices in zip(asset_symbols, responses):
+                if isinstance(prices, Exception):
+                    logger.warning(f"Failed to get data for {symbol}", error=str(prices))
+                    continue
+                
+                try:
                     if prices is not None and len(prices) > 0:
-                        # Convert to DataFrame if needed
+                        # Convert to Series if needed
                         if isinstance(prices, list):
                             price_series = pd.Series(
                                 [p['close'] for p in prices],
-                                index=[p['date'] for p in prices],
+                                index=pd.to_datetime([p['date'] for p in prices], format='ISO8601'),
                                 name=symbol
                             )
                         else:
                             price_series = prices.rename(symbol)
                             
-                        price_data[symbol] = price_series
+                        series_list.append(price_series)
                         
                 except Exception as e:
                     logger.warning(f"Failed to get data for {symbol}", error=str(e))
                     continue
             
+            # One outer-joined frame instead of re-aligning the frame for every column, sorted
+            # once by date so pct_change runs in time order
+            price_data = (
+                pd.concat(series_list, axis=1, join='outer').sort_index() if series_list else pd.DataFrame()
+            )
+            
             if price_data.empty:
                 raise ValueError("No price data available for optimization")
             
-            # Calculate returns
-            returns_data = price_data.pct_change().dropna()
+            # Calculate returns; single precision is plenty for daily return statistics and
+            # halves the memory traffic of the estimators (mu and S are kept in float64)
+            returns_data = price_data.pct_change().dropna().astype(np.float32, copy=False)
             
             # Ensure minimum data points
             if len(returns_data) < 30:
@@ -102,7 +286,8 @@ class PortfolioOptimizationService:
         risk_free_rate: float = 0.02,
         n_points: int = 100,
         min_weight: float = 0.0,
-        max_weight: float = 1.0
+        max_weight: float = 1.0,
+        cov_method: str = "ledoit_wolf"
     ) -> Dict[str, Any]:
         """
         Calculate efficient frontier
@@ -113,41 +298,46 @@ class PortfolioOptimizationService:
             n_points: Number of points on the efficient frontier
             min_weight: Minimum weight constraint
             max_weight: Maximum weight constraint
+            cov_method: Covariance estimator ("ledoit_wolf", "oracle_approximating" or "sample")
             
         Returns:
             Dictionary with frontier data and key portfolios
         """
         try:
             # Calculate expected returns and covariance matrix
-            mu = expected_returns.mean_historical_return(returns_data)
-            S = risk_models.sample_cov(returns_data)
-            
-            # Create efficient frontier object
-            ef = EfficientFrontier(mu, S)
-            ef.add_constraint(lambda w: w >= min_weight)
-            ef.add_constraint(lambda w: w <= max_weight)
+            mu, S = self._estimates(returns_data, cov_method)
+            
+            # Minimum-variance problem built once with the target return as a parameter, so
+            # CVXPY canonicalizes it a single time and each point is just a re-solve
+            mu_np = mu.to_numpy(dtype=np.float64)
+            S_np = S.to_numpy(dtype=np.float64)
+            assets = list(mu.index)
+            w = cp.Variable(len(assets))
+            target = cp.Parameter()
+            problem = cp.Problem(
+                cp.Minimize(cp.quad_form(w, cp.psd_wrap(S_np))),
+                [cp.sum(w) == 1, w >= min_weight, w <= max_weight, mu_np @ w >= target]
+            )
             
             # Calculate frontier points
-            target_returns = np.linspace(mu.min(), mu.max(), n_points)
+            target_returns = np.linspace(mu_np.min(), mu_np.max(), n_points)
             frontier_volatility = []
             frontier_returns = []
             frontier_weights = []
             
             for target_return in target_returns:
+                target.value = target_return
                 try:
-                    ef_copy = EfficientFrontier(mu, S)
-                    ef_copy.add_constraint(lambda w: w >= min_weight)
-                    ef_copy.add_constraint(lambda w: w <= max_weight)
-                    
-                    weights = ef_copy.efficient_return(target_return)
-                    ret, vol, _ = ef_copy.portfolio_performance(risk_free_rate=risk_free_rate)
-                    
-                    frontier_returns.append(ret)
-                    frontier_volatility.append(vol)
-                    frontier_weights.append(weights)
-                    
-                except Exception:
+                    problem.solve(solver=cp.CLARABEL, warm_start=True)
+                except cp.error.SolverError:
                     continue
+                if problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE):
+                    continue
+                
+                weights = w.value
+                frontier_returns.append(float(mu_np @ weights))
+                frontier_volatility.append(float(np.sqrt(weights @ S_np @ weights)))
+                frontier_weights.append(dict(zip(assets, weights)))
             
             # Calculate key portfolios
             key_portfolios = self._calculate_key_portfolios(mu, S, risk_free_rate, min_weight, max_weight)
@@ -180,11 +370,17 @@ class PortfolioOptimizationService:
         try:
             portfolios = {}
             
+            # Project S onto the positive-definite cone once (symmetric eigendecomposition with
+            # eigenvalues floored) so every solve below gets a well-conditioned matrix
+            eigenvalues, eigenvectors = np.linalg.eigh(S.to_numpy(dtype=np.float64))
+            S_np = (eigenvectors * np.clip(eigenvalues, 1e-10, None)) @ eigenvectors.T
+            S_np = np.ascontiguousarray((S_np + S_np.T) / 2)
+            S = pd.DataFrame(S_np, index=S.index, columns=S.columns)
+            mu_np = np.ascontiguousarray(mu.to_numpy(dtype=np.float64))
+            
             # Maximum Sharpe Ratio Portfolio
             try:
-                ef_sharpe = EfficientFrontier(mu, S)
-                ef_sharpe.add_constraint(lambda w: w >= min_weight)
-                ef_sharpe.add_constraint(lambda w: w <= max_weight)
+                ef_sharpe = EfficientFrontier(mu, S, weight_bounds=(min_weight, max_weight))
                 
                 weights_sharpe = ef_sharpe.max_sharpe(risk_free_rate=risk_free_rate)
                 ret_sharpe, vol_sharpe, sharpe_sharpe = ef_sharpe.portfolio_performance(risk_free_rate=risk_free_rate)
@@ -201,9 +397,7 @@ class PortfolioOptimizationService:
             
             # Minimum Volatility Portfolio
             try:
-                ef_min_vol = EfficientFrontier(mu, S)
-                ef_min_vol.add_constraint(lambda w: w >= min_weight)
-                ef_min_vol.add_constraint(lambda w: w <= max_weight)
+                ef_min_vol = EfficientFrontier(mu, S, weight_bounds=(min_weight, max_weight))
                 
                 weights_min_vol = ef_min_vol.min_volatility()
                 ret_min_vol, vol_min_vol, sharpe_min_vol = ef_min_vol.portfolio_performance(risk_free_rate=risk_free_rate)
@@ -220,9 +414,7 @@ class PortfolioOptimizationService:
             
             # Maximum Return Portfolio (for given risk level)
             try:
-                ef_max_ret = EfficientFrontier(mu, S)
-                ef_max_ret.add_constraint(lambda w: w >= min_weight)
-                ef_max_ret.add_constraint(lambda w: w <= max_weight)
+                ef_max_ret = EfficientFrontier(mu, S, weight_bounds=(min_weight, max_weight))
                 
                 target_volatility = 0.15  # 15% volatility target
                 weights_max_ret = ef_max_ret.efficient_risk(target_volatility)
@@ -244,9 +436,9 @@ class PortfolioOptimizationService:
                 equal_weights = {asset: 1/n_assets for asset in mu.index}
                 
                 # Calculate performance for equal weight
-                weights_array = np.array(list(equal_weights.values()))
-                ret_equal = np.dot(weights_array, mu)
-                vol_equal = np.sqrt(np.dot(weights_array.T, np.dot(S, weights_array)))
+                weights_array = np.full(n_assets, 1.0 / n_assets)
+                ret_equal = weights_array @ mu_np
+                vol_equal = np.sqrt(weights_array @ S_np @ weights_array)
                 sharpe_equal = (ret_equal - risk_free_rate) / vol_equal
                 
                 portfolios["equal_weight"] = {
@@ -272,7 +464,10 @@ class PortfolioOptimizationService:
         target_return: Optional[float] = None,
         target_volatility: Optional[float] = None,
         risk_free_rate: float = 0.02,
-        constraints: Optional[Dict[str, Any]] = None
+        constraints: Optional[Dict[str, Any]] = None,
+        cov_method: str = "ledoit_wolf",
+        mu: Optional[pd.Series] = None,
+        S: Optional[pd.DataFrame] = None
     ) -> Dict[str, Any]:
         """
         Optimize portfolio for specific objective
@@ -284,24 +479,28 @@ class PortfolioOptimizationService:
             target_volatility: Target volatility (for efficient_risk method)
             risk_free_rate: Risk-free rate
             constraints: Additional constraints
+            cov_method: Covariance estimator ("ledoit_wolf", "oracle_approximating" or "sample")
+            mu: Precomputed expected returns (estimated from returns_data if omitted)
+            S: Precomputed covariance matrix (estimated from returns_data if omitted)
             
         Returns:
             Optimized portfolio weights and metrics
         """
         try:
             # Calculate expected returns and covariance matrix
-            mu = expected_returns.mean_historical_return(returns_data)
-            S = risk_models.sample_cov(returns_data)
+            if mu is None or S is None:
+                mu, S = self._estimates(returns_data, cov_method)
             
-            # Create efficient frontier object
-            ef = EfficientFrontier(mu, S)
+            # Weight bounds go to the optimizer as per-asset box bounds rather than extra constraints
+            lower = np.zeros(len(mu))
+            upper = np.ones(len(mu))
             
             # Apply constraints
             if constraints:
                 # Weight bounds
                 if "min_weight" in constraints and "max_weight" in constraints:
-                    ef.add_constraint(lambda w: w >= constraints["min_weight"])
-                    ef.add_constraint(lambda w: w <= constraints["max_weight"])
+                    lower[:] = constraints["min_weight"]
+                    upper[:] = constraints["max_weight"]
                 
                 # Sector constraints
                 if "sector_constraints" in constraints:
@@ -311,13 +510,16 @@ class PortfolioOptimizationService:
                 
                 # Individual asset constraints
                 if "asset_constraints" in constraints:
+                    positions = {asset: idx for idx, asset in enumerate(mu.index)}
                     for asset, limits in constraints["asset_constraints"].items():
-                        if asset in mu.index:
-                            asset_idx = list(mu.index).index(asset)
+                        if asset in positions:
                             if "min" in limits:
-                                ef.add_constraint(lambda w: w[asset_idx] >= limits["min"])
+                                lower[positions[asset]] = limits["min"]
                             if "max" in limits:
-                                ef.add_constraint(lambda w: w[asset_idx] <= limits["max"])
+                                upper[positions[asset]] = limits["max"]
+            
+            # Create efficient frontier object
+            ef = EfficientFrontier(mu, S, weight_bounds=list(zip(lower, upper)))
             
             # Optimize based on method
             if optimization_method == "max_sharpe":
@@ -373,16 +575,26 @@ class PortfolioOptimizationService:
             Discrete allocation and leftover cash
         """
         try:
-            # Convert to pandas Series
-            weights_series = pd.Series(weights)
-            prices_series = pd.Series(latest_prices)
-            
-            # Calculate discrete allocation
-            da = DiscreteAllocation(weights_series, prices_series, total_portfolio_value)
-            allocation, leftover = da.greedy_portfolio()
+            if total_portfolio_value <= 0:
+                raise ValueError("total_portfolio_value must be greater than zero")
+            
+            # Descending weight order, as the greedy pass expects
+            symbols = sorted(weights, key=weights.get, reverse=True)
+            weights_array = np.array([weights[s] for s in symbols], dtype=np.float64)
+            prices_array = np.array([latest_prices[s] for s in symbols], dtype=np.float64)
+            if np.isnan(weights_array).any() or np.isnan(prices_array).any():
+                raise ValueError("weights and latest prices should have no NaNs")
+            
+            if len(symbols) and weights_array[-1] < 0:
+                # Long/short books are split into two sub-portfolios by pypfopt
+                da = DiscreteAllocation(weights, pd.Series(latest_prices), total_portfolio_value)
+                allocation, leftover = da.greedy_portfolio()
+            else:
+                shares, leftover = _greedy_allocation(weights_array, prices_array, float(total_portfolio_value))
+                allocation = {s: int(n) for s, n in zip(symbols, shares) if n != 0}
             
             # Calculate allocation details
-            total_allocated = sum(allocation[asset] * prices_series[asset] for asset in allocation)
+            total_allocated = sum(allocation[asset] * latest_prices[asset] for asset in allocation)
             allocation_percentage = (total_allocated / total_portfolio_value) * 100
             
             return {
@@ -415,8 +627,14 @@ class PortfolioOptimizationService:
             Rebalancing suggestions and trade recommendations
         """
         try:
-            # Get current portfolio holdings
-            holdings = self.db.query(PortfolioHolding).filter(
+            # Get current portfolio holdings with their asset symbols in one query
+            holdings = self.db.query(
+                PortfolioHolding.market_value,
+                PortfolioHolding.current_price,
+                AssetModel.symbol
+            ).outerjoin(
+                AssetModel, PortfolioHolding.asset_id == AssetModel.id
+            ).filter(
                 PortfolioHolding.portfolio_id == portfolio_id,
                 PortfolioHolding.quantity > 0
             ).all()
@@ -424,64 +642,54 @@ class PortfolioOptimizationService:
             if not holdings:
                 raise ValueError("No holdings found for portfolio")
             
-            # Calculate current weights
-            total_value = sum(h.market_value for h in holdings)
+            # Calculate current weights; the total is a float64 reduction rather than
+            # chained Decimal additions, since every output below is a float anyway
+            market_values = np.fromiter(
+                (float(h.market_value) for h in holdings), dtype=np.float64, count=len(holdings)
+            )
+            total_value = market_values.sum()
+            if total_value == 0:
+                raise ValueError("Portfolio has no market value")
+            weights = market_values / total_value
             current_weights = {}
             current_prices = {}
             
-            for holding in holdings:
-                asset = self.db.query(AssetModel).filter(AssetModel.id == holding.asset_id).first()
-                if asset:
-                    current_weights[asset.symbol] = float(holding.market_value / total_value)
-                    current_prices[asset.symbol] = float(holding.current_price)
-            
-            # Calculate weight differences
-            rebalancing_needed = False
-            trades = []
-            
-            for symbol in target_weights:
-                current_weight = current_weights.get(symbol, 0.0)
-                target_weight = target_weights[symbol]
-                weight_diff = target_weight - current_weight
-                
-                if abs(weight_diff) > tolerance:
-                    rebalancing_needed = True
-                    
-                    # Calculate dollar amount to trade
-                    dollar_diff = weight_diff * float(total_value)
-                    
-                    if symbol in current_prices:
-                        shares_to_trade = dollar_diff / current_prices[symbol]
-                        
-                        trades.append({
-                            "symbol": symbol,
-                            "current_weight": current_weight,
-                            "target_weight": target_weight,
-                            "weight_difference": weight_diff,
-                            "dollar_amount": dollar_diff,
-                            "shares_to_trade": shares_to_trade,
-                            "action": "buy" if dollar_diff > 0 else "sell",
-                            "current_price": current_prices[symbol]
-                        })
-            
-            # Check for assets not in target (should be sold)
-            for symbol in current_weights:
-                if symbol not in target_weights:
-                    current_weight = current_weights[symbol]
-                    dollar_amount = current_weight * float(total_value)
-                    shares_to_trade = -dollar_amount / current_prices[symbol]
-                    
-                    trades.append({
-                        "symbol": symbol,
-                        "current_weight": current_weight,
-                        "target_weight": 0.0,
-                        "weight_difference": -current_weight,
-                        "dollar_amount": -dollar_amount,
-                        "shares_to_trade": shares_to_trade,
-                        "action": "sell",
-                        "current_price": current_prices[symbol]
-                    })
-                    rebalancing_needed = True
+            for weight, (_, current_price, symbol) in zip(weights.tolist(), holdings):
+                if symbol is not None:
+                    current_weights[symbol] = weight
+                    current_prices[symbol] = float(current_price)
+            
+            # Align targets, current weights and prices over every symbol involved: targeted
+            # symbols first, then held symbols without a target (which are sold outright)
+            symbols = list(target_weights) + [s for s in current_weights if s not in target_weights]
+            target = np.array([target_weights.get(s, 0.0) for s in symbols], dtype=np.float64)
+            current = np.array([current_weights.get(s, 0.0) for s in symbols], dtype=np.float64)
+            prices = np.array([current_prices.get(s, np.nan) for s in symbols], dtype=np.float64)
+            
+            # Calculate weight differences and dollar amounts to trade
+            weight_diff = target - current
+            dollar_diff = weight_diff * total_value
+            with np.errstate(divide="ignore", invalid="ignore"):
+                shares_to_trade = dollar_diff / prices
+            
+            outside_tolerance = np.abs(weight_diff) > tolerance
+            outside_tolerance[len(target_weights):] = True
+            rebalancing_needed = bool(outside_tolerance.any())
+            
+            # Trades need a current price, so only held symbols can be traded
+            trades = [
+                {
+                    "symbol": symbols[i],
+                    "current_weight": float(current[i]),
+                    "target_weight": float(target[i]),
+                    "weight_difference": float(weight_diff[i]),
+                    "dollar_amount": float(dollar_diff[i]),
+                    "shares_to_trade": float(shares_to_trade[i]),
+                    "action": "buy" if dollar_diff[i] > 0 else "sell",
+                    "current_price": float(prices[i])
+                }
+                for i in np.flatnonzero(outside_tolerance & ~np.isnan(prices))
+            ]
             
             return {
                 "rebalancing_needed": rebalancing_needed,
@@ -501,7 +709,8 @@ class PortfolioOptimizationService:
         self,
         weights: Dict[str, float],
         returns_data: pd.DataFrame,
-        scenarios: List[Dict[str, Any]]
+        scenarios: List[Dict[str, Any]],
+        seed: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Run what-if scenario analysis on portfolio
@@ -510,58 +719,71 @@ class PortfolioOptimizationService:
             weights: Portfolio weights
             returns_data: Historical returns data
             scenarios: List of scenario definitions
+            seed: Seed for the volatility shock noise, for reproducible results
             
         Returns:
             Scenario analysis results
         """
         try:
-            results = {}
-            
-            for i, scenario in enumerate(scenarios):
-                scenario_name = scenario.get("name", f"Scenario_{i+1}")
-                
-                # Apply scenario modifications to returns
-                modified_returns = returns_data.copy()
+            columns = list(returns_data.columns)
+            base_returns = returns_data.to_numpy(dtype=np.float64)
+            # Return shocks are constant offsets, so they leave each asset's std unchanged
+            base_std = base_returns.std(axis=0, ddof=1)
+            rng = np.random.default_rng(seed)
+            
+            # One (scenario, date, asset) tensor holding every modified return series
+            scenario_returns = np.broadcast_to(
+                base_returns, (len(scenarios),) + base_returns.shape
+            ).copy()
+            
+            for k, scenario in enumerate(scenarios):
+                modified_returns = scenario_returns[k]
                 
-                if "return_shock" in scenario:
+                shock = scenario.get("return_shock")
+                if shock:
                     # Apply return shock to specific assets or all
-                    shock = scenario["return_shock"]
                     if "assets" in shock:
-                        for asset in shock["assets"]:
-                            if asset in modified_returns.columns:
-                                modified_returns[asset] += shock["value"]
+                        shocked = np.isin(columns, shock["assets"])
+                        modified_returns[:, shocked] += shock["value"]
                     else:
                         modified_returns += shock["value"]
                 
-                if "volatility_shock" in scenario:
-                    # Increase volatility
-                    vol_shock = scenario["volatility_shock"]
-                    for col in modified_returns.columns:
-                        std = modified_returns[col].std()
-                        noise = np.random.normal(0, std * vol_shock["multiplier"], len(modified_returns))
-                        modified_returns[col] += noise
-                
-                # Calculate portfolio performance under scenario
-                weights_series = pd.Series([weights.get(col, 0) for col in modified_returns.columns], 
-                                         index=modified_returns.columns)
-                
-                portfolio_returns = (modified_returns * weights_series).sum(axis=1)
-                
-                # Calculate metrics
-                mean_return = portfolio_returns.mean() * 252  # Annualized
-                volatility = portfolio_returns.std() * np.sqrt(252)  # Annualized
-                sharpe_ratio = mean_return / volatility if volatility > 0 else 0
-                max_drawdown = (portfolio_returns.cumsum() - portfolio_returns.cumsum().expanding().max()).min()
-                var_95 = portfolio_returns.quantile(0.05)
-                
+                vol_shock = scenario.get("volatility_shock")
+                if vol_shock:
+                    # Increase volatility with noise scaled to each asset's historical std
+                    noise = rng.standard_normal(modified_returns.shape)
+                    noise *= base_std * vol_shock["multiplier"]
+                    modified_returns += noise
+            
+            # Calculate portfolio performance under every scenario at once
+            weights_array = np.array([weights.get(col, 0) for col in columns], dtype=np.float64)
+            portfolio_returns = scenario_returns @ weights_array
+            
+            # Calculate metrics
+            mean_return = portfolio_returns.mean(axis=1) * 252  # Annualized
+            volatility = portfolio_returns.std(axis=1, ddof=1) * np.sqrt(252)  # Annualized
+            sharpe_ratio = np.divide(
+                mean_return, volatility, out=np.zeros_like(mean_return), where=volatility > 0
+            )
+            # Drawdown of the compounded equity curve relative to its running peak, with the
+            # starting capital of 1 counted as the first peak
+            equity = np.cumprod(1 + portfolio_returns, axis=1)
+            peak = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+            max_drawdown = (equity / peak - 1).min(axis=1)
+            var_95 = np.quantile(portfolio_returns, 0.05, axis=1)
+            total_return = np.prod(1 + portfolio_returns, axis=1) - 1
+            
+            results = {}
+            for k, scenario in enumerate(scenarios):
+                scenario_name = scenario.get("name", f"Scenario_{k+1}")
                 results[scenario_name] = {
                     "description": scenario.get("description", ""),
-                    "annualized_return": mean_return,
-                    "volatility": volatility,
-                    "sharpe_ratio": sharpe_ratio,
-                    "max_drawdown": max_drawdown,
-                    "var_95": var_95,
-                    "total_return": (1 + portfolio_returns).prod() - 1
+                    "annualized_return": float(mean_return[k]),
+                    "volatility": float(volatility[k]),
+                    "sharpe_ratio": float(sharpe_ratio[k]),
+                    "max_drawdown": float(max_drawdown[k]),
+                    "var_95": float(var_95[k]),
+                    "total_return": float(total_return[k])
                 }
             
             return {
@@ -577,7 +799,8 @@ class PortfolioOptimizationService:
     def calculate_risk_budgeting(
         self,
         returns_data: pd.DataFrame,
-        risk_budget: Dict[str, float]
+        risk_budget: Dict[str, float],
+        cov_method: str = "ledoit_wolf"
     ) -> Dict[str, Any]:
         """
         Calculate risk budgeting allocation
@@ -585,38 +808,40 @@ class PortfolioOptimizationService:
         Args:
             returns_data: Historical returns data
             risk_budget: Target risk contribution by asset
+            cov_method: Covariance estimator ("ledoit_wolf", "oracle_approximating" or "sample")
             
         Returns:
             Risk budgeting portfolio weights
         """
         try:
-            from pypfopt import risk_models
-            from pypfopt.efficient_frontier import EfficientFrontier
-            
             # Calculate covariance matrix
-            S = risk_models.sample_cov(returns_data)
-            
-            # Risk budgeting optimization (simplified implementation)
-            # This is a placeholder for more sophisticated risk budgeting
-            n_assets = len(returns_data.columns)
-            equal_risk_weights = {asset: 1/n_assets for asset in returns_data.columns}
-            
-            # Calculate expected returns
-            mu = expected_returns.mean_historical_return(returns_data)
-            
-            # Create efficient frontier
-            ef = EfficientFrontier(mu, S)
-            weights = ef.min_volatility()  # Use min vol as approximation for equal risk
+            _, S = self._estimates(returns_data, cov_method)
+            S_np = np.ascontiguousarray(S.to_numpy(dtype=np.float64))
+            
+            # Target budgets; assets without one split whatever the given budgets leave over
+            assets = list(returns_data.columns)
+            given_total = sum(risk_budget.get(asset, 0.0) for asset in assets)
+            if given_total > 1 + 1e-9:
+                raise ValueError(f"Risk budgets sum to {given_total:.4f}, which exceeds 1")
+            unlisted = sum(asset not in risk_budget for asset in assets)
+            leftover_share = (1.0 - given_total) / unlisted if unlisted else 0.0
+            budget = np.array([risk_budget.get(asset, leftover_share) for asset in assets], dtype=np.float64)
+            if (budget <= 0).any():
+                raise ValueError("Risk budgets must be positive")
+            budget /= budget.sum()
+            
+            weights_array = _risk_budget_weights(S_np, budget)
+            weights = dict(zip(assets, weights_array.tolist()))
             
             # Calculate risk contributions
-            weights_array = np.array(list(weights.values()))
-            portfolio_vol = np.sqrt(np.dot(weights_array.T, np.dot(S, weights_array)))
+            cov_weights = S_np @ weights_array
+            portfolio_vol = float(np.sqrt(weights_array @ cov_weights))
             
-            marginal_contrib = np.dot(S, weights_array) / portfolio_vol
+            marginal_contrib = cov_weights / portfolio_vol
             contrib = weights_array * marginal_contrib
             risk_contrib = contrib / contrib.sum()
             
-            risk_contributions = {asset: contrib for asset, contrib in zip(returns_data.columns, risk_contrib)}
+            risk_contributions = dict(zip(assets, risk_contrib.tolist()))
             
             return {
                 "weights": weights,
@@ -1,17 +1,78 @@
 from typing import List, Optional, Tuple, Dict
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+import asyncio
+import functools
+import threading
+from cachetools import TTLCache
+from sqlalchemy.orm import Session, raiseload
+from sqlalchemy import and_, or_, case, delete, func, literal, select, update
 from datetime import datetime
 from decimal import Decimal
+from pydantic import TypeAdapter
 import structlog
 
-from app.models import Portfolio as PortfolioModel, PortfolioHolding
+from app.core.config import settings
+from app.models import Portfolio as PortfolioModel, PortfolioHolding, Asset as AssetModel, Transaction
 from app.schemas import (
     PortfolioCreate, PortfolioUpdate, Portfolio, PortfolioSummary
 )
 
 logger = structlog.get_logger()
 
+# Validates a whole page of ORM rows in one call instead of from_orm per row
+_PORTFOLIO_LIST_ADAPTER = TypeAdapter(List[Portfolio])
+
+
+def _in_thread(method):
+    """
+    Expose a blocking Session method as a coroutine that runs in a worker thread.
+    
+    The service keeps its synchronous Session; a request awaits one method at a
+    time, so the session is never used from two threads at once.
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await asyncio.to_thread(method, self, *args, **kwargs)
+    return wrapper
+
+
+def _read_options() -> tuple:
+    """
+    Loader options for read-only portfolio queries.
+    
+    With DEBUG_RAISELOAD on, any relationship the code did not load explicitly raises
+    instead of lazily issuing another SELECT, which surfaces N+1 patterns early.
+    """
+    return (raiseload('*', sql_only=True),) if settings.DEBUG_RAISELOAD else ()
+
+
+class PortfolioSummaryCache:
+    """Process-local TTL cache of portfolio summaries keyed by portfolio_id."""
+    
+    def __init__(self, maxsize: int = 1024, ttl: int = 30):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+    
+    def get(self, portfolio_id: int) -> Optional[PortfolioSummary]:
+        """Return the cached summary, or None if absent or expired."""
+        with self._lock:
+            return self._cache.get(portfolio_id)
+    
+    def set(self, portfolio_id: int, summary: PortfolioSummary):
+        """Store a summary."""
+        with self._lock:
+            self._cache[portfolio_id] = summary
+    
+    def invalidate(self, portfolio_id: Optional[int] = None):
+        """Drop one portfolio's summary, or the whole cache when no ID is given."""
+        with self._lock:
+            if portfolio_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(portfolio_id, None)
+
+
+summary_cache = PortfolioSummaryCache()
+
 
 class PortfolioService:
     """Service class for portfolio operations."""
@@ -19,39 +80,64 @@ class PortfolioService:
     def __init__(self, db: Session):
         self.db = db
     
-    async def get_portfolios(
+    @_in_thread
+    def get_portfolios(
         self,
         skip: int = 0,
         limit: int = 50,
         user_id: Optional[int] = None,
-        portfolio_type: Optional[str] = None
+        portfolio_type: Optional[str] = None,
+        after_id: Optional[int] = None
     ) -> Tuple[List[Portfolio], int]:
-        """Get portfolios with optional filtering."""
-        query = self.db.query(PortfolioModel)
+        """
+        Get portfolios with optional filtering, ordered by id.
         
-        # Apply filters
+        Pass the last id of the previous page as after_id to seek past it (keyset
+        pagination) instead of discarding skip rows; skip is ignored in that case.
+        """
+        filters = []
         if user_id:
-            query = query.filter(PortfolioModel.user_id == user_id)
+            filters.append(PortfolioModel.user_id == user_id)
         if portfolio_type:
-            query = query.filter(PortfolioModel.portfolio_type == portfolio_type)
+            filters.append(PortfolioModel.portfolio_type == portfolio_type)
+        
+        query = self.db.query(PortfolioModel).options(*_read_options()).filter(*filters)
         
-        # Get total count
-        total = query.count()
+        # Page and total count in one round trip: the total rides along as an extra column
+        if after_id is not None:
+            page = query.filter(PortfolioModel.id > after_id)
+            # The cursor narrows the page, not the total, so count the filtered set separately
+            total_count = select(func.count(PortfolioModel.id)).where(*filters).correlate(None).scalar_subquery()
+            skip = 0
+        else:
+            page = query
+            total_count = func.count().over()
         
-        # Apply pagination
-        portfolios = query.offset(skip).limit(limit).all()
+        rows = page.add_columns(
+            total_count.label('total_count')
+        ).order_by(PortfolioModel.id).offset(skip).limit(limit).all()
         
-        return [Portfolio.from_orm(p) for p in portfolios], total
+        if rows:
+            total = rows[0].total_count
+        else:
+            # A page past the end has no rows to carry the total
+            total = query.count() if skip or after_id is not None else 0
+        
+        return _PORTFOLIO_LIST_ADAPTER.validate_python(
+            [p for p, _ in rows], from_attributes=True
+        ), total
     
-    async def get_portfolio(self, portfolio_id: int) -> Optional[Portfolio]:
+    @_in_thread
+    def get_portfolio(self, portfolio_id: int) -> Optional[Portfolio]:
         """Get a specific portfolio by ID."""
-        portfolio = self.db.query(PortfolioModel).filter(
+        portfolio = self.db.query(PortfolioModel).options(*_read_options()).filter(
             PortfolioModel.id == portfolio_id
         ).first()
         
         return Portfolio.from_orm(portfolio) if portfolio else None
     
-    async def create_portfolio(self, portfolio_data: PortfolioCreate) -> Portfolio:
+    @_in_thread
+    def create_portfolio(self, portfolio_data: PortfolioCreate) -> Portfolio:
         """Create a new portfolio."""
         # For now, we'll use a default user_id (will be replaced with actual user in Phase 3)
         portfolio = PortfolioModel(
@@ -65,56 +151,94 @@ class PortfolioService:
         
         return Portfolio.from_orm(portfolio)
     
-    async def update_portfolio(
+    @_in_thread
+    def update_portfolio(
         self, 
         portfolio_id: int, 
         portfolio_update: PortfolioUpdate
     ) -> Optional[Portfolio]:
-        """Update a portfolio."""
-        portfolio = self.db.query(PortfolioModel).filter(
-            PortfolioModel.id == portfolio_id
-        ).first()
+        """Update a portfolio in a single UPDATE ... RETURNING statement."""
+        update_data = portfolio_update.dict(exclude_unset=True)
+        if not update_data:
+            portfolio = self.db.get(PortfolioModel, portfolio_id)
+            return Portfolio.from_orm(portfolio) if portfolio else None
+        
+        portfolio = self.db.execute(
+            update(PortfolioModel).where(
+                PortfolioModel.id == portfolio_id
+            ).values(**update_data).returning(PortfolioModel)
+        ).scalars().first()
         
         if not portfolio:
+            self.db.rollback()
             return None
         
-        update_data = portfolio_update.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(portfolio, field, value)
-        
+        # Serialize before commit expires the returned row
+        result = Portfolio.from_orm(portfolio)
         self.db.commit()
-        self.db.refresh(portfolio)
+        summary_cache.invalidate(portfolio_id)
         
-        return Portfolio.from_orm(portfolio)
+        return result
     
-    async def delete_portfolio(self, portfolio_id: int) -> bool:
-        """Delete a portfolio."""
-        portfolio = self.db.query(PortfolioModel).filter(
-            PortfolioModel.id == portfolio_id
+    @_in_thread
+    def delete_portfolio(self, portfolio_id: int) -> bool:
+        """
+        Delete a portfolio with its holdings and transactions.
+        
+        The children are removed with set-based DELETEs (mirroring the ORM cascade)
+        and the portfolio with DELETE ... RETURNING, so a missing portfolio is
+        detected without a prior SELECT.
+        """
+        self.db.execute(
+            delete(PortfolioHolding).where(PortfolioHolding.portfolio_id == portfolio_id)
+        )
+        self.db.execute(
+            delete(Transaction).where(Transaction.portfolio_id == portfolio_id)
+        )
+        deleted = self.db.execute(
+            delete(PortfolioModel).where(
+                PortfolioModel.id == portfolio_id
+            ).returning(PortfolioModel.id)
         ).first()
         
-        if not portfolio:
+        if not deleted:
+            self.db.rollback()
             return False
         
-        self.db.delete(portfolio)
         self.db.commit()
+        summary_cache.invalidate(portfolio_id)
         
         return True
     
-    async def get_portfolio_summary(self, portfolio_id: int) -> Optional[PortfolioSummary]:
-        """Get portfolio summary with key metrics."""
-        portfolio = self.db.query(PortfolioModel).filter(
-            PortfolioModel.id == portfolio_id
+    @_in_thread
+    def get_portfolio_summary(self, portfolio_id: int) -> Optional[PortfolioSummary]:
+        """Get portfolio summary with key metrics (cached briefly per portfolio)."""
+        cached = summary_cache.get(portfolio_id)
+        if cached is not None:
+            return cached
+        
+        # Count assets in the same statement via a correlated subquery
+        asset_count_subq = select(func.count(PortfolioHolding.id)).where(
+            PortfolioHolding.portfolio_id == PortfolioModel.id
+        ).correlate(PortfolioModel).scalar_subquery()
+        
+        row = self.db.execute(
+            select(PortfolioModel, asset_count_subq.label('asset_count'))
+            .options(*_read_options())
+            .where(PortfolioModel.id == portfolio_id)
         ).first()
         
-        if not portfolio:
+        if not row:
             return None
         
-        # Count assets in portfolio
-        asset_count = self.db.query(PortfolioHolding).filter(
-            PortfolioHolding.portfolio_id == portfolio_id
-        ).count()
-        
+        portfolio, asset_count = row
+        summary = self._build_summary(portfolio, asset_count)
+        summary_cache.set(portfolio_id, summary)
+        return summary
+    
+    @staticmethod
+    def _build_summary(portfolio: PortfolioModel, asset_count: int) -> PortfolioSummary:
+        """Build a PortfolioSummary from a portfolio row and its holding count."""
         return PortfolioSummary(
             id=portfolio.id,
             name=portfolio.name,
@@ -126,113 +250,175 @@ class PortfolioService:
             last_updated=portfolio.updated_at or portfolio.created_at
         )
     
-    async def get_portfolio_holdings(self, portfolio_id: int) -> List[Dict]:
-        """Get all holdings for a portfolio with detailed information."""
+    @_in_thread
+    def get_portfolio_holdings(self, portfolio_id: int) -> List[Dict]:
+        """
+        Get all holdings for a portfolio with detailed information.
+        
+        Rows come back as read-only mappings already shaped like the response,
+        so no per-row dict is built here.
+        """
         try:
-            from app.models import PortfolioHolding, Asset as AssetModel
-            
-            holdings_query = self.db.query(
-                PortfolioHolding,
-                AssetModel.symbol,
-                AssetModel.name,
+            holdings_query = select(
+                PortfolioHolding.id.label('holding_id'),
+                PortfolioHolding.asset_id,
+                AssetModel.symbol.label('asset_symbol'),
+                AssetModel.name.label('asset_name'),
                 AssetModel.asset_type,
-                AssetModel.sector
+                AssetModel.sector,
+                PortfolioHolding.quantity,
+                PortfolioHolding.average_cost,
+                PortfolioHolding.current_price,
+                PortfolioHolding.market_value,
+                PortfolioHolding.unrealized_gain_loss,
+                PortfolioHolding.unrealized_gain_loss_percentage,
+                func.coalesce(PortfolioHolding.updated_at, PortfolioHolding.created_at).label('last_updated')
             ).join(
                 AssetModel, PortfolioHolding.asset_id == AssetModel.id
-            ).filter(
+            ).where(
                 PortfolioHolding.portfolio_id == portfolio_id
             )
             
-            holdings = holdings_query.all()
-            
-            result = []
-            for holding, symbol, name, asset_type, sector in holdings:
-                result.append({
-                    'holding_id': holding.id,
-                    'asset_id': holding.asset_id,
-                    'asset_symbol': symbol,
-                    'asset_name': name,
-                    'asset_type': asset_type,
-                    'sector': sector,
-                    'quantity': holding.quantity,
-                    'average_cost': holding.average_cost,
-                    'current_price': holding.current_price,
-                    'market_value': holding.market_value,
-                    'unrealized_gain_loss': holding.unrealized_gain_loss,
-                    'unrealized_gain_loss_percentage': holding.unrealized_gain_loss_percentage,
-                    'last_updated': holding.updated_at or holding.created_at
-                })
-            
-            return result
+            return self.db.execute(holdings_query).mappings().all()
             
         except Exception as e:
             logger.error("Error getting portfolio holdings", portfolio_id=portfolio_id, error=str(e))
             raise
     
-    async def update_portfolio_holding(
+    @_in_thread
+    def update_portfolio_holding(
         self, 
         portfolio_id: int, 
         asset_id: int, 
         quantity: Decimal, 
         current_price: Optional[Decimal] = None
     ) -> Dict:
-        """Update a specific portfolio holding."""
+        """
+        Update a specific portfolio holding.
+        
+        Market value and unrealized gain/loss are computed by the database in the
+        same UPDATE, which returns the new values.
+        """
         try:
-            from app.models import PortfolioHolding
-            
-            holding = self.db.query(PortfolioHolding).filter(
-                PortfolioHolding.portfolio_id == portfolio_id,
-                PortfolioHolding.asset_id == asset_id
-            ).first()
-            
-            if not holding:
-                raise ValueError(f"Holding not found for portfolio {portfolio_id} and asset {asset_id}")
-            
-            # Update holding
-            holding.quantity = quantity
+            values = {'quantity': quantity}
             if current_price:
-                holding.current_price = current_price
-                holding.market_value = quantity * current_price
+                price = literal(current_price, PortfolioHolding.current_price.type)
+                market_value = price * quantity
                 
                 # Recalculate unrealized gain/loss
-                cost_basis = quantity * holding.average_cost
-                holding.unrealized_gain_loss = holding.market_value - cost_basis
+                cost_basis = PortfolioHolding.average_cost * quantity
+                gain_loss = market_value - cost_basis
                 
-                if cost_basis > 0:
-                    holding.unrealized_gain_loss_percentage = (
-                        holding.unrealized_gain_loss / cost_basis
-                    ) * 100
-                else:
-                    holding.unrealized_gain_loss_percentage = Decimal('0')
+                values.update(
+                    current_price=price,
+                    market_value=market_value,
+                    unrealized_gain_loss=gain_loss,
+                    unrealized_gain_loss_percentage=case(
+                        (cost_basis > 0, gain_loss / cost_basis * 100),
+                        else_=Decimal('0')
+                    )
+                )
+            
+            holding = self.db.execute(
+                update(PortfolioHolding).where(
+                    PortfolioHolding.portfolio_id == portfolio_id,
+                    PortfolioHolding.asset_id == asset_id
+                ).values(**values).returning(
+                    PortfolioHolding.id,
+                    PortfolioHolding.quantity,
+                    PortfolioHolding.current_price,
+                    PortfolioHolding.market_value,
+                    PortfolioHolding.unrealized_gain_loss,
+                    PortfolioHolding.unrealized_gain_loss_percentage
+                ).execution_options(synchronize_session=False)
+            ).mappings().first()
+            
+            if not holding:
+                self.db.rollback()
+                raise ValueError(f"Holding not found for portfolio {portfolio_id} and asset {asset_id}")
             
             self.db.commit()
-            self.db.refresh(holding)
+            summary_cache.invalidate(portfolio_id)
             
             return {
-                'holding_id': holding.id,
+                'holding_id': holding['id'],
                 'portfolio_id': portfolio_id,
                 'asset_id': asset_id,
-                'quantity': holding.quantity,
-                'current_price': holding.current_price,
-                'market_value': holding.market_value,
-                'unrealized_gain_loss': holding.unrealized_gain_loss,
-                'unrealized_gain_loss_percentage': holding.unrealized_gain_loss_percentage
+                'quantity': holding['quantity'],
+                'current_price': holding['current_price'],
+                'market_value': holding['market_value'],
+                'unrealized_gain_loss': holding['unrealized_gain_loss'],
+                'unrealized_gain_loss_percentage': holding['unrealized_gain_loss_percentage']
             }
             
         except Exception as e:
             logger.error("Error updating portfolio holding", portfolio_id=portfolio_id, error=str(e))
             raise
     
-    async def get_portfolio_aggregation(self, user_id: int) -> Dict:
+    @_in_thread
+    def bulk_update_holding_prices(self, portfolio_id: int, prices: Dict[int, Decimal]) -> int:
+        """
+        Set current prices for many holdings of a portfolio in one UPDATE.
+        
+        prices maps asset_id to the new price. Market value and unrealized gain/loss are
+        computed by the database from each row's quantity and average cost. Returns the
+        number of holdings updated.
+        """
+        try:
+            if not prices:
+                return 0
+            
+            new_price = case(prices, value=PortfolioHolding.asset_id)
+            cost_basis = PortfolioHolding.quantity * PortfolioHolding.average_cost
+            market_value = PortfolioHolding.quantity * new_price
+            gain_loss = market_value - cost_basis
+            
+            result = self.db.execute(
+                update(PortfolioHolding).where(
+                    PortfolioHolding.portfolio_id == portfolio_id,
+                    PortfolioHolding.asset_id.in_(list(prices))
+                ).values(
+                    current_price=new_price,
+                    market_value=market_value,
+                    unrealized_gain_loss=gain_loss,
+                    unrealized_gain_loss_percentage=case(
+                        (cost_basis > 0, gain_loss / cost_basis * 100),
+                        else_=Decimal('0')
+                    )
+                ).execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+            summary_cache.invalidate(portfolio_id)
+            
+            return result.rowcount
+            
+        except Exception as e:
+            self.db.rollback()
+            logger.error("Error bulk updating holding prices", portfolio_id=portfolio_id, error=str(e))
+            raise
+    
+    @_in_thread
+    def get_portfolio_aggregation(self, user_id: int) -> Dict:
         """Get aggregated portfolio data across all portfolios for a user."""
         try:
-            # Get all portfolios for the user
-            portfolios = self.db.query(PortfolioModel).filter(
+            # Get all portfolios for the user together with their holding counts; the totals
+            # are summed by the database as window columns over the same rows
+            rows = self.db.query(
+                PortfolioModel,
+                func.count(PortfolioHolding.id).label('asset_count'),
+                func.sum(PortfolioModel.current_value).over().label('total_value'),
+                func.sum(PortfolioModel.initial_value).over().label('total_initial_value'),
+                func.sum(PortfolioModel.total_return).over().label('total_return')
+            ).outerjoin(
+                PortfolioHolding, PortfolioHolding.portfolio_id == PortfolioModel.id
+            ).options(
+                *_read_options()
+            ).filter(
                 PortfolioModel.user_id == user_id,
                 PortfolioModel.is_active == True
-            ).all()
+            ).group_by(PortfolioModel.id).all()
             
-            if not portfolios:
+            if not rows:
                 return {
                     'user_id': user_id,
                     'total_portfolios': 0,
@@ -243,9 +429,9 @@ class PortfolioService:
                 }
             
             # Calculate aggregated metrics
-            total_value = sum(p.current_value for p in portfolios)
-            total_initial_value = sum(p.initial_value for p in portfolios)
-            total_return = sum(p.total_return for p in portfolios)
+            total_value = rows[0].total_value
+            total_initial_value = rows[0].total_initial_value
+            total_return = rows[0].total_return
             
             total_return_percentage = (
                 (total_return / total_initial_value) * 100 
@@ -253,15 +439,11 @@ class PortfolioService:
             )
             
             # Get portfolio summaries
-            portfolio_summaries = []
-            for portfolio in portfolios:
-                summary = await self.get_portfolio_summary(portfolio.id)
-                if summary:
-                    portfolio_summaries.append(summary)
+            portfolio_summaries = [self._build_summary(row[0], row.asset_count) for row in rows]
             
             return {
                 'user_id': user_id,
-                'total_portfolios': len(portfolios),
+                'total_portfolios': len(rows),
                 'total_value': total_value,
                 'total_initial_value': total_initial_value,
                 'total_return': total_return,
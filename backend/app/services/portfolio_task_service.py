@@ -1,17 +1,54 @@
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, List, Dict, Optional
 from datetime import datetime, date
+import asyncio
+import orjson
 import structlog
+from celery.schedules import crontab
 from sqlalchemy.orm import Session
 
 from app.core.database import SessionLocal
 from app.services.portfolio_calculation_engine import PortfolioCalculationEngine
 from app.services.portfolio_history_service import PortfolioHistoryService
 from app.models import Portfolio as PortfolioModel
+from app.utils.concurrency import fan_out
 
 
 logger = structlog.get_logger()
 
 
+def _update_in_new_session(portfolio_id: int) -> Dict:
+    """Recalculate one portfolio on a dedicated session (run on a worker thread)."""
+    with SessionLocal() as db:
+        engine = PortfolioCalculationEngine(db)
+        return asyncio.run(engine.calculate_portfolio_values(portfolio_id))
+
+
+def _report_in_new_session(portfolio_id: int, portfolio_name: str) -> Dict:
+    """Build one portfolio's report on a dedicated session (run on a worker thread)."""
+    with SessionLocal() as db:
+        engine = PortfolioCalculationEngine(db)
+        history_service = PortfolioHistoryService(db)
+        
+        async def build() -> Dict:
+            # Generate comprehensive report
+            portfolio_values = await engine.calculate_portfolio_values(portfolio_id)
+            portfolio_allocation = await engine.get_portfolio_allocation(portfolio_id)
+            portfolio_performance = await engine.calculate_portfolio_performance(portfolio_id)
+            performance_metrics = await history_service.calculate_performance_metrics(portfolio_id)
+            
+            return {
+                'portfolio_id': portfolio_id,
+                'portfolio_name': portfolio_name,
+                'values': portfolio_values,
+                'allocation': portfolio_allocation,
+                'performance': portfolio_performance,
+                'metrics': performance_metrics,
+                'generated_at': datetime.now().isoformat()
+            }
+        
+        return asyncio.run(build())
+
+
 class PortfolioTaskService:
     """Service for portfolio background tasks."""
     
@@ -19,19 +56,19 @@ class PortfolioTaskService:
     async def calculate_all_portfolios_task() -> Dict:
         """Background task to calculate all portfolio values."""
         try:
-            db = SessionLocal()
-            engine = PortfolioCalculationEngine(db)
-            
-            results = await engine.calculate_all_portfolios()
-            
-            logger.info(f"Portfolio calculation task completed. Updated {len(results)} portfolios")
-            
-            return {
-                'success': True,
-                'updated_portfolios': len(results),
-                'timestamp': datetime.now().isoformat(),
-                'results': results
-            }
+            with SessionLocal() as db:
+                engine = PortfolioCalculationEngine(db)
+                
+                results = await engine.calculate_all_portfolios()
+                
+                logger.info(f"Portfolio calculation task completed. Updated {len(results)} portfolios")
+                
+                return {
+                    'success': True,
+                    'updated_portfolios': len(results),
+                    'timestamp': datetime.now().isoformat(),
+                    'results': results
+                }
             
         except Exception as e:
             logger.error("Error in portfolio calculation task", error=str(e))
@@ -40,31 +77,29 @@ class PortfolioTaskService:
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             }
-        finally:
-            db.close()
     
     @staticmethod
     async def record_daily_snapshots_task(snapshot_date: Optional[date] = None) -> Dict:
         """Background task to record daily portfolio snapshots."""
         try:
-            db = SessionLocal()
-            history_service = PortfolioHistoryService(db)
-            
-            if not snapshot_date:
-                snapshot_date = date.today()
-            
-            results = await history_service.record_all_portfolios_snapshot(snapshot_date)
-            
-            logger.info(f"Daily snapshots task completed. Recorded {results['successful_snapshots']} snapshots")
-            
-            return {
-                'success': True,
-                'snapshot_date': snapshot_date.isoformat(),
-                'successful_snapshots': results['successful_snapshots'],
-                'total_portfolios': results['total_portfolios'],
-                'errors': results['errors'],
-                'timestamp': datetime.now().isoformat()
-            }
+            with SessionLocal() as db:
+                history_service = PortfolioHistoryService(db)
+                
+                if not snapshot_date:
+                    snapshot_date = date.today()
+                
+                results = await history_service.record_all_portfolios_snapshot(snapshot_date)
+                
+                logger.info(f"Daily snapshots task completed. Recorded {results['successful_snapshots']} snapshots")
+                
+                return {
+                    'success': True,
+                    'snapshot_date': snapshot_date.isoformat(),
+                    'successful_snapshots': results['successful_snapshots'],
+                    'total_portfolios': results['total_portfolios'],
+                    'errors': results['errors'],
+                    'timestamp': datetime.now().isoformat()
+                }
             
         except Exception as e:
             logger.error("Error in daily snapshots task", error=str(e))
@@ -73,37 +108,23 @@ class PortfolioTaskService:
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             }
-        finally:
-            db.close()
     
     @staticmethod
     async def update_portfolio_prices_task() -> Dict:
         """Background task to update portfolio holdings with latest prices."""
         try:
-            db = SessionLocal()
-            
-            # Get all active portfolios
-            portfolios = db.query(PortfolioModel).filter(
-                PortfolioModel.is_active == True
-            ).all()
-            
-            engine = PortfolioCalculationEngine(db)
-            
-            updated_portfolios = []
-            errors = []
+            # Get all active portfolios; the session is released before the fan-out
+            with SessionLocal() as db:
+                portfolios = db.query(PortfolioModel.id).filter(
+                    PortfolioModel.is_active == True
+                ).all()
             
-            for portfolio in portfolios:
-                try:
-                    # Update portfolio values (this will fetch latest prices)
-                    result = await engine.calculate_portfolio_values(portfolio.id)
-                    updated_portfolios.append(result)
-                    
-                except Exception as e:
-                    errors.append({
-                        'portfolio_id': portfolio.id,
-                        'error': str(e)
-                    })
-                    logger.error(f"Error updating portfolio {portfolio.id}", error=str(e))
+            # Each portfolio is recalculated on its own session, several at a time
+            updated_portfolios, errors = await fan_out(
+                _update_in_new_session, [(portfolio.id,) for portfolio in portfolios]
+            )
+            for error in errors:
+                logger.error(f"Error updating portfolio {error['portfolio_id']}", error=error['error'])
             
             logger.info(f"Portfolio prices update task completed. Updated {len(updated_portfolios)} portfolios")
             
@@ -123,26 +144,24 @@ class PortfolioTaskService:
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             }
-        finally:
-            db.close()
     
     @staticmethod
     async def cleanup_old_data_task(days_to_keep: int = 1095) -> Dict:
         """Background task to cleanup old portfolio history data."""
         try:
-            db = SessionLocal()
-            history_service = PortfolioHistoryService(db)
-            
-            results = await history_service.cleanup_old_history(days_to_keep)
-            
-            logger.info(f"Data cleanup task completed. Deleted {results['deleted_count']} old records")
-            
-            return {
-                'success': True,
-                'deleted_count': results['deleted_count'],
-                'cutoff_date': results['cutoff_date'],
-                'timestamp': datetime.now().isoformat()
-            }
+            with SessionLocal() as db:
+                history_service = PortfolioHistoryService(db)
+                
+                results = await history_service.cleanup_old_history(days_to_keep)
+                
+                logger.info(f"Data cleanup task completed. Deleted {results['deleted_count']} old records")
+                
+                return {
+                    'success': True,
+                    'deleted_count': results['deleted_count'],
+                    'cutoff_date': results['cutoff_date'],
+                    'timestamp': datetime.now().isoformat()
+                }
             
         except Exception as e:
             logger.error("Error in data cleanup task", error=str(e))
@@ -151,70 +170,64 @@ class PortfolioTaskService:
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             }
-        finally:
-            db.close()
     
     @staticmethod
-    async def generate_portfolio_reports_task(portfolio_ids: Optional[List[int]] = None) -> Dict:
-        """Background task to generate portfolio reports."""
+    async def generate_portfolio_reports_task(
+        portfolio_ids: Optional[List[int]] = None,
+        chunk_size: int = 500,
+        report_writer: Optional[Callable[[bytes], Awaitable[None]]] = None
+    ) -> Dict:
+        """
+        Background task to generate portfolio reports.
+        
+        Reports are built chunk_size portfolios at a time. With a report_writer each chunk
+        is handed over as a JSON document and dropped, so memory stays bounded by one chunk
+        and the result carries counts only; without one the reports are returned inline.
+        """
         try:
-            db = SessionLocal()
-            
-            # Get portfolios to process
-            if portfolio_ids:
-                portfolios = db.query(PortfolioModel).filter(
-                    PortfolioModel.id.in_(portfolio_ids),
+            # Get portfolios to process; the session is released before the fan-out
+            with SessionLocal() as db:
+                query = db.query(PortfolioModel.id, PortfolioModel.name).filter(
                     PortfolioModel.is_active == True
-                ).all()
-            else:
-                portfolios = db.query(PortfolioModel).filter(
-                    PortfolioModel.is_active == True
-                ).all()
-            
-            engine = PortfolioCalculationEngine(db)
-            history_service = PortfolioHistoryService(db)
+                )
+                if portfolio_ids:
+                    query = query.filter(PortfolioModel.id.in_(portfolio_ids))
+                portfolios = query.all()
             
             reports = []
             errors = []
+            generated = 0
             
-            for portfolio in portfolios:
-                try:
-                    # Generate comprehensive report
-                    portfolio_values = await engine.calculate_portfolio_values(portfolio.id)
-                    portfolio_allocation = await engine.get_portfolio_allocation(portfolio.id)
-                    portfolio_performance = await engine.calculate_portfolio_performance(portfolio.id)
-                    performance_metrics = await history_service.calculate_performance_metrics(portfolio.id)
-                    
-                    report = {
-                        'portfolio_id': portfolio.id,
-                        'portfolio_name': portfolio.name,
-                        'values': portfolio_values,
-                        'allocation': portfolio_allocation,
-                        'performance': portfolio_performance,
-                        'metrics': performance_metrics,
-                        'generated_at': datetime.now().isoformat()
-                    }
-                    
-                    reports.append(report)
-                    
-                except Exception as e:
-                    errors.append({
-                        'portfolio_id': portfolio.id,
-                        'error': str(e)
-                    })
-                    logger.error(f"Error generating report for portfolio {portfolio.id}", error=str(e))
+            for start in range(0, len(portfolios), chunk_size):
+                # Each report is built on its own session, several at a time
+                chunk_reports, chunk_errors = await fan_out(
+                    _report_in_new_session, [tuple(row) for row in portfolios[start:start + chunk_size]]
+                )
+                for error in chunk_errors:
+                    logger.error(f"Error generating report for portfolio {error['portfolio_id']}", error=error['error'])
+                
+                generated += len(chunk_reports)
+                errors.extend(chunk_errors)
+                if report_writer is not None:
+                    await report_writer(
+                        orjson.dumps(chunk_reports, default=str, option=orjson.OPT_NON_STR_KEYS)
+                    )
+                else:
+                    reports.extend(chunk_reports)
             
-            logger.info(f"Portfolio reports generation task completed. Generated {len(reports)} reports")
+            logger.info(f"Portfolio reports generation task completed. Generated {generated} reports")
             
-            return {
+            result = {
                 'success': True,
-                'generated_reports': len(reports),
+                'generated_reports': generated,
                 'total_portfolios': len(portfolios),
                 'errors': len(errors),
                 'error_details': errors,
-                'reports': reports,
                 'timestamp': datetime.now().isoformat()
             }
+            if report_writer is None:
+                result['reports'] = reports
+            return result
             
         except Exception as e:
             logger.error("Error in portfolio reports generation task", error=str(e))
@@ -223,35 +236,34 @@ class PortfolioTaskService:
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             }
-        finally:
-            db.close()
 
 
-# Schedule configuration for background tasks
+# Schedule configuration for background tasks; the crontab entries are parsed once here
+# rather than on every scheduler tick
 PORTFOLIO_TASKS_SCHEDULE = {
     'calculate_all_portfolios': {
         'task': 'calculate_all_portfolios_task',
-        'schedule': '*/30 * * * *',  # Every 30 minutes
+        'schedule': crontab(minute='*/30'),  # Every 30 minutes
         'description': 'Calculate all portfolio values'
     },
     'record_daily_snapshots': {
         'task': 'record_daily_snapshots_task',
-        'schedule': '0 0 * * *',  # Daily at midnight
+        'schedule': crontab(minute=0, hour=0),  # Daily at midnight
         'description': 'Record daily portfolio snapshots'
     },
     'update_portfolio_prices': {
         'task': 'update_portfolio_prices_task',
-        'schedule': '*/15 * * * *',  # Every 15 minutes during market hours
+        'schedule': crontab(minute='*/15'),  # Every 15 minutes during market hours
         'description': 'Update portfolio holdings with latest prices'
     },
     'cleanup_old_data': {
         'task': 'cleanup_old_data_task',
-        'schedule': '0 2 * * 0',  # Weekly on Sunday at 2 AM
+        'schedule': crontab(minute=0, hour=2, day_of_week=0),  # Weekly on Sunday at 2 AM
         'description': 'Cleanup old portfolio history data'
     },
     'generate_portfolio_reports': {
         'task': 'generate_portfolio_reports_task',
-        'schedule': '0 6 * * *',  # Daily at 6 AM
+        'schedule': crontab(minute=0, hour=6),  # Daily at 6 AM
         'description': 'Generate comprehensive portfolio reports'
     }
 }
@@ -9,8 +9,14 @@ Version: 1.0
 
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import Dict, Any, Optional
 import scipy.stats as stats
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
 try:
     import empyrical as emp
 except ImportError:
@@ -22,6 +28,188 @@ TRADING_DAYS_PER_YEAR = 252
 RISK_FREE_RATE = 0.02  # 2% annual risk-free rate
 
 
+def _lower_tail_quantiles(values, probabilities) -> np.ndarray:
+    """
+    Linearly interpolated quantiles (np.percentile's default method) for several
+    probabilities, selected with one np.partition call rather than one per level.
+    """
+    a = np.asarray(values, dtype=np.float64)
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    if a.size == 0 or np.isnan(a).any():
+        return np.full(probabilities.shape, np.nan)
+    
+    positions = probabilities * (a.size - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, a.size - 1)
+    partitioned = np.partition(a, np.unique(np.concatenate([lower, upper])))
+    return partitioned[lower] + (partitioned[upper] - partitioned[lower]) * (positions - lower)
+
+
+def _drawdown_scan_loop(returns: np.ndarray):
+    """
+    Single pass over a return array for the drawdown analysis.
+    
+    Returns (max_drawdown, max_drawdown_pos, peak_pos, recovery_pos, drawdown_sum,
+    drawdown_count); positions are -1 when undefined. NaN returns are skipped.
+    """
+    wealth = 1.0
+    running_max = -np.inf
+    current_peak_pos = -1
+    max_drawdown = np.inf
+    max_drawdown_pos = -1
+    peak_pos = -1
+    peak_value = 0.0
+    recovery_pos = -1
+    drawdown_sum = 0.0
+    drawdown_count = 0
+    
+    for i in range(returns.shape[0]):
+        r = returns[i]
+        if np.isnan(r):
+            continue
+        wealth *= 1.0 + r
+        if wealth > running_max:
+            running_max = wealth
+            current_peak_pos = i
+        drawdown = (wealth - running_max) / running_max
+        
+        if drawdown < max_drawdown:
+            max_drawdown = drawdown
+            max_drawdown_pos = i
+            peak_pos = current_peak_pos
+            peak_value = running_max
+            recovery_pos = -1
+        if recovery_pos == -1 and max_drawdown_pos != -1 and wealth >= peak_value:
+            recovery_pos = i
+        
+        if drawdown < 0:
+            drawdown_sum += drawdown
+            drawdown_count += 1
+    
+    if max_drawdown_pos == -1:
+        max_drawdown = np.nan
+    return max_drawdown, max_drawdown_pos, peak_pos, recovery_pos, drawdown_sum, drawdown_count
+
+
+_drawdown_scan = njit(cache=True)(_drawdown_scan_loop) if njit is not None else _drawdown_scan_loop
+
+
+def _rolling_correlation_matrix_loop(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Rolling pairwise correlations of the columns of a (T, K) array.
+    
+    Each asset pair keeps running means and centered co-moments that are updated
+    in O(1) as a sample enters and leaves the window (Welford's update and its
+    inverse), so level-like inputs do not cancel as raw sums of squares would;
+    pairs are processed in parallel. Rows with a NaN in either column are left out
+    of that pair's window, and a window yields a value only when all of its rows
+    are valid.
+    """
+    n_obs, n_assets = values.shape
+    result = np.full((n_obs, n_assets, n_assets), np.nan)
+    
+    for pair in prange(n_assets * n_assets):
+        i = pair // n_assets
+        j = pair % n_assets
+        if j < i:
+            continue
+        
+        count = 0
+        mean_x = 0.0
+        mean_y = 0.0
+        m2_x = 0.0
+        m2_y = 0.0
+        c_xy = 0.0
+        for t in range(n_obs):
+            x = values[t, i]
+            y = values[t, j]
+            if not (np.isnan(x) or np.isnan(y)):
+                count += 1
+                dx = x - mean_x
+                dy = y - mean_y
+                mean_x += dx / count
+                mean_y += dy / count
+                m2_x += dx * (x - mean_x)
+                m2_y += dy * (y - mean_y)
+                c_xy += dx * (y - mean_y)
+            if t >= window:
+                x = values[t - window, i]
+                y = values[t - window, j]
+                if not (np.isnan(x) or np.isnan(y)):
+                    count -= 1
+                    if count == 0:
+                        mean_x = 0.0
+                        mean_y = 0.0
+                        m2_x = 0.0
+                        m2_y = 0.0
+                        c_xy = 0.0
+                    else:
+                        dx = x - mean_x
+                        dy = y - mean_y
+                        mean_x -= dx / count
+                        mean_y -= dy / count
+                        m2_x -= dx * (x - mean_x)
+                        m2_y -= dy * (y - mean_y)
+                        c_xy -= dx * (y - mean_y)
+            
+            if count == window and m2_x > 0 and m2_y > 0:
+                corr = 1.0 if i == j else c_xy / np.sqrt(m2_x * m2_y)
+                result[t, i, j] = corr
+                result[t, j, i] = corr
+    
+    return result
+
+
+def _rolling_mean_std_loop(values: np.ndarray, window: int):
+    """
+    Rolling mean and sample standard deviation in one pass.
+    
+    The mean and sum of squared deviations are updated in O(1) as a sample enters
+    and leaves the window (Welford's update and its inverse), which stays accurate
+    where raw sums of squares would cancel. Windows containing a NaN yield NaN, as
+    with pandas' default min_periods.
+    """
+    n_obs = values.shape[0]
+    means = np.full(n_obs, np.nan)
+    stds = np.full(n_obs, np.nan)
+    count = 0
+    mean = 0.0
+    sq_dev = 0.0
+    
+    for t in range(n_obs):
+        x = values[t]
+        if not np.isnan(x):
+            count += 1
+            delta = x - mean
+            mean += delta / count
+            sq_dev += delta * (x - mean)
+        if t >= window:
+            x = values[t - window]
+            if not np.isnan(x):
+                count -= 1
+                if count == 0:
+                    mean = 0.0
+                    sq_dev = 0.0
+                else:
+                    delta = x - mean
+                    mean -= delta / count
+                    sq_dev -= delta * (x - mean)
+        
+        if count == window and window > 1:
+            means[t] = mean
+            stds[t] = np.sqrt(sq_dev / (window - 1)) if sq_dev > 0 else 0.0
+    
+    return means, stds
+
+
+_rolling_mean_std = njit(cache=True)(_rolling_mean_std_loop) if njit is not None else None
+
+
+_rolling_correlation_matrix = (
+    njit(cache=True, parallel=True)(_rolling_correlation_matrix_loop) if njit is not None else None
+)
+
+
 class RiskMetrics:
     """
     Core risk metrics class combining Empyrical library with custom calculations.
@@ -113,20 +301,21 @@ class RiskMetrics:
         drawdown_info = RiskMetrics._drawdown_analysis(returns)
         metrics.update(drawdown_info)
         
-        # Beta calculation if benchmark provided
+        # Beta, alpha, correlation and active-risk metrics if benchmark provided
         if benchmark is not None:
-            metrics['beta'] = RiskMetrics._calculate_beta(returns, benchmark)
-            metrics['alpha'] = RiskMetrics._calculate_alpha(returns, benchmark, periods)
-            metrics['correlation'] = returns.corr(benchmark)
-            metrics['r_squared'] = metrics['correlation'] ** 2
+            regression_stats = RiskMetrics._joint_regression_stats(returns, benchmark, periods)
+            metrics['beta'] = regression_stats['beta']
+            metrics['alpha'] = regression_stats['alpha']
+            metrics['correlation'] = regression_stats['correlation']
+            metrics['r_squared'] = regression_stats['r_squared']
             
             if not np.isnan(metrics['beta']) and metrics['beta'] != 0:
                 metrics['treynor_ratio'] = (returns.mean() * periods) / metrics['beta']
             else:
                 metrics['treynor_ratio'] = np.nan
                 
-            metrics['information_ratio'] = RiskMetrics._information_ratio(returns, benchmark, periods)
-            metrics['tracking_error'] = RiskMetrics._tracking_error(returns, benchmark, periods)
+            metrics['information_ratio'] = regression_stats['information_ratio']
+            metrics['tracking_error'] = regression_stats['tracking_error']
         
         return metrics
     
@@ -144,7 +333,7 @@ class RiskMetrics:
         """Calculate historical Value at Risk."""
         if len(returns) == 0:
             return np.nan
-        return np.percentile(returns, (1 - confidence_level) * 100)
+        return float(_lower_tail_quantiles(returns, [1 - confidence_level])[0])
     
     @staticmethod
     def _parametric_var(returns: pd.Series, confidence_level: float) -> float:
@@ -158,7 +347,7 @@ class RiskMetrics:
     
     @staticmethod
     def _drawdown_analysis(returns: pd.Series) -> Dict[str, Any]:
-        """Detailed drawdown analysis."""
+        """Detailed drawdown analysis, computed in one pass over the returns."""
         if len(returns) == 0:
             return {
                 'max_drawdown': np.nan,
@@ -170,33 +359,25 @@ class RiskMetrics:
                 'drawdown_periods': 0
             }
         
-        cumulative_returns = (1 + returns).cumprod()
-        running_max = cumulative_returns.cummax()
-        drawdown = (cumulative_returns - running_max) / running_max
+        max_drawdown, max_drawdown_pos, peak_pos, recovery_pos, drawdown_sum, drawdown_count = _drawdown_scan(
+            returns.to_numpy(dtype=np.float64)
+        )
         
-        max_drawdown = drawdown.min()
-        max_drawdown_idx = drawdown.idxmin() if not pd.isna(drawdown.min()) else None
+        index = returns.index
+        max_drawdown_idx = index[max_drawdown_pos] if max_drawdown_pos >= 0 else None
         
-        # Find peak and recovery
-        peak_idx = None
+        # Map peak and recovery positions back to index labels
+        peak_idx = index[peak_pos] if max_drawdown_idx is not None else None
         recovery_idx = None
         duration = None
         
-        if max_drawdown_idx is not None:
-            peak_idx = running_max.loc[:max_drawdown_idx].idxmax()
-            
-            # Find recovery point
-            peak_value = running_max.loc[peak_idx]
-            post_drawdown = cumulative_returns.loc[max_drawdown_idx:]
-            recovery_points = post_drawdown[post_drawdown >= peak_value]
-            
-            if not recovery_points.empty:
-                recovery_idx = recovery_points.index[0]
-                # Calculate duration in days or periods
-                if hasattr(recovery_idx, 'days'):
-                    duration = (recovery_idx - peak_idx).days
-                else:
-                    duration = len(returns.loc[peak_idx:recovery_idx])
+        if max_drawdown_idx is not None and recovery_pos >= 0:
+            recovery_idx = index[recovery_pos]
+            # Calculate duration in days or periods
+            if hasattr(recovery_idx, 'days'):
+                duration = (recovery_idx - peak_idx).days
+            else:
+                duration = recovery_pos - peak_pos + 1
         
         return {
             'max_drawdown': max_drawdown,
@@ -204,58 +385,61 @@ class RiskMetrics:
             'peak_date': peak_idx,
             'recovery_date': recovery_idx,
             'drawdown_duration': duration,
-            'avg_drawdown': drawdown[drawdown < 0].mean() if len(drawdown[drawdown < 0]) > 0 else np.nan,
-            'drawdown_periods': len(drawdown[drawdown < 0])
+            'avg_drawdown': drawdown_sum / drawdown_count if drawdown_count > 0 else np.nan,
+            'drawdown_periods': drawdown_count
         }
     
     @staticmethod
-    def _calculate_beta(returns: pd.Series, benchmark: pd.Series) -> float:
-        """Calculate beta using regression."""
-        # Align the series
-        aligned_data = pd.DataFrame({'returns': returns, 'benchmark': benchmark}).dropna()
-        
-        if len(aligned_data) < 2:
-            return np.nan
-            
-        covariance = aligned_data['returns'].cov(aligned_data['benchmark'])
-        benchmark_variance = aligned_data['benchmark'].var()
-        
-        return covariance / benchmark_variance if benchmark_variance != 0 else np.nan
-    
-    @staticmethod
-    def _calculate_alpha(returns: pd.Series, benchmark: pd.Series, periods: int) -> float:
-        """Calculate alpha (excess return over benchmark adjusted for beta)."""
-        beta = RiskMetrics._calculate_beta(returns, benchmark)
-        if np.isnan(beta):
-            return np.nan
-        
-        annual_return = returns.mean() * periods
-        annual_benchmark_return = benchmark.mean() * periods
-        
-        return annual_return - (beta * annual_benchmark_return)
-    
-    @staticmethod
-    def _information_ratio(returns: pd.Series, benchmark: pd.Series, periods: int) -> float:
-        """Calculate information ratio."""
-        excess_returns = returns - benchmark
-        if len(excess_returns.dropna()) == 0:
-            return np.nan
-        
-        excess_mean = excess_returns.mean()
-        excess_std = excess_returns.std()
-        
-        if excess_std == 0:
-            return np.nan
+    def _joint_regression_stats(returns: pd.Series, benchmark: pd.Series, periods: int) -> Dict[str, float]:
+        """
+        Calculate beta, alpha, correlation, R-squared, information ratio and tracking
+        error from one aligned pass over the return/benchmark pairs.
         
-        return (excess_mean * periods) / (excess_std * np.sqrt(periods))
-    
-    @staticmethod
-    def _tracking_error(returns: pd.Series, benchmark: pd.Series, periods: int) -> float:
-        """Calculate tracking error."""
-        excess_returns = returns - benchmark
-        if len(excess_returns.dropna()) == 0:
-            return np.nan
-        return excess_returns.std() * np.sqrt(periods)
+        Pairs with a missing value on either side are dropped once; every statistic
+        then follows from the centered second moments of the remaining pairs.
+        """
+        aligned_returns, aligned_benchmark = returns.align(benchmark)
+        y = aligned_returns.to_numpy(dtype=np.float64)
+        x = aligned_benchmark.to_numpy(dtype=np.float64)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x = x[valid]
+        y = y[valid]
+        n = x.size
+        
+        regression_stats = {
+            'beta': np.nan,
+            'alpha': np.nan,
+            'correlation': np.nan,
+            'r_squared': np.nan,
+            'information_ratio': np.nan,
+            'tracking_error': np.nan
+        }
+        if n == 0:
+            return regression_stats
+        
+        x_dev = x - x.mean()
+        y_dev = y - y.mean()
+        sxx = x_dev @ x_dev
+        syy = y_dev @ y_dev
+        sxy = x_dev @ y_dev
+        
+        if n >= 2:
+            if sxx != 0:
+                regression_stats['beta'] = sxy / sxx
+                # Alpha uses each series' own full-sample mean
+                regression_stats['alpha'] = returns.mean() * periods - regression_stats['beta'] * benchmark.mean() * periods
+            if sxx > 0 and syy > 0:
+                regression_stats['correlation'] = sxy / np.sqrt(sxx * syy)
+                regression_stats['r_squared'] = regression_stats['correlation'] ** 2
+        
+        # Active return is y - x, whose variance follows from the same moments
+        excess_mean = y.mean() - x.mean()
+        excess_std = np.sqrt(max(syy + sxx - 2 * sxy, 0.0) / (n - 1)) if n >= 2 else np.nan
+        regression_stats['tracking_error'] = excess_std * np.sqrt(periods)
+        if excess_std != 0:
+            regression_stats['information_ratio'] = (excess_mean * periods) / (excess_std * np.sqrt(periods))
+        
+        return regression_stats
 
 
 class RollingMetrics:
@@ -266,10 +450,21 @@ class RollingMetrics:
     @staticmethod
     def rolling_sharpe_ratio(returns: pd.Series, window: int = 252, 
                            risk_free_rate: float = RISK_FREE_RATE) -> pd.Series:
-        """Calculate rolling Sharpe ratio."""
-        rolling_mean = returns.rolling(window=window).mean() * TRADING_DAYS_PER_YEAR
-        rolling_std = returns.rolling(window=window).std() * np.sqrt(TRADING_DAYS_PER_YEAR)
-        return (rolling_mean - risk_free_rate) / rolling_std
+        """
+        Calculate rolling Sharpe ratio.
+        
+        With numba installed, the rolling mean and volatility come from one
+        incremental pass instead of two separate pandas rolling reductions.
+        """
+        if _rolling_mean_std is None:
+            rolling_mean = returns.rolling(window=window).mean() * TRADING_DAYS_PER_YEAR
+            rolling_std = returns.rolling(window=window).std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+            return (rolling_mean - risk_free_rate) / rolling_std
+        
+        means, stds = _rolling_mean_std(returns.to_numpy(dtype=np.float64), window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = (means * TRADING_DAYS_PER_YEAR - risk_free_rate) / (stds * np.sqrt(TRADING_DAYS_PER_YEAR))
+        return pd.Series(sharpe, index=returns.index)
     
     @staticmethod
     def rolling_volatility(returns: pd.Series, window: int = 252) -> pd.Series:
@@ -278,22 +473,18 @@ class RollingMetrics:
     
     @staticmethod
     def rolling_beta(returns: pd.Series, benchmark: pd.Series, window: int = 252) -> pd.Series:
-        """Calculate rolling beta."""
-        def calculate_beta(y, x):
-            if len(y) < 2 or len(x) < 2:
-                return np.nan
-            covariance = np.cov(y, x)[0, 1]
-            variance = np.var(x)
-            return covariance / variance if variance != 0 else np.nan
-        
-        rolling_beta = pd.Series(index=returns.index, dtype=float)
-        
-        for i in range(window, len(returns)):
-            y_window = returns.iloc[i-window:i]
-            x_window = benchmark.iloc[i-window:i]
-            rolling_beta.iloc[i] = calculate_beta(y_window, x_window)
+        """
+        Calculate rolling beta.
         
-        return rolling_beta
+        Uses the moment identity cov(x, y) = E[xy] - E[x]E[y] over each window, so
+        every term is a single O(N) pandas rolling mean instead of a per-window np.cov.
+        """
+        xy_mean = (returns * benchmark).rolling(window=window).mean()
+        returns_mean = returns.rolling(window=window).mean()
+        benchmark_mean = benchmark.rolling(window=window).mean()
+        covariance = xy_mean - returns_mean * benchmark_mean
+        variance = benchmark.rolling(window=window).var(ddof=0)
+        return covariance / variance.where(variance != 0)
     
     @staticmethod
     def rolling_alpha(returns: pd.Series, benchmark: pd.Series, window: int = 252,
@@ -308,15 +499,22 @@ class RollingMetrics:
     
     @staticmethod
     def rolling_max_drawdown(returns: pd.Series, window: int = 252) -> pd.Series:
-        """Calculate rolling maximum drawdown."""
-        rolling_max_dd = pd.Series(index=returns.index, dtype=float)
+        """
+        Calculate rolling maximum drawdown.
+        
+        Wealth is compounded once over the whole series; since drawdowns are ratios to
+        the running peak, each window's drawdown follows from that path directly, and
+        all windows are reduced together over a strided view.
+        """
+        rolling_max_dd = pd.Series(np.nan, index=returns.index, dtype=float)
+        if len(returns) < window:
+            return rolling_max_dd
         
-        for i in range(window, len(returns)):
-            window_returns = returns.iloc[i-window:i]
-            cumulative_returns = (1 + window_returns).cumprod()
-            running_max = cumulative_returns.cummax()
-            drawdown = (cumulative_returns - running_max) / running_max
-            rolling_max_dd.iloc[i] = drawdown.min()
+        # Missing days compound as flat so a gap does not blank every window covering it
+        wealth = (1 + returns.fillna(0)).cumprod().to_numpy(dtype=np.float64)
+        windows = sliding_window_view(wealth, window)
+        running_max = np.maximum.accumulate(windows, axis=1)
+        rolling_max_dd.iloc[window - 1:] = (windows / running_max).min(axis=1) - 1
         
         return rolling_max_dd
     
@@ -345,14 +543,9 @@ class BenchmarkComparison:
         Returns:
             DataFrame with side-by-side comparison
         """
-        # Calculate metrics for both
-        portfolio_metrics = RiskMetrics.calculate_return_metrics(portfolio_returns)
-        portfolio_risk = RiskMetrics.calculate_risk_metrics(portfolio_returns, benchmark_returns)
-        portfolio_metrics.update(portfolio_risk)
-        
-        benchmark_metrics = RiskMetrics.calculate_return_metrics(benchmark_returns)
-        benchmark_risk = RiskMetrics.calculate_risk_metrics(benchmark_returns)
-        benchmark_metrics.update(benchmark_risk)
+        # Calculate the compared metrics for both, one fused summary per series
+        portfolio_metrics = BenchmarkComparison._summarize(portfolio_returns, periods)
+        benchmark_metrics = BenchmarkComparison._summarize(benchmark_returns, periods)
         
         # Key metrics for comparison
         key_metrics = [
@@ -383,6 +576,59 @@ class BenchmarkComparison:
         
         return pd.DataFrame(comparison_data)
     
+    @staticmethod
+    def _summarize(returns: pd.Series, periods: int = TRADING_DAYS_PER_YEAR,
+                   risk_free_rate: float = RISK_FREE_RATE) -> Dict[str, float]:
+        """
+        Compute the metrics compared by compare_performance in a few array passes.
+        
+        Matches the RiskMetrics definitions (pandas' bias-corrected skew and excess
+        kurtosis, sample volatility, interpolated historical VaR) but shares one
+        demeaned array for all moments and one wealth path for the drawdown.
+        """
+        raw = np.asarray(returns, dtype=np.float64)
+        a = raw[~np.isnan(raw)]
+        n = a.size
+        metrics = {
+            'annual_return': np.nan,
+            'annual_volatility': np.nan,
+            'sharpe_ratio': 0.0,
+            'max_drawdown': np.nan,
+            'var_95_historical': np.nan,
+            'skewness': np.nan,
+            'kurtosis': np.nan
+        }
+        if n == 0:
+            return metrics
+        
+        mean = a.mean()
+        deviations = a - mean
+        squared = deviations * deviations
+        m2 = squared.sum() / n
+        m3 = (squared * deviations).sum() / n
+        m4 = (squared * squared).sum() / n
+        
+        metrics['annual_return'] = mean * periods
+        if n > 1:
+            metrics['annual_volatility'] = np.sqrt(m2 * n / (n - 1)) * np.sqrt(periods)
+            if metrics['annual_volatility'] > 0:
+                metrics['sharpe_ratio'] = (metrics['annual_return'] - risk_free_rate) / metrics['annual_volatility']
+        
+        # pandas reports zero skew/kurtosis for (numerically) constant series
+        constant = m2 <= 1e-14 * max(mean * mean, 1e-300)
+        if n > 2:
+            metrics['skewness'] = 0.0 if constant else np.sqrt(n * (n - 1)) / (n - 2) * m3 / m2 ** 1.5
+        if n > 3:
+            metrics['kurtosis'] = 0.0 if constant else (
+                (n - 1) / ((n - 2) * (n - 3)) * ((n + 1) * (m4 / (m2 * m2) - 3) + 6)
+            )
+        
+        wealth = np.cumprod(1 + a)
+        metrics['max_drawdown'] = (wealth / np.maximum.accumulate(wealth)).min() - 1
+        metrics['var_95_historical'] = float(_lower_tail_quantiles(raw, [0.05])[0])
+        
+        return metrics
+    
     @staticmethod
     def relative_performance_analysis(portfolio_returns: pd.Series, benchmark_returns: pd.Series) -> Dict:
         """
@@ -467,29 +713,28 @@ class CorrelationAnalysis:
         Returns:
             Dictionary with most and least correlated pairs
         """
-        # Convert correlation matrix to series and remove self-correlations
-        corr_series = correlation_matrix.unstack()
-        corr_series = corr_series[corr_series != 1.0]
-        
-        # Remove duplicate pairs
-        unique_pairs = []
-        seen_pairs = set()
-        
-        for (asset1, asset2), corr in corr_series.items():
-            pair = tuple(sorted([asset1, asset2]))
-            if pair not in seen_pairs:
-                unique_pairs.append({
-                    'asset1': asset1,
-                    'asset2': asset2,
-                    'correlation': corr
-                })
-                seen_pairs.add(pair)
-        
-        # Sort by correlation
-        unique_pairs.sort(key=lambda x: abs(x['correlation']), reverse=True)
-        
-        most_correlated = unique_pairs[:n_pairs]
-        least_correlated = unique_pairs[-n_pairs:]
+        # Each pair appears once in the upper triangle; drop self-correlations
+        corr = correlation_matrix.to_numpy()
+        rows, cols = np.triu_indices(corr.shape[0], k=1)
+        values = corr[rows, cols]
+        keep = values != 1.0
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+        
+        # Sort by absolute correlation, strongest first (ties keep matrix order)
+        order = np.argsort(-np.abs(values), kind='stable')
+        
+        def pairs(positions) -> list:
+            return [
+                {
+                    'asset1': correlation_matrix.index[rows[k]],
+                    'asset2': correlation_matrix.columns[cols[k]],
+                    'correlation': values[k]
+                }
+                for k in positions
+            ]
+        
+        most_correlated = pairs(order[:n_pairs])
+        least_correlated = pairs(order[-n_pairs:])
         
         return {
             'most_correlated_pairs': most_correlated,
@@ -500,6 +745,26 @@ class CorrelationAnalysis:
     def rolling_correlation(returns1: pd.Series, returns2: pd.Series, window: int = 252) -> pd.Series:
         """Calculate rolling correlation between two return series."""
         return returns1.rolling(window=window).corr(returns2)
+    
+    @staticmethod
+    def rolling_correlation_matrix(returns_df: pd.DataFrame, window: int = 252) -> pd.DataFrame:
+        """
+        Calculate rolling correlation matrices for multiple assets.
+        
+        Returns the same (date, asset) x asset layout as returns_df.rolling(window).corr().
+        With numba installed, all pairs are updated incrementally in one parallel
+        kernel; otherwise pandas computes the pairs.
+        """
+        if _rolling_correlation_matrix is None:
+            return returns_df.rolling(window=window).corr()
+        
+        matrices = _rolling_correlation_matrix(returns_df.to_numpy(dtype=np.float64), window)
+        n_assets = returns_df.shape[1]
+        return pd.DataFrame(
+            matrices.reshape(-1, n_assets),
+            index=pd.MultiIndex.from_product([returns_df.index, returns_df.columns]),
+            columns=returns_df.columns
+        )
 
 
 class VaRCalculator:
@@ -510,9 +775,10 @@ class VaRCalculator:
     @staticmethod
     def historical_var(returns: pd.Series, confidence_levels: list = [0.95, 0.99]) -> Dict[str, float]:
         """Calculate historical VaR for multiple confidence levels."""
+        quantiles = _lower_tail_quantiles(returns, [1 - cl for cl in confidence_levels])
         var_results = {}
-        for confidence_level in confidence_levels:
-            var_results[f'var_{int(confidence_level*100)}'] = np.percentile(returns, (1 - confidence_level) * 100)
+        for confidence_level, quantile in zip(confidence_levels, quantiles):
+            var_results[f'var_{int(confidence_level*100)}'] = float(quantile)
         return var_results
     
     @staticmethod
@@ -531,27 +797,38 @@ class VaRCalculator:
     @staticmethod
     def conditional_var(returns: pd.Series, confidence_levels: list = [0.95, 0.99]) -> Dict[str, float]:
         """Calculate Conditional VaR (Expected Shortfall)."""
+        values = np.asarray(returns, dtype=np.float64)
+        thresholds = _lower_tail_quantiles(values, [1 - cl for cl in confidence_levels])
         cvar_results = {}
-        for confidence_level in confidence_levels:
-            var_threshold = np.percentile(returns, (1 - confidence_level) * 100)
-            tail_losses = returns[returns <= var_threshold]
+        for confidence_level, var_threshold in zip(confidence_levels, thresholds):
+            tail_losses = values[values <= var_threshold]
             cvar_results[f'cvar_{int(confidence_level*100)}'] = tail_losses.mean() if len(tail_losses) > 0 else np.nan
         
         return cvar_results
     
     @staticmethod
     def monte_carlo_var(returns: pd.Series, confidence_levels: list = [0.95, 0.99], 
-                       n_simulations: int = 10000) -> Dict[str, float]:
-        """Calculate Monte Carlo VaR."""
+                       n_simulations: int = 10000, seed: Optional[int] = None) -> Dict[str, float]:
+        """
+        Calculate Monte Carlo VaR.
+        
+        Normal scenarios are drawn from scrambled Sobol points (rounded up to a power of
+        two, as Sobol balance requires) paired with their antithetic mirror images, which
+        gives a much lower-variance quantile estimate than iid draws of the same size.
+        """
         # Fit normal distribution to historical returns
         mean = returns.mean()
         std = returns.std()
         
-        # Generate random scenarios
-        simulated_returns = np.random.normal(mean, std, n_simulations)
+        # Generate quasi-random scenarios and their antithetic counterparts
+        sobol = stats.qmc.Sobol(d=1, scramble=True, seed=seed)
+        points = sobol.random_base2(m=max(int(np.ceil(np.log2(max(n_simulations, 2) / 2))), 0))[:, 0]
+        z = stats.norm.ppf(np.clip(points, 1e-12, 1 - 1e-12))
+        simulated_returns = mean + std * np.concatenate([z, -z])
         
+        quantiles = _lower_tail_quantiles(simulated_returns, [1 - cl for cl in confidence_levels])
         var_results = {}
-        for confidence_level in confidence_levels:
-            var_results[f'var_{int(confidence_level*100)}_mc'] = np.percentile(simulated_returns, (1 - confidence_level) * 100)
+        for confidence_level, quantile in zip(confidence_levels, quantiles):
+            var_results[f'var_{int(confidence_level*100)}_mc'] = float(quantile)
         
         return var_results
@@ -13,6 +13,7 @@ Based on the FINM 250 solution notebooks and industry best practices.
 """
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
@@ -175,14 +176,17 @@ class RollingMetrics:
     def rolling_max_drawdown(self, window: int = 252) -> pd.Series:
         """Calculate rolling maximum drawdown"""
         portfolio_returns = self.returns_data.iloc[:, 0]
-        
-        def rolling_max_dd(x):
-            cum_returns = (1 + x).cumprod()
-            running_max = cum_returns.expanding().max()
-            drawdown = (cum_returns - running_max) / running_max
-            return drawdown.min()
-        
-        return portfolio_returns.rolling(window=window).apply(rolling_max_dd, raw=False)
+        rolling_max_dd = pd.Series(np.nan, index=portfolio_returns.index, dtype=float)
+        if len(portfolio_returns) < window:
+            return rolling_max_dd
+        
+        # Drawdowns are ratios to the running peak, so every window can be read off
+        # one compounded wealth path through a strided view
+        wealth = (1 + portfolio_returns).cumprod().to_numpy(dtype=np.float64)
+        windows = sliding_window_view(wealth, window)
+        running_max = np.maximum.accumulate(windows, axis=1)
+        rolling_max_dd.iloc[window - 1:] = (windows / running_max).min(axis=1) - 1
+        return rolling_max_dd
     
     def rolling_var(self, window: int = 252, confidence: float = 0.05) -> pd.Series:
         """Calculate rolling VaR"""
@@ -192,16 +196,22 @@ class RollingMetrics:
     def rolling_beta(self, benchmark_returns: pd.Series, window: int = 252) -> pd.Series:
         """Calculate rolling beta"""
         portfolio_returns = self.returns_data.iloc[:, 0]
+        rolling_beta = pd.Series(np.nan, index=portfolio_returns.index, dtype=float)
+        if len(portfolio_returns) < max(window, 2):
+            return rolling_beta
         
-        def rolling_beta_calc(x, y):
-            if len(x) < 2 or len(y) < 2:
-                return np.nan
-            return np.cov(x, y)[0, 1] / np.var(y)
-        
-        return portfolio_returns.rolling(window=window).apply(
-            lambda x: rolling_beta_calc(x, benchmark_returns.loc[x.index]), 
-            raw=False
+        x = sliding_window_view(portfolio_returns.to_numpy(dtype=np.float64), window)
+        y = sliding_window_view(
+            benchmark_returns.reindex(portfolio_returns.index).to_numpy(dtype=np.float64), window
         )
+        x_dev = x - x.mean(axis=1, keepdims=True)
+        y_dev = y - y.mean(axis=1, keepdims=True)
+        # Sample covariance over population variance, as np.cov / np.var per window
+        covariance = np.einsum('ij,ij->i', x_dev, y_dev) / (window - 1)
+        variance = np.einsum('ij,ij->i', y_dev, y_dev) / window
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rolling_beta.iloc[window - 1:] = covariance / variance
+        return rolling_beta
 
 
 class BenchmarkComparator:
@@ -309,16 +319,13 @@ class VaRCalculator:
     def var_backtesting(self, confidence: float = 0.05, window: int = 252) -> Dict[str, float]:
         """Perform VaR backtesting"""
         violations = 0
-        total_forecasts = 0
+        total_forecasts = max(len(self.returns) - window, 0)
         
-        for i in range(window, len(self.returns)):
-            historical_data = self.returns.iloc[i-window:i]
-            var_forecast = historical_data.quantile(confidence)
-            actual_return = self.returns.iloc[i]
-            
-            if actual_return <= var_forecast:
-                violations += 1
-            total_forecasts += 1
+        if total_forecasts > 0:
+            # Each day is tested against the quantile of the window just before it
+            returns = self.returns.to_numpy(dtype=np.float64)
+            var_forecasts = np.quantile(sliding_window_view(returns[:-1], window), confidence, axis=1)
+            violations = int(np.count_nonzero(returns[window:] <= var_forecasts))
         
         violation_rate = violations / total_forecasts if total_forecasts > 0 else 0
         expected_rate = confidence
@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.core.database import SessionLocal
 from app.models import Asset
-from app.services.market_data_service import MarketDataService, CacheManager
+from app.services.market_data_service import MarketDataService, CacheManager, close_market_data_resources
 
 logger = structlog.get_logger()
 
@@ -104,6 +104,8 @@ def update_asset_price_data(self, asset_id: int, period: str = "1d") -> Dict[str
                 }
                 
             finally:
+                # Close the HTTP session on the loop that owns it, before the loop goes away
+                loop.run_until_complete(close_market_data_resources())
                 loop.close()
                 
     except Exception as e:
@@ -0,0 +1,29 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Tuple
+
+
+# Portfolios processed at once by fan_out; kept within the connection pool
+MAX_CONCURRENT_PORTFOLIOS = 8
+
+
+async def fan_out(func: Callable[..., Any], calls: List[tuple]) -> Tuple[List[Any], List[Dict]]:
+    """
+    Run func(portfolio_id, *rest) for every argument tuple on worker threads.
+
+    Each call is expected to open its own session, since sessions are not safe
+    to share across threads. Returns (results, errors) with results in call
+    order; per-portfolio failures are collected rather than raised.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PORTFOLIOS)
+
+    async def run_one(args: tuple):
+        async with semaphore:
+            try:
+                return True, await asyncio.to_thread(func, *args)
+            except Exception as e:
+                return False, {'portfolio_id': args[0], 'error': str(e)}
+
+    outcomes = await asyncio.gather(*(run_one(args) for args in calls))
+    results = [value for ok, value in outcomes if ok]
+    errors = [value for ok, value in outcomes if not ok]
+    return results, errors
@@ -0,0 +1,45 @@
+from typing import Dict, List, Optional, Tuple
+from decimal import Decimal
+import threading
+from cachetools import TTLCache
+
+
+class LatestPriceCache:
+    """
+    Process-local TTL cache of latest asset prices keyed by asset_id.
+    
+    Prices are written by the Celery workers, in another process, so nothing here
+    hears about new closes; the TTL is the staleness bound for readers.
+    """
+    
+    def __init__(self, maxsize: int = 10_000, ttl: int = 30):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+    
+    def get_many(self, asset_ids: List[int]) -> Tuple[Dict[int, Optional[Decimal]], List[int]]:
+        """Return cached prices and the asset IDs that still need to be loaded."""
+        cached = {}
+        missing = []
+        with self._lock:
+            for asset_id in asset_ids:
+                if asset_id in self._cache:
+                    cached[asset_id] = self._cache[asset_id]
+                else:
+                    missing.append(asset_id)
+        return cached, missing
+    
+    def set_many(self, prices: Dict[int, Optional[Decimal]]):
+        """Store prices; None marks assets known to have no price data."""
+        with self._lock:
+            self._cache.update(prices)
+    
+    def invalidate(self, asset_id: Optional[int] = None):
+        """Drop one asset's cached price, or the whole cache when no ID is given."""
+        with self._lock:
+            if asset_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(asset_id, None)
+
+
+price_cache = LatestPriceCache()
@@ -0,0 +1,45 @@
+"""
+Tests for the Import Service
+
+Covers CSV parsing on both sides of the pyarrow size threshold, so large
+payloads parse into the same rows as the stdlib reader.
+"""
+
+import pytest
+
+from app.services import import_service
+from app.services.import_service import ImportService
+
+
+@pytest.fixture
+def service():
+    """Create an import service; parsing never touches the session"""
+    return ImportService(None)
+
+
+def _holdings_csv(rows):
+    """Build a holdings CSV with the given data lines after the header"""
+    return "Symbol,Quantity,Price\n" + "\n".join(rows) + "\n"
+
+
+class TestParseCsvData:
+    """Test suite for ImportService._parse_csv_data"""
+
+    @pytest.mark.skipif(import_service.pacsv is None, reason="pyarrow not installed")
+    def test_large_payload_matches_stdlib_reader(self, service, monkeypatch):
+        """Test that the pyarrow path yields the same rows as csv.DictReader"""
+        csv_data = _holdings_csv([f"S{i}, {i + 1} ,10.5" for i in range(2000)])
+        stdlib_rows = service._parse_csv_data(csv_data)
+
+        monkeypatch.setattr(import_service, "_ARROW_PARSE_THRESHOLD", 0)
+        assert service._parse_csv_data(csv_data) == stdlib_rows
+
+    def test_ragged_row_over_threshold_is_reported_by_validation(self, service, monkeypatch):
+        """Test that a short row in a large payload reaches validation instead of failing the parse"""
+        csv_data = _holdings_csv(["AAA,10,10.5", "BBB,5", "CCC,1,2"])
+        monkeypatch.setattr(import_service, "_ARROW_PARSE_THRESHOLD", 0)
+
+        rows = service._parse_csv_data(csv_data)
+
+        assert rows[1] == {'symbol': 'BBB', 'quantity': '5', 'price': ''}
+        assert service._validate_holdings_data(rows) == ["Row 2: Missing price"]
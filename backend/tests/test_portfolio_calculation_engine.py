@@ -0,0 +1,227 @@
+"""
+Tests for the Portfolio Calculation Engine
+
+Covers value calculation against an in-memory database, including how
+many writes a recalculation emits.
+"""
+
+import asyncio
+import pytest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models import Base, Asset, Portfolio, PortfolioHistory, PortfolioHolding, PriceData
+from app.models.asset import AssetType
+from app.models.portfolio import PortfolioType
+from app.services.portfolio_calculation_engine import PortfolioCalculationEngine
+from app.utils.price_cache import price_cache
+
+
+@pytest.fixture
+def db_engine():
+    """Create an in-memory SQLite engine with all tables"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    price_cache.invalidate()
+    yield engine
+    price_cache.invalidate()
+    engine.dispose()
+
+
+@pytest.fixture
+def db(db_engine):
+    """Create a session with a portfolio of three priced holdings"""
+    session = sessionmaker(bind=db_engine, autoflush=False)()
+
+    portfolio = Portfolio(
+        name="Test Portfolio",
+        portfolio_type=PortfolioType.PERSONAL,
+        user_id=1,
+        initial_value=Decimal("1000"),
+        current_value=Decimal("0"),
+        total_return=Decimal("0"),
+        total_return_percentage=Decimal("0")
+    )
+    session.add(portfolio)
+
+    for i, symbol in enumerate(["AAA", "BBB", "CCC"]):
+        asset = Asset(symbol=symbol, name=f"{symbol} Corp", asset_type=AssetType.STOCK, sector="Technology")
+        session.add(asset)
+        session.flush()
+
+        session.add(PortfolioHolding(
+            portfolio_id=portfolio.id,
+            asset_id=asset.id,
+            quantity=Decimal("10"),
+            average_cost=Decimal("10"),
+            current_price=Decimal("10"),
+            market_value=Decimal("100"),
+            unrealized_gain_loss=Decimal("0"),
+            unrealized_gain_loss_percentage=Decimal("0")
+        ))
+
+        for day in range(2):
+            session.add(PriceData(
+                asset_id=asset.id,
+                date=datetime(2024, 1, 1) + timedelta(days=day),
+                open_price=Decimal("1"),
+                high_price=Decimal("1"),
+                low_price=Decimal("1"),
+                close_price=Decimal(20 + i + day)
+            ))
+
+    session.commit()
+    yield session
+    session.close()
+
+
+class TestCalculatePortfolioValues:
+    """Test suite for PortfolioCalculationEngine.calculate_portfolio_values"""
+
+    def test_values_use_latest_prices(self, db):
+        """Test that holdings are valued at each asset's most recent close"""
+        result = asyncio.run(PortfolioCalculationEngine(db).calculate_portfolio_values(1))
+
+        assert result['holdings_count'] == 3
+        assert [h['current_price'] for h in result['holdings']] == [Decimal("21"), Decimal("22"), Decimal("23")]
+        assert result['current_value'] == Decimal("660")
+        assert result['total_return'] == Decimal("-340")
+
+    def test_single_flush_and_batched_holding_update(self, db, db_engine):
+        """Test that a recalculation writes holdings in one batch and flushes once"""
+        flushes = []
+        holding_updates = []
+
+        event.listen(db, "after_flush", lambda session, context: flushes.append(1))
+
+        def count_updates(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("UPDATE portfolio_holdings"):
+                holding_updates.append(executemany)
+
+        event.listen(db_engine, "before_cursor_execute", count_updates)
+        try:
+            asyncio.run(PortfolioCalculationEngine(db).calculate_portfolio_values(1))
+        finally:
+            event.remove(db_engine, "before_cursor_execute", count_updates)
+
+        assert len(flushes) == 1
+        assert holding_updates == [True]
+
+        market_values = [h.market_value for h in db.query(PortfolioHolding).order_by(PortfolioHolding.id)]
+        assert market_values == [Decimal("210"), Decimal("220"), Decimal("230")]
+
+    def test_persist_false_leaves_rows_untouched(self, db):
+        """Test that read-only calculations do not write holdings or portfolio totals"""
+        result = asyncio.run(
+            PortfolioCalculationEngine(db).calculate_portfolio_values(1, persist=False)
+        )
+
+        assert result['current_value'] == Decimal("660")
+        assert db.get(Portfolio, 1).current_value == Decimal("0")
+        assert all(h.market_value == Decimal("100") for h in db.query(PortfolioHolding))
+
+
+class TestComputeMany:
+    """Test suite for PortfolioCalculationEngine.compute_many"""
+
+    def test_batch_matches_single_calculation(self, db):
+        """Test that batched results match the per-portfolio calculation and skip unknown IDs"""
+        engine = PortfolioCalculationEngine(db)
+        single = asyncio.run(engine.calculate_portfolio_values(1, persist=False))
+        batch, errors = asyncio.run(engine.compute_many([1, 999], persist=False))
+
+        assert list(batch) == [1]
+        assert errors == []
+        assert batch[1]['current_value'] == single['current_value']
+        assert batch[1]['holdings'] == single['holdings']
+
+
+class TestCalculateAllPortfolios:
+    """Test suite for PortfolioCalculationEngine.calculate_all_portfolios"""
+
+    def test_failing_portfolio_does_not_block_the_rest(self, db, monkeypatch):
+        """Test that one portfolio's failure is skipped while the others are still persisted"""
+        db.add(Portfolio(
+            name="Broken Portfolio",
+            portfolio_type=PortfolioType.PERSONAL,
+            user_id=1,
+            initial_value=Decimal("500")
+        ))
+        db.commit()
+
+        engine = PortfolioCalculationEngine(db)
+        build = engine._build_portfolio_result
+
+        def failing_build(portfolio, holdings, price_map):
+            if portfolio.id == 2:
+                raise ValueError("bad holding")
+            return build(portfolio, holdings, price_map)
+
+        monkeypatch.setattr(engine, "_build_portfolio_result", failing_build)
+        results = asyncio.run(engine.calculate_all_portfolios())
+
+        assert [r['portfolio_id'] for r in results] == [1]
+        assert db.get(Portfolio, 1).current_value == Decimal("660")
+
+
+class TestGetPortfolioHistory:
+    """Test suite for PortfolioCalculationEngine.get_portfolio_history"""
+
+    def test_stored_rows_override_only_their_own_dates(self, db):
+        """Test that a stored snapshot replaces its day while other days are rebuilt from prices"""
+        stored_day = date.today() - timedelta(days=2)
+        db.add(PortfolioHistory(
+            portfolio_id=1,
+            date=stored_day,
+            value=Decimal("700"),
+            return_amount=Decimal("-300"),
+            return_percentage=Decimal("-30")
+        ))
+        db.commit()
+
+        history = asyncio.run(PortfolioCalculationEngine(db).get_portfolio_history(1, days=5))
+
+        assert [point['date'] for point in history] == [
+            date.today() - timedelta(days=offset) for offset in range(5, 0, -1)
+        ]
+        by_date = {point['date']: point for point in history}
+        assert by_date[stored_day]['value'] == Decimal("700")
+        assert by_date[stored_day]['return'] == Decimal("-30")
+        assert all(
+            point['value'] == Decimal("660") for day, point in by_date.items() if day != stored_day
+        )
+
+    def test_fully_stored_window_skips_the_rebuild(self, db, db_engine):
+        """Test that stored days are served without touching prices and today's row stays out"""
+        today = date.today()
+        for offset in range(4):
+            db.add(PortfolioHistory(
+                portfolio_id=1,
+                date=today - timedelta(days=offset),
+                value=Decimal(700 + offset),
+                return_amount=Decimal("0"),
+                return_percentage=Decimal("0")
+            ))
+        db.commit()
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db_engine, "before_cursor_execute", record)
+        try:
+            history = asyncio.run(PortfolioCalculationEngine(db).get_portfolio_history(1, days=3))
+        finally:
+            event.remove(db_engine, "before_cursor_execute", record)
+
+        assert [point['date'] for point in history] == [today - timedelta(days=offset) for offset in (3, 2, 1)]
+        assert [point['value'] for point in history] == [Decimal("703"), Decimal("702"), Decimal("701")]
+        assert len(statements) == 1
@@ -0,0 +1,128 @@
+"""
+Tests for the Portfolio History Service
+
+Covers the performance metrics kernels against a straightforward NumPy
+reference, and snapshot inserts against an in-memory database.
+"""
+
+import asyncio
+import numpy as np
+import pytest
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models import Base, Portfolio, PortfolioHistory
+from app.models.portfolio import PortfolioType
+from app.services.portfolio_history_service import (
+    PortfolioHistoryService, _metrics_loop, _metrics_numpy
+)
+
+
+@pytest.fixture
+def db():
+    """Create an in-memory SQLite session with all tables"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _reference_metrics(values):
+    """Multi-pass reference: returns, population std, Sharpe and peak drawdown."""
+    prev, curr = values[:-1], values[1:]
+    returns = (curr - prev)[prev > 0] / prev[prev > 0]
+    total_return = (values[-1] - values[0]) / values[0] if values[0] > 0 else 0.0
+    volatility = returns.std() if returns.size else 0.0
+    sharpe = returns.mean() / volatility if volatility > 0 else 0.0
+    peaks = np.maximum.accumulate(values)
+    drawdowns = np.divide(peaks - values, peaks, out=np.zeros_like(values), where=peaks > 0)
+    return total_return, volatility, sharpe, drawdowns.max(), float(returns.size)
+
+
+class TestMetricsKernel:
+    """Test suite for the performance metrics kernels"""
+
+    @pytest.mark.parametrize("kernel", [_metrics_loop, _metrics_numpy])
+    @pytest.mark.parametrize("values", [
+        [100, 105, 98, 110, 90, 120.5],
+        [100, 0, 50, 75],
+        [50, 50, 50],
+        list(100 + np.cumsum(np.random.default_rng(0).normal(0, 1, 250)))
+    ])
+    def test_matches_reference(self, kernel, values):
+        """Test that both kernels agree with the multi-pass reference"""
+        values = np.array(values, dtype=np.float64)
+
+        assert np.allclose(kernel(values), _reference_metrics(values))
+
+
+class TestInsertSnapshots:
+    """Test suite for PortfolioHistoryService._insert_snapshots"""
+
+    def test_existing_day_is_skipped(self, db):
+        """Test that a second snapshot for the same portfolio and date is ignored, not raised"""
+        service = PortfolioHistoryService(db)
+        values = {
+            'current_value': Decimal("100"),
+            'total_return': Decimal("0"),
+            'total_return_percentage': Decimal("0"),
+            'holdings_count': 1
+        }
+        snapshots = [
+            service._build_snapshot(portfolio_id, date(2024, 1, 1), values)
+            for portfolio_id in (1, 2)
+        ]
+
+        assert service._insert_snapshots(snapshots[:1]) == {1}
+        assert service._insert_snapshots(snapshots) == {2}
+        db.commit()
+        assert db.query(PortfolioHistory).count() == 2
+
+
+class TestRecordAllPortfoliosSnapshot:
+    """Test suite for PortfolioHistoryService.record_all_portfolios_snapshot"""
+
+    def test_concurrently_written_snapshot_is_reported_as_existing(self, db, monkeypatch):
+        """Test that a row skipped by the conflict-ignoring insert is still accounted for"""
+        db.add(Portfolio(
+            name="Test Portfolio",
+            portfolio_type=PortfolioType.PERSONAL,
+            user_id=1,
+            initial_value=Decimal("100")
+        ))
+        db.commit()
+
+        snapshot_date = date(2024, 1, 1)
+        service = PortfolioHistoryService(db)
+        service._value_cache[(1, snapshot_date)] = {
+            'current_value': Decimal("100"),
+            'total_return': Decimal("0"),
+            'total_return_percentage': Decimal("0"),
+            'holdings_count': 1
+        }
+        insert_snapshots = service._insert_snapshots
+
+        def racing_insert(snapshots):
+            # Another job records the same day between the lookup and the insert
+            insert_snapshots([dict(snapshots[0], value=Decimal("90.00"))])
+            return insert_snapshots(snapshots)
+
+        monkeypatch.setattr(service, "_insert_snapshots", racing_insert)
+        result = asyncio.run(service.record_all_portfolios_snapshot(snapshot_date))
+
+        assert result['successful_snapshots'] + result['errors'] == result['total_portfolios'] == 1
+        assert result['results'] == [{
+            'portfolio_id': 1,
+            'date': snapshot_date,
+            'value': Decimal("90.00"),
+            'status': 'already_exists'
+        }]
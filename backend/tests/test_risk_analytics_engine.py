@@ -0,0 +1,128 @@
+"""
+Tests for the Risk Analytics Engine
+
+Checks the vectorized rolling and tail-risk calculations against
+straightforward per-window reference computations.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.risk_analytics_engine import (
+    BenchmarkComparison, CorrelationAnalysis, RiskMetrics, RollingMetrics
+)
+
+
+@pytest.fixture
+def market_returns():
+    """Create correlated portfolio and benchmark daily returns"""
+    rng = np.random.default_rng(7)
+    dates = pd.date_range('2020-01-01', periods=400, freq='D')
+    benchmark = pd.Series(rng.normal(0.0005, 0.01, len(dates)), index=dates)
+    returns = 1.2 * benchmark + pd.Series(rng.normal(0, 0.005, len(dates)), index=dates)
+    return returns, benchmark
+
+
+class TestRollingMetrics:
+    """Test suite for the engine's RollingMetrics"""
+
+    def test_rolling_beta_matches_window_regression(self, market_returns):
+        """Test that rolling beta equals the OLS slope of each trailing window"""
+        returns, benchmark = market_returns
+        window = 60
+
+        beta = RollingMetrics.rolling_beta(returns, benchmark, window)
+
+        assert beta.iloc[:window - 1].isna().all()
+        for end in (window, 200, len(returns)):
+            x = benchmark.iloc[end - window:end]
+            y = returns.iloc[end - window:end]
+            assert beta.iloc[end - 1] == pytest.approx(np.polyfit(x, y, 1)[0], rel=1e-9)
+
+    def test_rolling_sharpe_ratio_matches_pandas(self, market_returns):
+        """Test that the single-pass rolling Sharpe ratio matches pandas rolling moments"""
+        returns, _ = market_returns
+        returns = returns.copy()
+        returns.iloc[100] = np.nan
+        window = 60
+
+        sharpe = RollingMetrics.rolling_sharpe_ratio(returns, window)
+        expected = (
+            (returns.rolling(window).mean() * 252 - 0.02)
+            / (returns.rolling(window).std() * np.sqrt(252))
+        )
+
+        pd.testing.assert_series_equal(sharpe, expected, rtol=1e-9)
+
+    def test_rolling_max_drawdown_matches_window_drawdowns(self, market_returns):
+        """Test that each value is the max drawdown of the trailing window's own wealth path"""
+        returns, _ = market_returns
+        window = 60
+
+        rolling_dd = RollingMetrics.rolling_max_drawdown(returns, window)
+
+        assert rolling_dd.iloc[:window - 1].isna().all()
+        for end in (window, 250, len(returns)):
+            wealth = (1 + returns.iloc[end - window:end]).cumprod()
+            expected = (wealth / wealth.cummax() - 1).min()
+            assert rolling_dd.iloc[end - 1] == pytest.approx(expected, abs=1e-12)
+
+    def test_rolling_max_drawdown_skips_missing_returns(self, market_returns):
+        """Test that NaN returns, such as a pct_change series' first row, do not blank whole windows"""
+        returns, _ = market_returns
+        returns = returns.copy()
+        returns.iloc[[0, 150]] = np.nan
+        window = 20
+
+        rolling_dd = RollingMetrics.rolling_max_drawdown(returns, window)
+
+        assert rolling_dd.notna().sum() == len(returns) - window + 1
+        for end in (window, 160, len(returns)):
+            wealth = (1 + returns.iloc[end - window:end]).cumprod()
+            expected = (wealth / wealth.cummax() - 1).min()
+            assert rolling_dd.iloc[end - 1] == pytest.approx(expected, abs=1e-12)
+
+
+class TestBenchmarkComparison:
+    """Test suite for the engine's BenchmarkComparison"""
+
+    def test_summary_matches_risk_metrics(self, market_returns):
+        """Test that the fused summary reproduces the RiskMetrics definitions"""
+        returns, _ = market_returns
+
+        summary = BenchmarkComparison._summarize(returns)
+        expected = RiskMetrics.calculate_return_metrics(returns)
+        expected.update(RiskMetrics.calculate_risk_metrics(returns))
+
+        for metric, value in summary.items():
+            assert value == pytest.approx(expected[metric], rel=1e-10), metric
+
+
+class TestCorrelationAnalysis:
+    """Test suite for the engine's CorrelationAnalysis"""
+
+    def test_rolling_correlation_matrix_matches_pandas(self, market_returns):
+        """Test that rolling correlation matrices match pandas, including NaN gaps"""
+        returns, benchmark = market_returns
+        returns_df = pd.DataFrame({'Portfolio': returns, 'Benchmark': benchmark, 'Spread': returns - benchmark})
+        returns_df.iloc[150, 2] = np.nan
+
+        result = CorrelationAnalysis.rolling_correlation_matrix(returns_df, window=60)
+        expected = returns_df.rolling(window=60).corr()
+
+        assert result.index.equals(expected.index)
+        np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), atol=1e-10)
+
+    def test_rolling_correlation_matrix_is_stable_on_levels(self, market_returns):
+        """Test that price-like levels with tiny variation match each window's own correlation"""
+        returns, benchmark = market_returns
+        levels_df = pd.DataFrame({'Portfolio': 100 + returns, 'Benchmark': 100 + benchmark})
+        window = 60
+
+        result = CorrelationAnalysis.rolling_correlation_matrix(levels_df, window=window)
+
+        for end in (window, 200, len(levels_df)):
+            expected = np.corrcoef(levels_df.iloc[end - window:end].to_numpy().T)
+            actual = result.loc[levels_df.index[end - 1]].to_numpy()
+            np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-10)